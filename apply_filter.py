@@ -1,9 +1,8 @@
 import os
+import argparse
 import numpy as np
 import shutil
 import spectral
-from tkinter import filedialog, Tk
-from scipy.interpolate import interp1d
 
 def load_transmission_data(file_path):
     """Load transmission data for AMP and neural glasses from an Excel file."""
@@ -14,8 +13,18 @@ def load_transmission_data(file_path):
     neural_transmission = df['Neutral density filters'].values
     return wavelengths, amp_transmission, neural_transmission
 
+def load_transmission_curve(file_path):
+    """Load a two-column (wavelength, transmission) curve such as tools/filters/amp.txt."""
+    data = np.loadtxt(file_path)
+    return data[:, 0], data[:, 1]
+
+def save_transmission_curve(file_path, wavelengths, transmission):
+    """Save a transmission curve in the tab-separated tools/filters/*.txt format."""
+    np.savetxt(file_path, np.column_stack([wavelengths, transmission]), fmt=['%g', '%.6f'], delimiter='\t')
+
 def match_transmission_to_cube(cube_wavelengths, transmission_wavelengths, transmission_values):
     """Interpolate transmission values to match cube wavelengths."""
+    from scipy.interpolate import interp1d
     interpolation_func = interp1d(transmission_wavelengths, transmission_values, kind='linear', fill_value="extrapolate")
     return interpolation_func(cube_wavelengths)
 
@@ -25,8 +34,17 @@ def apply_transmission(cube, transmission):
         cube[:, :, i] *= transmission[i]
     return cube
 
-def process_scene(scene_folder, amp_transmission, neural_transmission, cube_wavelengths):
-    """Process hyperspectral cubes within a given scene folder."""
+def process_scene(scene_folder, amp_transmission, neural_transmission, cube_wavelengths, policy=None, fields=None):
+    """
+    Process hyperspectral cubes within a given scene folder.
+    Filtered cubes are stored in the dtype of the precision policy (float32 by default); policies
+    storing float16, which ENVI cannot hold, are refused before any cube is read.
+    fields: Optional {label: transmission_field.TransmissionField}; each is applied tile by
+            tile into <scene>/<label>/.
+    """
+    from precision import check_envi_storage, get_policy, load_cube, save_cube
+    policy = get_policy(policy)
+    check_envi_storage(policy.storage)
     input_original_folder = os.path.join(scene_folder, "original")
     output_amp_folder = os.path.join(scene_folder, "DBAMP")
     output_neural_folder = os.path.join(scene_folder, "DBN")
@@ -41,7 +59,7 @@ def process_scene(scene_folder, amp_transmission, neural_transmission, cube_wave
             print(f"Processing: {hdr_path}")
 
             # Load hyperspectral cube
-            cube = spectral.open_image(hdr_path).load()
+            cube = load_cube(hdr_path, policy.compute)
             cube_metadata = spectral.open_image(hdr_path).metadata
             hdr_wavelengths = np.array([float(w) for w in cube_metadata['wavelength']])
 
@@ -52,7 +70,7 @@ def process_scene(scene_folder, amp_transmission, neural_transmission, cube_wave
             # Apply AMP transmission
             amp_cube = apply_transmission(cube.copy(), amp_transmission_matched)
             amp_hdr_path = os.path.join(output_amp_folder, file_name)
-            spectral.envi.save_image(amp_hdr_path, amp_cube, dtype=np.float32, metadata=cube_metadata)
+            save_cube(amp_hdr_path, amp_cube, cube_metadata, policy, force=False)
 
             # Copy associated raw file
             amp_raw_path = amp_hdr_path.replace(".hdr", ".raw")
@@ -62,16 +80,36 @@ def process_scene(scene_folder, amp_transmission, neural_transmission, cube_wave
             # Apply Neural transmission
             neural_cube = apply_transmission(cube.copy(), neural_transmission_matched)
             neural_hdr_path = os.path.join(output_neural_folder, file_name)
-            spectral.envi.save_image(neural_hdr_path, neural_cube, dtype=np.float32, metadata=cube_metadata)
+            save_cube(neural_hdr_path, neural_cube, cube_metadata, policy, force=False)
 
             # Copy associated raw file
             neural_raw_path = neural_hdr_path.replace(".hdr", ".raw")
             if os.path.exists(raw_path):
                 shutil.copy(raw_path, neural_raw_path)
 
+            # Spatially varying filters stream from the source cube without loading it whole
+            for label, field in (fields or {}).items():
+                from transmission_field import filter_envi_cube
+                output_folder = os.path.join(scene_folder, label)
+                os.makedirs(output_folder, exist_ok=True)
+                filter_envi_cube(hdr_path, os.path.join(output_folder, file_name), field, policy=policy)
+
             print(f"Saved processed AMP and Neural cubes for {file_name}")
 
 def main():
+    from precision import ENVI_POLICIES
+    parser = argparse.ArgumentParser(description="Apply the AMP and neutral density filters to every scene cube.")
+    parser.add_argument("--precision", default="default", choices=ENVI_POLICIES,
+                        help="Precision policy: storage dtype of the filtered cubes and compute dtype")
+    parser.add_argument("--field", action="append", default=[], metavar="[LABEL=]SPEC.json",
+                        help="Transmission field spec also applied to every cube, written to <scene>/<LABEL>/ "
+                             "(default label: the spec's file name; repeatable)")
+    args = parser.parse_args()
+
+    from transmission_field import load_fields
+    fields = load_fields(args.field)
+
+    from tkinter import filedialog, Tk
     Tk().withdraw()  # Hide the root Tkinter window
 
     # Load transmission data
@@ -88,7 +126,7 @@ def main():
     scene_folders = ["Old-Snow-Scenarios", "Tarmac", "Trails"]
     for scene in scene_folders:
         scene_folder = os.path.join(base_folder, scene)
-        process_scene(scene_folder, amp_transmission, neural_transmission, wavelengths)
+        process_scene(scene_folder, amp_transmission, neural_transmission, wavelengths, args.precision, fields)
 
     print("Processing completed. Output saved in DBAMP and DBN folders for each scene.")
 
@@ -1,9 +1,6 @@
 import os
+import argparse
 import numpy as np
-import shutil
-from tkinter import filedialog, Tk
-from scipy.interpolate import interp1d
-import h5py
 
 def load_transmission_data(file_path):
     """Load transmission data for AMP and neural glasses from an Excel file."""
@@ -16,17 +13,25 @@ def load_transmission_data(file_path):
 
 def match_transmission_to_cube(cube_wavelengths, transmission_wavelengths, transmission_values):
     """Interpolate transmission values to match cube wavelengths."""
+    from scipy.interpolate import interp1d
     interpolation_func = interp1d(transmission_wavelengths, transmission_values, kind='linear', fill_value="extrapolate")
     return interpolation_func(cube_wavelengths)
 
 def apply_transmission(cube, transmission):
     """Apply transmission values to the hyperspectral cube."""
-    for i in range(cube.shape[0]):
+    for i in range(cube.shape[2]):
         cube[:, :, i] *= transmission[i]
     return cube
 
-def process_scene(scene_folder, amp_transmission, neural_transmission, cube_wavelengths):
-    """Process hyperspectral cubes within a given scene folder."""
+def process_scene(scene_folder, amp_transmission, neural_transmission, cube_wavelengths, policy=None, fields=None):
+    """
+    Process hyperspectral cubes within a given scene folder.
+    Filtered cubes are stored in the dtype of the precision policy (float32 by default).
+    fields: Optional {label: transmission_field.TransmissionField}; each is applied tile by
+            tile into <scene>/<label>/.
+    """
+    from precision import get_policy, load_hdf5_cube, save_hdf5_cube
+    policy = get_policy(policy)
     input_original_folder = os.path.join(scene_folder, "Original images")
     output_amp_folder = os.path.join(scene_folder, "DBAMP")
     output_neural_folder = os.path.join(scene_folder, "DBN")
@@ -40,7 +45,7 @@ def process_scene(scene_folder, amp_transmission, neural_transmission, cube_wave
             print(f"Processing: {mat_path}")
 
             # Load hyperspectral cube
-            cube = h5py.File(mat_path, 'r')['hsi'][:]
+            cube = load_hdf5_cube(mat_path, policy.compute)
             wavelengths = np.linspace(410, 1000, 160)
 
             # Match transmission to cube wavelengths
@@ -49,18 +54,36 @@ def process_scene(scene_folder, amp_transmission, neural_transmission, cube_wave
             # Apply AMP transmission
             amp_cube = apply_transmission(cube.copy(), amp_transmission_matched)
             amp_mat_path = os.path.join(output_amp_folder, file_name)
-            with h5py.File(amp_mat_path, 'w') as file:
-                file.create_dataset('hsi', data=amp_cube)
+            save_hdf5_cube(amp_mat_path, amp_cube, policy)
 
             # Apply Neural transmission
             neural_cube = apply_transmission(cube.copy(), neural_transmission_matched)
             neural_mat_path = os.path.join(output_neural_folder, file_name)
-            with h5py.File(neural_mat_path, 'w') as file:
-                file.create_dataset('hsi', data=neural_cube)
+            save_hdf5_cube(neural_mat_path, neural_cube, policy)
+
+            # Spatially varying filters stream from the source file without loading it whole
+            for label, field in (fields or {}).items():
+                from transmission_field import filter_sidq_cube
+                output_folder = os.path.join(scene_folder, label)
+                os.makedirs(output_folder, exist_ok=True)
+                filter_sidq_cube(mat_path, os.path.join(output_folder, file_name), field, wavelengths, policy=policy)
 
             print(f"Saved processed AMP and Neural cubes for {file_name}")
 
 def main():
+    from precision import POLICIES
+    parser = argparse.ArgumentParser(description="Apply the AMP and neutral density filters to every scene cube.")
+    parser.add_argument("--precision", default="default", choices=sorted(POLICIES),
+                        help="Precision policy: storage dtype of the filtered cubes and compute dtype")
+    parser.add_argument("--field", action="append", default=[], metavar="[LABEL=]SPEC.json",
+                        help="Transmission field spec also applied to every cube, written to <folder>/<LABEL>/ "
+                             "(default label: the spec's file name; repeatable)")
+    args = parser.parse_args()
+
+    from transmission_field import load_fields
+    fields = load_fields(args.field)
+
+    from tkinter import filedialog, Tk
     Tk().withdraw()  # Hide the root Tkinter window
 
     # Load transmission data
@@ -73,7 +96,7 @@ def main():
         print("No folder selected. Exiting.")
         return
 
-    process_scene(base_folder, amp_transmission, neural_transmission, wavelengths)
+    process_scene(base_folder, amp_transmission, neural_transmission, wavelengths, args.precision, fields)
 
     print("Processing completed. Output saved in DBAMP and DBN folders for each scene.")
 
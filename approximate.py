@@ -0,0 +1,363 @@
+import os
+import csv
+import time
+import argparse
+from statistics import NormalDist
+import numpy as np
+
+import freqfilters
+
+BOUND_KINDS = ("interval", "lower_bound", "upper_bound", "exact")
+
+class BlockSampler:
+    """
+    Stratified sampling of blocks of a plane, without replacement.
+    The plane is cut into blocks of about block x block pixels, and the block grid into
+    strata x strata strata. Every stratum contributes the same number of blocks per round
+    (capped at its size); each stratum's blocks are visited in a fixed random order, so
+    refining only adds blocks.
+    """
+
+    def __init__(self, shape, block=16, strata=8, seed=0):
+        self.shape = shape
+        self.row_edges = np.linspace(0, shape[0], max(1, round(shape[0] / block)) + 1).astype(int)
+        self.col_edges = np.linspace(0, shape[1], max(1, round(shape[1] / block)) + 1).astype(int)
+        rows, cols = len(self.row_edges) - 1, len(self.col_edges) - 1
+        block_rows, block_cols = np.meshgrid(np.arange(rows), np.arange(cols), indexing="ij")
+        stratum = ((block_rows * min(strata, rows) // rows) * min(strata, cols)
+                   + block_cols * min(strata, cols) // cols).ravel()
+        rng = np.random.default_rng(seed)
+        self.order = [rng.permutation(np.flatnonzero(stratum == h)) for h in range(stratum.max() + 1)]
+        self.order = [blocks for blocks in self.order if len(blocks)]
+        self.counts = np.array([len(blocks) for blocks in self.order])
+        self.taken = np.zeros(len(self.order), dtype=int)
+        self.cols = cols
+
+    @property
+    def fraction(self):
+        """Share of the plane's blocks sampled so far."""
+        return self.taken.sum() / self.counts.sum()
+
+    def capped(self, per_stratum, max_fraction):
+        """
+        The largest per-stratum count up to per_stratum whose sample stays within max_fraction
+        of the blocks (at least one block per stratum).
+        """
+        budget = max_fraction * self.counts.sum()
+        while per_stratum > 1 and np.minimum(per_stratum, self.counts).sum() > budget:
+            per_stratum -= 1
+        return per_stratum
+
+    def refine(self, per_stratum, max_fraction):
+        """
+        Per-stratum count of the next round (double the current one, capped to max_fraction),
+        or None when the cap or the whole plane is reached and no round can add blocks.
+        """
+        per_stratum = self.capped(2 * per_stratum, max_fraction)
+        if np.minimum(per_stratum, self.counts).sum() <= self.taken.sum():
+            return None
+        return per_stratum
+
+    def take(self, per_stratum):
+        """
+        Extend the sample to per_stratum blocks in every stratum.
+        Returns:
+            strata: Stratum of each newly sampled block.
+            boxes: (N x 4) array of (row0, row1, col0, col1) of the new blocks.
+        """
+        strata, indices = [], []
+        for h, blocks in enumerate(self.order):
+            target = min(per_stratum, len(blocks))
+            indices.append(blocks[self.taken[h]:target])
+            strata += [h] * len(indices[-1])
+            self.taken[h] = max(self.taken[h], target)
+        r, c = np.divmod(np.concatenate(indices).astype(int), self.cols)
+        boxes = np.stack([self.row_edges[r], self.row_edges[r + 1], self.col_edges[c], self.col_edges[c + 1]], axis=1)
+        return np.array(strata, dtype=int), boxes
+
+def gather_blocks(plane, boxes):
+    """Blocks of a plane grouped by size: {(height, width): (block indices, stacked blocks)}."""
+    sizes = np.stack([boxes[:, 1] - boxes[:, 0], boxes[:, 3] - boxes[:, 2]], axis=1)
+    groups = {}
+    for size in {tuple(s) for s in sizes}:
+        selected = np.flatnonzero((sizes == size).all(axis=1))
+        rows = boxes[selected, 0][:, None, None] + np.arange(size[0])[None, :, None]
+        cols = boxes[selected, 2][:, None, None] + np.arange(size[1])[None, None, :]
+        groups[size] = (selected, plane[rows, cols])
+    return groups
+
+def stratified_estimate(values, strata, counts, confidence=0.95):
+    """
+    Stratified estimate of a population mean from per-block values, with the half-width of
+    its normal confidence interval (finite-population corrected). A stratum sampled only in part
+    but with fewer than two blocks has no variance estimate, so the half-width is then infinite.
+    Args:
+        values: Values of the sampled blocks.
+        strata: Stratum of each sampled block.
+        counts: Number of blocks in each stratum of the population.
+    Returns:
+        (estimate, half_width)
+    """
+    values, strata = np.asarray(values, dtype=np.float64), np.asarray(strata)
+    n = np.bincount(strata, minlength=len(counts)).astype(np.float64)
+    sums = np.bincount(strata, values, minlength=len(counts))
+    squares = np.bincount(strata, values * values, minlength=len(counts))
+    weights = counts / counts.sum()
+    means = sums / np.maximum(n, 1)
+    variances = np.where(n > 1, (squares - n * means ** 2) / np.maximum(n - 1, 1), 0.0)
+    variance = np.sum(weights ** 2 * (1 - n / counts) * np.maximum(variances, 0) / np.maximum(n, 1))
+    if np.any((n < 2) & (n < counts)):
+        return float(np.sum(weights * means)), np.inf
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    return float(np.sum(weights * means)), float(z * np.sqrt(variance))
+
+def moment_estimates(means, squares, strata, counts, confidence=0.95):
+    """
+    Mean, variance and standard deviation of a plane from per-block means of values and of
+    squared values. The variance interval linearises E[x^2] - E[x]^2 around the estimated mean.
+    Returns:
+        {"mean": (value, half_width), "variance": (...), "std": (...)}
+    """
+    means, squares = np.asarray(means), np.asarray(squares)
+    mean, mean_half = stratified_estimate(means, strata, counts, confidence)
+    second, _ = stratified_estimate(squares, strata, counts, confidence)
+    _, variance_half = stratified_estimate(squares - 2 * mean * means, strata, counts, confidence)
+    variance = max(second - mean ** 2, 0.0)
+    std = np.sqrt(variance)
+    return {"mean": (mean, mean_half), "variance": (variance, variance_half),
+            "std": (float(std), variance_half / (2 * std) if std > 0 else np.inf)}
+
+def row(metric, statistic, value, half_width=None, kind="interval", fraction=1.0, rounds=0):
+    low, high = {"interval": (value - (half_width or 0), value + (half_width or 0)), "exact": (value, value),
+                 "lower_bound": (value, np.inf), "upper_bound": (-np.inf, value)}[kind]
+    return {"metric": metric, "statistic": statistic, "value": float(value), "low": float(low), "high": float(high),
+            "kind": kind, "fraction": float(fraction), "rounds": rounds}
+
+def converged(rows, allowed):
+    """True when every interval in allowed {(metric, statistic): half-width} is at most that wide."""
+    half_widths = {(r["metric"], r["statistic"]): (r["high"] - r["low"]) / 2 for r in rows if r["kind"] == "interval"}
+    return all(half_widths.get(key, 0.0) <= limit for key, limit in allowed.items())
+
+def exact_global(luminance):
+    from measurement import luminance_contrast, GLOBAL_METRICS
+    return [row(metric, "value", value, kind="exact") for metric, value in
+            zip(GLOBAL_METRICS, luminance_contrast(luminance))]
+
+def approximate_global(luminance, tolerance=0.01, confidence=0.95, block=8, strata=8, initial=4,
+                       max_fraction=0.25, seed=0):
+    """
+    Global contrast (measurement.luminance_contrast) from stratified block samples.
+    rms_contrast gets a confidence interval and is refined (the sample doubles per round, capped
+    so it never exceeds max_fraction of the plane) until its half-width is within tolerance
+    (relative); when the cap is reached first, the exact value is computed instead. The
+    extreme-based metrics are reported as lower bounds: a sample's range can only be narrower
+    than the plane's.
+    The exact metrics are a single vectorised pass, so on a plane in memory they are cheaper than
+    gathering the sample; this only pays off when reading pixels dominates (e.g. a memory-mapped
+    plane). evaluate and screen therefore compute global metrics exactly.
+    Returns:
+        Rows (metric, statistic, value, low, high, kind, fraction, rounds).
+    """
+    from measurement import luminance_contrast, GLOBAL_METRICS
+    sampler = BlockSampler(luminance.shape, block, strata, seed)
+    strata_ids, means, squares = [], [], []
+    low, high = np.inf, -np.inf
+    per_stratum, rounds = sampler.capped(initial, max_fraction), 0
+    while True:
+        rounds += 1
+        new_strata, boxes = sampler.take(per_stratum)
+        for selected, blocks in gather_blocks(luminance, boxes).values():
+            values = blocks.astype(np.float64)
+            strata_ids.append(new_strata[selected])
+            means.append(values.mean(axis=(1, 2)))
+            squares.append(np.mean(values * values, axis=(1, 2)))
+            low, high = min(low, values.min()), max(high, values.max())
+        moments = moment_estimates(np.concatenate(means), np.concatenate(squares), np.concatenate(strata_ids),
+                                   sampler.counts, confidence)
+        extremes = luminance_contrast(np.array([low, high]))
+        rows = [row(metric, "value", value, kind="lower_bound", fraction=sampler.fraction, rounds=rounds)
+                for metric, value in zip(GLOBAL_METRICS[:3], extremes[:3])]
+        rows.append(row("rms_contrast", "value", *moments["std"], fraction=sampler.fraction, rounds=rounds))
+        if converged(rows, {("rms_contrast", "value"): tolerance * moments["std"][0]}):
+            return rows
+        per_stratum = sampler.refine(per_stratum, max_fraction)
+        if per_stratum is None:
+            return exact_global(luminance)
+
+def exact_local(luminance, params=None):
+    from paired_eval import local_contrast_maps, summarise_map
+    maps = local_contrast_maps({"plane": luminance}, params)["plane"]
+    return [row(metric, statistic, value, kind="exact")
+            for metric, contrast_map in maps.items() for statistic, value in summarise_map(contrast_map).items()]
+
+def approximate_local(luminance, params=None, tolerance=0.02, confidence=0.95, block=48, strata=4, initial=4,
+                      max_fraction=0.25, targets=None, seed=0):
+    """
+    Local contrast map summaries (paired_eval.summarise_map of every local metric) from
+    stratified block samples.
+    Each sampled block is evaluated with a margin as wide as the FFT padding, cut from the plane
+    after the same symmetric padding the full-resolution maps use, so its maps match those maps.
+    The margin already isolates the block, so its FFT adds no padding of its own. Map mean and variance get
+    confidence intervals, map max is a lower bound and map min an upper bound.
+    Refinement continues until the targets are within tolerance, relative to the larger of
+    |mean| and the map's standard deviation for means (several maps average close to zero)
+    and relative to the value for variances; then, or past max_fraction, as approximate_global.
+    Args:
+        targets: (metric, statistic) pairs that must converge (default: every map mean).
+    Returns:
+        Rows (metric, statistic, value, low, high, kind, fraction, rounds).
+    """
+    from scipy import fft
+    from paired_eval import DEFAULT_PARAMS, local_contrast_maps
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    max_sigma = max(2 * params["peli_sigma"], params["dog_rs"], params["cab_sigma_b"] + params["cab_sigma_i"])
+    margin = freqfilters.pad_plan((1, 1), max_sigma)[0]
+    padded = np.pad(np.asarray(luminance, dtype=np.float32), margin, mode='symmetric')
+    sampler = BlockSampler(luminance.shape, block, strata, seed)
+    strata_ids, stats = [], {}
+    per_stratum, rounds = sampler.capped(initial, max_fraction), 0
+    while True:
+        rounds += 1
+        new_strata, boxes = sampler.take(per_stratum)
+        # Blocks of equal size share one FFT plan; box coordinates index padded with the margin on top
+        patches = {}
+        for i, (r0, r1, c0, c1) in enumerate(boxes):
+            patches.setdefault((r1 - r0, c1 - c0), {})[i] = padded[r0:r1 + 2 * margin, c0:c1 + 2 * margin]
+        maps = {}
+        for (rows, cols), group in patches.items():
+            # The margin isolates the block, so zeros appended up to fast FFT lengths do not reach it
+            plan = (0, tuple(fft.next_fast_len(n + 2 * margin, real=True) for n in (rows, cols)))
+            maps.update(local_contrast_maps(group, params, plan))
+        strata_ids += list(new_strata)
+        for i in range(len(boxes)):
+            for metric, contrast_map in maps[i].items():
+                core = contrast_map[margin:-margin, margin:-margin].astype(np.float64)
+                entry = stats.setdefault(metric, {"mean": [], "square": [], "min": [], "max": []})
+                entry["mean"].append(core.mean())
+                entry["square"].append(np.mean(core * core))
+                entry["min"].append(core.min())
+                entry["max"].append(core.max())
+        rows, allowed = [], {}
+        for metric, entry in stats.items():
+            moments = moment_estimates(entry["mean"], entry["square"], strata_ids, sampler.counts, confidence)
+            common = dict(fraction=sampler.fraction, rounds=rounds)
+            rows += [row(metric, "mean", *moments["mean"], **common),
+                     row(metric, "variance", *moments["variance"], **common),
+                     row(metric, "max", max(entry["max"]), kind="lower_bound", **common),
+                     row(metric, "min", min(entry["min"]), kind="upper_bound", **common)]
+            scales = {"mean": max(abs(moments["mean"][0]), moments["std"][0]), "variance": moments["variance"][0]}
+            for statistic, scale in scales.items():
+                if (targets is None and statistic == "mean") or (metric, statistic) in (targets or ()):
+                    allowed[(metric, statistic)] = tolerance * scale
+        if converged(rows, allowed):
+            return rows
+        per_stratum = sampler.refine(per_stratum, max_fraction)
+        if per_stratum is None:
+            return exact_local(luminance, params)
+
+def evaluate(luminance, metrics=("global", "local"), tolerance=0.02, exact=False, params=None, targets=None,
+             seed=0):
+    """
+    Global and/or local rows for one plane, local ones approximate unless exact is set.
+    Global metrics are always exact: one pass over the plane costs less than sampling it.
+    """
+    rows = []
+    if "global" in metrics:
+        rows += exact_global(luminance)
+    if "local" in metrics:
+        rows += (exact_local(luminance, params) if exact else
+                 approximate_local(luminance, params, tolerance, targets=targets, seed=seed))
+    return rows
+
+def screen(paths, metric, statistic="value", tolerance=0.02, shortlist=5, descending=True, seed=0):
+    """
+    Rank images by one approximate metric and recompute the shortlist exactly.
+    Returns:
+        (approximate rows of every image, exact rows of the shortlisted images)
+    """
+    from paired_eval import load_luminance
+    kind = "global" if statistic == "value" else "local"
+    approximate_rows = []
+    for path in paths:
+        start = time.perf_counter()
+        rows = evaluate(load_luminance(path), (kind,), tolerance, targets=[(metric, statistic)], seed=seed)
+        seconds = time.perf_counter() - start
+        approximate_rows += [dict(r, image=path, seconds=seconds) for r in rows]
+    ranked = sorted((r for r in approximate_rows if r["metric"] == metric and r["statistic"] == statistic),
+                    key=lambda r: r["value"], reverse=descending)
+    exact_rows = []
+    for entry in ranked[:shortlist]:
+        start = time.perf_counter()
+        rows = evaluate(load_luminance(entry["image"]), (kind,), exact=True)
+        seconds = time.perf_counter() - start
+        exact_rows += [dict(r, image=entry["image"], seconds=seconds) for r in rows]
+    return approximate_rows, exact_rows
+
+def check(paths, metrics=("global", "local"), tolerance=0.02, seed=0):
+    """
+    Compare approximate and exact rows on every image: whether each exact value falls inside
+    the reported interval or bound, the error relative to the exact value, and the speed-up.
+    """
+    from paired_eval import load_luminance
+    results = []
+    for path in paths:
+        luminance = load_luminance(path)
+        start = time.perf_counter()
+        approximate_rows = evaluate(luminance, metrics, tolerance, seed=seed)
+        approximate_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        exact_rows = {(r["metric"], r["statistic"]): r for r in evaluate(luminance, metrics, exact=True)}
+        exact_seconds = time.perf_counter() - start
+        for r in approximate_rows:
+            truth = exact_rows[(r["metric"], r["statistic"])]["value"]
+            # Sampled blocks and the full plane go through different FFT sizes; allow for round-off
+            slack = 1e-5 * max(abs(truth), 1e-6)
+            results.append(dict(r, image=path, exact=truth, covered=bool(r["low"] - slack <= truth <= r["high"] + slack),
+                                rel_error=abs(r["value"] - truth) / (abs(truth) + 1e-12),
+                                speedup=exact_seconds / approximate_seconds))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Approximate contrast metrics with error bounds for filter screening.")
+    parser.add_argument("images", nargs="+", help="Renders (PNG/TIF) or folders of renders")
+    parser.add_argument("--metric", default="rms_contrast", help="Metric to rank by (e.g. rms_contrast, peli)")
+    parser.add_argument("--statistic", default="value", help="'value' for global metrics, or mean/variance")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Relative half-width of the intervals")
+    parser.add_argument("--shortlist", type=int, default=5, help="Top images recomputed exactly")
+    parser.add_argument("--ascending", action="store_true", help="Rank lowest first")
+    parser.add_argument("--check", action="store_true", help="Also compute every image exactly and report coverage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="approximate_metrics.csv")
+    args = parser.parse_args()
+
+    from paired_eval import IMAGE_EXTENSIONS
+    paths = []
+    for entry in args.images:
+        if os.path.isdir(entry):
+            paths += sorted(os.path.join(d, f) for d, _, files in os.walk(entry)
+                            for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            paths.append(entry)
+
+    if args.check:
+        rows = check(paths, tolerance=args.tolerance, seed=args.seed)
+        intervals = [r for r in rows if r["kind"] != "exact"]
+        print(f"Covered: {np.mean([r['covered'] for r in intervals]):.1%} of {len(intervals)} approximate values, "
+              f"median relative error {np.median([r['rel_error'] for r in rows]):.2e}, "
+              f"median speed-up {np.median([r['speedup'] for r in rows]):.1f}x")
+    else:
+        approximate_rows, exact_rows = screen(paths, args.metric, args.statistic, args.tolerance, args.shortlist,
+                                              not args.ascending, args.seed)
+        rows = approximate_rows + exact_rows
+        print(f"Shortlist by {args.metric} ({args.statistic}):")
+        for r in exact_rows:
+            if r["metric"] == args.metric and r["statistic"] == args.statistic:
+                print(f"  {r['value']:.6g}  {r['image']}")
+    with open(args.output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Saved: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import numpy as np
+
+SIZE_PRESETS = {
+    "small": [(256, 256, 160)],
+    "default": [(512, 512, 160)],
+    "large": [(512, 512, 160), (2048, 2048, 204), (4096, 4096, 224)],
+}
+INTERLEAVES = ("bsq", "bil", "bip")
+CASES = ("io_envi", "io_sidq", "apply_transmission", "render", "global", "peli", "dog", "cab", "iordache")
+
+def synthetic_wavelengths(bands, first=400.0, last=1000.0):
+    """Evenly spaced band centres (SIDQ uses 410-1000 nm for 160 bands)."""
+    return np.linspace(first, last, bands)
+
+def synthetic_rows(row0, rows, cols, wavelengths, seed=0):
+    """
+    Rows [row0, row0 + rows) of a deterministic synthetic radiance cube (rows x cols x bands, float32).
+    Pixels mix four smooth Gaussian endmember spectra with abundances that vary smoothly over
+    the image, plus seeded per-row texture, so the cube depends only on its size and seed
+    and can be generated in any number of row chunks.
+    """
+    centres = np.array([450.0, 550.0, 650.0, 850.0])
+    endmembers = np.exp(-0.5 * ((wavelengths[None, :] - centres[:, None]) / 60.0) ** 2).astype(np.float32)
+    y = (np.arange(row0, row0 + rows, dtype=np.float32) / 97.0)[:, None]
+    x = (np.arange(cols, dtype=np.float32) / 131.0)[None, :]
+    abundances = np.stack([1.5 + np.sin(y + k) * np.cos(x * (k + 1)) for k in range(4)], axis=-1)
+    texture = np.stack([np.random.default_rng((seed, row0 + r)).random(cols, dtype=np.float32)
+                        for r in range(rows)])
+    return (abundances * (0.75 + 0.5 * texture[..., None])) @ endmembers
+
+def write_envi_cube(hdr_path, shape, interleave="bip", seed=0, chunk_rows=128):
+    """Write a synthetic ENVI cube of shape (rows, cols, bands) in the given interleave."""
+    import spectral
+    rows, cols, bands = shape
+    wavelengths = synthetic_wavelengths(bands)
+    metadata = {"wavelength": [f"{w:.2f}" for w in wavelengths], "interleave": interleave}
+    image = spectral.envi.create_image(hdr_path, metadata, shape=shape, dtype=np.float32,
+                                       interleave=interleave, ext=".raw", force=True)
+    memmap = image.open_memmap(interleave='bip', writable=True)
+    for row0 in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - row0)
+        memmap[row0:row0 + n] = synthetic_rows(row0, n, cols, wavelengths, seed)
+    memmap.flush()
+    return hdr_path
+
+def write_sidq_cube(mat_path, shape, seed=0, chunk_rows=128):
+    """Write a synthetic SIDQ-style HDF5 .mat file with the cube in the 'hsi' dataset."""
+    import h5py
+    rows, cols, bands = shape
+    wavelengths = synthetic_wavelengths(bands, 410.0, 1000.0)
+    with h5py.File(mat_path, "w") as f:
+        dataset = f.create_dataset("hsi", shape=shape, dtype=np.float32)
+        for row0 in range(0, rows, chunk_rows):
+            n = min(chunk_rows, rows - row0)
+            dataset[row0:row0 + n] = synthetic_rows(row0, n, cols, wavelengths, seed)
+    return mat_path
+
+def cube_name(shape, interleave, seed):
+    return f"synthetic_{shape[0]}x{shape[1]}x{shape[2]}_{interleave}_s{seed}"
+
+def ensure_cubes(workdir, shape, interleaves=INTERLEAVES, seed=0):
+    """Generate (once) the ENVI variants and the SIDQ file for one size; returns their paths."""
+    os.makedirs(workdir, exist_ok=True)
+    paths = {}
+    for interleave in interleaves:
+        hdr_path = os.path.join(workdir, cube_name(shape, interleave, seed) + ".hdr")
+        if not os.path.exists(hdr_path):
+            print(f"Generating: {hdr_path}")
+            write_envi_cube(hdr_path, shape, interleave, seed)
+        paths[interleave] = hdr_path
+    mat_path = os.path.join(workdir, cube_name(shape, "sidq", seed) + ".mat")
+    if not os.path.exists(mat_path):
+        print(f"Generating: {mat_path}")
+        write_sidq_cube(mat_path, shape, seed)
+    paths["sidq"] = mat_path
+    return paths
+
+def time_call(function, repeat=5, warmup=1):
+    """Wall-clock seconds of each of repeat calls, after warmup untimed calls (caches, FFT plans, page cache)."""
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+def row_tiles(array, tile_rows=256):
+    """Consecutive (row0, rows x cols x bands float32 copy) tiles of a memory-mapped or HDF5 cube."""
+    for row0 in range(0, array.shape[0], tile_rows):
+        yield row0, np.array(array[row0:row0 + tile_rows], dtype=np.float32)
+
+def median_abs_deviation(times):
+    return float(np.median(np.abs(np.asarray(times) - np.median(times))))
+
+def benchmark_size(paths, shape, repeat=5, cases=CASES, cmf_file=None, filter_file=None, tile_rows=256, warmup=1):
+    """
+    Time every selected case on one cube size. Returns result rows.
+    Cubes are streamed from their memory maps in tiles of tile_rows rows, so no case holds more
+    than one tile of the cube (plus the 2-D planes it renders) in memory, as in the pipeline.
+    """
+    import spectral
+    import h5py
+    from apply_filter import apply_transmission, load_transmission_curve, match_transmission_to_cube
+    from hsi2rgb import load_cmf_data, match_values_to_cube, radiance_to_xyz, xyz_to_srgb
+    from measurement import luminance_contrast
+    from pelicontrast import peli_contrast
+    from dogcontrast import dog_contrast_metrics
+    from cab_clb_contrast import ahumada_beard_contrast, iordache_contrast
+
+    label = "x".join(str(n) for n in shape)
+    nbytes = int(np.prod(shape)) * 4
+    rows = []
+
+    def record(case, times, variant=""):
+        rows.append({"case": case, "variant": variant, "size": label, "megabytes": nbytes / 1e6,
+                     "min_seconds": min(times), "median_seconds": float(np.median(times)),
+                     "mad_seconds": median_abs_deviation(times), "repeat": len(times)})
+        print(f"  {case:<20}{variant:<6}median {np.median(times):8.3f} s   min {min(times):8.3f} s   "
+              f"MAD {median_abs_deviation(times):8.4f} s")
+
+    def read_all(array):
+        for _ in row_tiles(array, tile_rows):
+            pass
+
+    if "io_envi" in cases:
+        for interleave in INTERLEAVES:
+            if interleave in paths:
+                memmap = spectral.open_image(paths[interleave]).open_memmap(interleave='bip')
+                record("io_envi", time_call(lambda: read_all(memmap), repeat, warmup), interleave)
+    if "io_sidq" in cases:
+        def read_sidq():
+            with h5py.File(paths["sidq"], "r") as f:
+                read_all(f["hsi"])
+        record("io_sidq", time_call(read_sidq, repeat, warmup))
+
+    cube = spectral.open_image(paths["bip"]).open_memmap(interleave='bip')
+    wavelengths = synthetic_wavelengths(shape[2])
+    if "apply_transmission" in cases:
+        filter_wavelengths, filter_values = load_transmission_curve(filter_file or os.path.join("tools", "filters", "amp.txt"))
+        transmission = match_transmission_to_cube(wavelengths, filter_wavelengths, filter_values)
+
+        def filter_tiles():
+            for _, tile in row_tiles(cube, tile_rows):
+                apply_transmission(tile, transmission)
+        record("apply_transmission", time_call(filter_tiles, repeat, warmup))
+
+    matched_cmf = match_values_to_cube(wavelengths, *load_cmf_data(cmf_file or os.path.join("cmfs", "cmf_2.csv")))
+
+    def render():
+        XYZ = np.empty(shape[:2] + (3,), dtype=np.float32)
+        for row0, tile in row_tiles(cube, tile_rows):
+            XYZ[row0:row0 + len(tile)] = radiance_to_xyz(tile, matched_cmf)
+        return xyz_to_srgb(np.clip(XYZ / np.max(XYZ), 0, 1))
+    if "render" in cases:
+        record("render", time_call(render, repeat, warmup))
+
+    RGB = render().astype(np.float32)
+    luminance = RGB @ np.array([0.2125, 0.7154, 0.0721], dtype=np.float32)
+    local_cases = {"global": lambda: luminance_contrast(luminance),
+                   "peli": lambda: peli_contrast(luminance * 255),
+                   "dog": lambda: dog_contrast_metrics(luminance),
+                   "cab": lambda: ahumada_beard_contrast(luminance),
+                   "iordache": lambda: iordache_contrast(luminance)}
+    for case, function in local_cases.items():
+        if case in cases:
+            record(case, time_call(function, repeat, warmup))
+    return rows
+
+def environment():
+    """Machine description stored with every run."""
+    return {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "processor": platform.processor(), "cpus": os.cpu_count(), "node": platform.node()}
+
+def compare(results, baseline, threshold=0.05, noise=3.0, floor=0.005):
+    """
+    Cases that got slower than the baseline by more than the timing noise.
+    The best (min-of-N) times are compared. A slowdown counts when it exceeds threshold (a
+    fraction of the baseline), noise times the summed median absolute deviations of the two
+    runs' repeats (cases that jitter need a larger slowdown before they are flagged) and floor
+    seconds (scheduler noise that the repeats of millisecond cases do not show).
+    Returns:
+        List of (case, variant, size, baseline seconds, current seconds, ratio).
+    """
+    reference = {(r["case"], r["variant"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        key = (r["case"], r["variant"], r["size"])
+        if key in reference:
+            before, after = reference[key]["min_seconds"], r["min_seconds"]
+            spread = reference[key].get("mad_seconds", 0.0) + r.get("mad_seconds", 0.0)
+            if after - before > max(threshold * before, noise * spread, floor):
+                regressions.append(key + (before, after, after / max(before, 1e-9)))
+    return regressions
+
+def parse_size(text):
+    """'512x512x160' -> (512, 512, 160)."""
+    rows, cols, bands = (int(n) for n in text.lower().split("x"))
+    return rows, cols, bands
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark filtering, rendering, metrics and I/O on synthetic cubes.")
+    parser.add_argument("--preset", choices=sorted(SIZE_PRESETS), default="default")
+    parser.add_argument("--size", action="append", type=parse_size, help="Cube size ROWSxCOLSxBANDS (repeatable)")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs before each case")
+    parser.add_argument("--tile-rows", type=int, default=256, help="Rows per streamed tile")
+    parser.add_argument("--cmf", default=os.path.join("cmfs", "cmf_2.csv"), help="CMF CSV used by the render cases")
+    parser.add_argument("--filter", default=os.path.join("tools", "filters", "amp.txt"),
+                        help="Transmission curve used by apply_transmission")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "contrast_benchmark"),
+                        help="Folder for the generated cubes (reused between runs)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.05, help="Smallest slowdown reported, as a fraction")
+    parser.add_argument("--noise", type=float, default=3.0,
+                        help="Smallest slowdown reported, in median absolute deviations of the repeats")
+    parser.add_argument("--floor", type=float, default=0.005, help="Smallest slowdown reported, in seconds")
+    args = parser.parse_args()
+
+    rows = []
+    for shape in args.size or SIZE_PRESETS[args.preset]:
+        print(f"Size {shape[0]}x{shape[1]}x{shape[2]}:")
+        paths = ensure_cubes(args.workdir, shape, seed=args.seed)
+        rows.extend(benchmark_size(paths, shape, args.repeat, args.cases, args.cmf, args.filter, args.tile_rows,
+                                   args.warmup))
+
+    run = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": environment(), "results": rows}
+    with open(args.output, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"Saved: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(rows, json.load(f), args.threshold, args.noise, args.floor)
+        for case, variant, size, before, after, ratio in regressions:
+            print(f"REGRESSION {case} {variant} {size}: {before:.3f} s -> {after:.3f} s ({ratio:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions above {args.threshold:.0%} and {args.noise:g} MAD.")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 import numpy as np
 import cv2
-from scipy.ndimage import gaussian_filter
 
 def ahumada_beard_contrast(image, sigma_b=3, sigma_i=1):
     """
@@ -12,6 +11,7 @@ def ahumada_beard_contrast(image, sigma_b=3, sigma_i=1):
     Returns:
         contrast_map: Contrast map based on Ahumada and Beard's measure.
     """
+    from scipy.ndimage import gaussian_filter
     # Blurred image b(x, y)
     b = gaussian_filter(image, sigma=sigma_b)
     
@@ -95,6 +95,7 @@ def visualize_contrast_measures(image_path):
     plt.tight_layout()
     plt.show()
 
-# Example Usage
-image_path = "lena.png"  # Replace with your image path
-visualize_contrast_measures(image_path)
+if __name__ == "__main__":
+    # Example Usage
+    image_path = "lena.png"  # Replace with your image path
+    visualize_contrast_measures(image_path)
@@ -0,0 +1,348 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+from contextlib import closing
+import numpy as np
+
+SOURCES_FOLDER = os.path.join("tools", "sources")
+DEFAULT_CALIBRATION = {
+    "region": None,          # [row0, col0, row1, col1] of a white reference in the cube
+    "spectrum": None,        # two-column illumination spectrum (the tools/filters/*.txt layout)
+    "reflectance": 1.0,      # reflectance of the white reference (e.g. 0.99 for Spectralon)
+    "cache": "illumination_cache.sqlite",
+}
+RELIT_SEPARATOR = "@"        # relit renders are labelled <filter>@<illuminant>
+ILLUMINATION_FLOOR = 1e-3    # bands lit below this fraction of the peak get no reflectance
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS illumination (
+    key TEXT PRIMARY KEY,
+    settings TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    wavelengths BLOB,
+    illumination BLOB,
+    estimated_at REAL
+);
+"""
+
+def find_sources(folder=SOURCES_FOLDER):
+    """{name: path} of the illuminant spectra in tools/sources (CIE_A, CIE_D65, projectors, ...)."""
+    return {os.path.splitext(f)[0]: os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith(".txt")}
+
+def illuminant_name(name):
+    """Label of an illuminant given by name or path ("tools/sources/CIE_A.txt" -> "CIE_A")."""
+    return os.path.splitext(os.path.basename(name))[0]
+
+def load_illuminant(name, folder=SOURCES_FOLDER):
+    """
+    Load an illuminant by tools/sources name (e.g. "CIE_D65") or by path.
+    .txt files are two-column (wavelength, power); .csv files are read as hsi2rgb.load_illuminant_data.
+    """
+    path = name if os.path.exists(name) else os.path.join(folder, f"{name}.txt")
+    if path.endswith(".csv"):
+        from hsi2rgb import load_illuminant_data
+        return load_illuminant_data(path)
+    data = np.loadtxt(path)
+    return data[:, 0], data[:, 1]
+
+def match_illuminant(wavelengths, illuminant, cmf=None):
+    """
+    Resample an illuminant to a cube's bands (zero outside its measured range) and scale it so that
+    a perfect white has Y = 1 under it, which keeps renders under different sources comparable.
+    Without CMFs the illuminant is scaled to a unit peak instead.
+    """
+    source_wavelengths, power = illuminant
+    values = np.clip(np.interp(wavelengths, source_wavelengths, power, left=0.0, right=0.0), 0.0, None)
+    if cmf is not None:
+        from hsi2rgb import match_values_to_cube
+        white = values @ match_values_to_cube(wavelengths, *cmf)[:, 1]
+    else:
+        white = values.max()
+    if white <= 0:
+        raise ValueError("Illuminant has no power in the cube's bands")
+    return values / white
+
+def region_illumination(hdr_path, region, reflectance=1.0):
+    """Mean radiance of a white reference region [row0, col0, row1, col1] divided by its reflectance."""
+    import spectral
+    from precision import data_gain, decode
+    image = spectral.open_image(hdr_path)
+    memmap = image.open_memmap(interleave='bip')
+    row0, col0, row1, col1 = (int(v) for v in region)
+    patch = decode(memmap[row0:row1, col0:col1], data_gain(image.metadata), np.float64)
+    if patch.size == 0:
+        raise ValueError(f"Empty white reference region {list(region)} in {hdr_path}")
+    return patch.reshape(-1, patch.shape[2]).mean(axis=0) / reflectance
+
+def spectrum_illumination(wavelengths, spectrum, reflectance=1.0):
+    """A measured reference spectrum (two-column file) resampled to the cube's bands."""
+    data = np.loadtxt(spectrum)
+    return np.interp(wavelengths, data[:, 0], data[:, 1], left=0.0, right=0.0) / reflectance
+
+def estimate_illumination(hdr_path, wavelengths, region=None, spectrum=None, reflectance=1.0):
+    """Illumination per band from a white reference region of the cube, or from a reference spectrum."""
+    if region is not None:
+        return region_illumination(hdr_path, region, reflectance)
+    return spectrum_illumination(wavelengths, spectrum, reflectance)
+
+def reflectance_gains(illumination, floor=ILLUMINATION_FLOOR):
+    """Per-band factors taking radiance to reflectance (zero where the illumination is below floor x peak)."""
+    illumination = np.asarray(illumination, dtype=np.float64)
+    lit = illumination > floor * illumination.max()
+    return np.where(lit, 1.0 / np.where(lit, illumination, 1.0), 0.0)
+
+def relighting_gains(illumination, matched_illuminants):
+    """(K x bands) factors taking radiance under the estimated illumination to radiance under K illuminants."""
+    return np.stack(list(matched_illuminants)) * reflectance_gains(illumination)
+
+def relight_tile(tile, gains):
+    """A (rows x cols x bands) radiance tile under K illuminants at once: (rows x cols x K x bands)."""
+    return tile[:, :, None, :] * gains.astype(tile.dtype)
+
+def relit_label(label, illuminant):
+    return f"{label}{RELIT_SEPARATOR}{illuminant}"
+
+def split_label(label):
+    """(filter label, illuminant) of a relit label; the illuminant is None for captured renders."""
+    if RELIT_SEPARATOR in label:
+        label, illuminant = label.rsplit(RELIT_SEPARATOR, 1)
+        return label, illuminant
+    return label, None
+
+def calibration_settings(calibration):
+    """The estimate-defining part of a calibration config, or None when it names no reference."""
+    calibration = dict(DEFAULT_CALIBRATION, **(calibration or {}))
+    if calibration["region"] is not None and calibration["spectrum"] is not None:
+        raise ValueError("Calibrate from a white reference region or a reference spectrum, not both")
+    if calibration["region"] is None and calibration["spectrum"] is None:
+        return None
+    return {"region": None if calibration["region"] is None else [int(v) for v in calibration["region"]],
+            "spectrum": None if calibration["spectrum"] is None else os.path.abspath(calibration["spectrum"]),
+            "reflectance": float(calibration["reflectance"])}
+
+def _file_state(hdr_path):
+    """(size, mtime_ns) of a cube's data file, used to detect stale estimates."""
+    from cube_index import data_file_path
+    stat = os.stat(data_file_path(hdr_path))
+    return stat.st_size, stat.st_mtime_ns
+
+class IlluminationCache:
+    """
+    Illumination estimates in SQLite, keyed by cube header or by scene folder.
+    A scene entry serves every cube below its folder, so a scene is calibrated once.
+    Connections are opened per call, so one cache can be shared by worker threads and processes.
+    """
+
+    def __init__(self, path=DEFAULT_CALIBRATION["cache"]):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def store(self, key, wavelengths, illumination, settings=None, state=(None, None)):
+        """Store an estimate for a cube (with its data file state) or for a scene folder."""
+        with closing(self._connect()) as conn:
+            conn.execute("INSERT OR REPLACE INTO illumination VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (os.path.abspath(key), json.dumps(settings), state[0], state[1],
+                          np.asarray(wavelengths, dtype=np.float64).tobytes(),
+                          np.asarray(illumination, dtype=np.float64).tobytes(), time.time()))
+            conn.commit()
+
+    def lookup(self, hdr_path, settings=None):
+        """
+        (wavelengths, illumination) for a cube: its own entry while the data file is unchanged and the
+        settings (if given) match, else the entry of the nearest enclosing scene folder, else None.
+        """
+        path = os.path.abspath(hdr_path)
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM illumination WHERE key = ?", (path,)).fetchone()
+            if (row is not None and (row["size"], row["mtime_ns"]) == _file_state(path)
+                    and (settings is None or json.loads(row["settings"]) == settings)):
+                return _decode(row)
+            folder = os.path.dirname(path)
+            while True:
+                row = conn.execute("SELECT * FROM illumination WHERE key = ? AND size IS NULL", (folder,)).fetchone()
+                if row is not None:
+                    return _decode(row)
+                if os.path.dirname(folder) == folder:
+                    return None
+                folder = os.path.dirname(folder)
+
+    def estimate(self, hdr_path, wavelengths, calibration=None):
+        """
+        The illumination of a cube on its own bands, estimated from the calibration config (and stored)
+        only when the cache has nothing for the cube or its scene.
+        """
+        settings = calibration_settings(calibration)
+        found = self.lookup(hdr_path, settings)
+        if found is None:
+            if settings is None:
+                raise ValueError(f"No illumination estimate for {hdr_path}: configure a calibration region or "
+                                 "spectrum, or run 'calibration.py estimate'")
+            illumination = estimate_illumination(hdr_path, wavelengths, **settings)
+            self.store(hdr_path, wavelengths, illumination, settings, _file_state(hdr_path))
+            return illumination
+        stored_wavelengths, illumination = found
+        if not np.array_equal(stored_wavelengths, wavelengths):
+            illumination = np.interp(wavelengths, stored_wavelengths, illumination, left=0.0, right=0.0)
+        return illumination
+
+    def entries(self):
+        with closing(self._connect()) as conn:
+            return [dict(row) for row in conn.execute("SELECT key, settings, size, estimated_at FROM illumination "
+                                                      "ORDER BY key")]
+
+def _decode(row):
+    return np.frombuffer(row["wavelengths"], dtype=np.float64), np.frombuffer(row["illumination"], dtype=np.float64)
+
+def relighting(source, illuminants, cmf, cache, calibration=None):
+    """
+    {illuminant: per-band gains} that relight a pipeline.CubeSource into each illuminant,
+    or None when no illuminants are configured (renders stay as captured).
+    """
+    if not illuminants:
+        return None
+    illumination = cache.estimate(source.hdr_path, source.wavelengths, calibration)
+    matched = [match_illuminant(source.wavelengths, curve, cmf) for curve in illuminants.values()]
+    return dict(zip(illuminants, relighting_gains(illumination, matched)))
+
+def band_peaks(memmap, gain_offset=None, tile_rows=256, hdr_path=None):
+    """
+    Per-band maximum of a cube's decoded values: from a fresh cube_index entry when hdr_path is
+    given and indexed, else from one pass over the rows.
+    """
+    from cube_index import indexed_band_max
+    from precision import decode
+    indexed = indexed_band_max(hdr_path) if hdr_path is not None else None
+    if indexed is not None:
+        return decode(np.asarray(indexed)[None, None], gain_offset, np.float64)[0, 0]
+    return np.max([decode(memmap[r:r + tile_rows], gain_offset, np.float64).max(axis=(0, 1))
+                   for r in range(0, memmap.shape[0], tile_rows)], axis=0)
+
+def convert_envi_cube(hdr_path, output, illumination, illuminants=None, reflectance=True, tile_rows=256,
+                      policy=None):
+    """
+    Write reflectance and relit copies of an ENVI cube in one pass over its tiles.
+    Args:
+        hdr_path: Source cube (radiance).
+        output: Folder receiving <output>/reflectance/<cube> and <output>/<illuminant>/<cube>.
+        illumination: Illumination per band of the cube.
+        illuminants: {name: illuminant matched to the cube's bands} (see match_illuminant).
+        reflectance: Whether to write the reflectance cube.
+        tile_rows: Rows per tile.
+        policy: precision policy; uint16 outputs get per-cube gains from the per-band source peaks.
+    Returns:
+        {name: written header path}.
+    """
+    import spectral
+    from precision import (get_policy, check_envi_storage, data_gain, decode, encode_with_gain, storage_gain,
+                           storage_metadata)
+    policy = get_policy(policy)
+    check_envi_storage(policy.storage)
+    image = spectral.open_image(hdr_path)
+    source = image.open_memmap(interleave='bip')
+    gain_offset = data_gain(image.metadata)
+    # Reflectance is the cube relit under a unit illuminant
+    targets = dict({"reflectance": np.ones(source.shape[2])} if reflectance else {}, **(illuminants or {}))
+    if not targets:
+        raise ValueError("Nothing to write: no reflectance and no illuminants")
+    names = list(targets)
+    gains = relighting_gains(illumination, targets.values())
+    storage_gains = np.ones(len(names))
+    if policy.storage != "float32":
+        peaks = band_peaks(source, gain_offset, tile_rows, hdr_path)
+        storage_gains = [storage_gain(float(np.max(peaks * g)), policy.storage) for g in gains]
+
+    outputs, paths = [], {}
+    for name, gain in zip(names, storage_gains):
+        folder = os.path.join(output, name)
+        os.makedirs(folder, exist_ok=True)
+        paths[name] = os.path.join(folder, os.path.basename(hdr_path))
+        metadata = storage_metadata(image.metadata, source.shape[2], gain)
+        outputs.append(spectral.envi.create_image(paths[name], metadata, dtype=policy.storage, interleave='bip',
+                                                  force=True).open_memmap(writable=True))
+    for row in range(0, source.shape[0], tile_rows):
+        relit = relight_tile(decode(source[row:row + tile_rows], gain_offset, policy.compute), gains)
+        for k, (memmap, gain) in enumerate(zip(outputs, storage_gains)):
+            memmap[row:row + len(relit)] = encode_with_gain(relit[:, :, k], policy.storage, gain)
+    for memmap in outputs:
+        memmap.flush()
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate radiance cubes to reflectance and relight them.")
+    parser.add_argument("--cache", default=DEFAULT_CALIBRATION["cache"], help="Illumination cache (SQLite)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, text in (("estimate", "Estimate and cache the illumination of a cube or scene"),
+                       ("convert", "Write reflectance and relit copies of cubes")):
+        sub = subparsers.add_parser(name, help=text)
+        sub.add_argument("cubes", nargs="+", help="ENVI headers")
+        sub.add_argument("--region", nargs=4, type=int, metavar=("ROW0", "COL0", "ROW1", "COL1"),
+                         help="White reference region")
+        sub.add_argument("--spectrum", help="Reference illumination spectrum (two-column file)")
+        sub.add_argument("--reflectance", type=float, default=1.0, help="Reflectance of the white reference")
+    subparsers.choices["estimate"].add_argument("--scene", help="Store the estimate for every cube below this "
+                                                                "folder instead of the cube alone")
+    convert = subparsers.choices["convert"]
+    convert.add_argument("--illuminants", nargs="*", default=["CIE_D65"],
+                         help="tools/sources names or spectrum files")
+    convert.add_argument("--no-reflectance", action="store_true", help="Only write the relit cubes")
+    convert.add_argument("--cmf", default=os.path.join("cmfs", "cmf_2.csv"))
+    convert.add_argument("--output", default="calibrated_output")
+    convert.add_argument("--tile-rows", type=int, default=256)
+    convert.add_argument("--precision", default="default", help="precision.POLICIES name")
+    subparsers.add_parser("sources", help="List the illuminants in tools/sources")
+    subparsers.add_parser("show", help="List the cached estimates")
+    args = parser.parse_args()
+
+    if args.command == "sources":
+        for name, path in find_sources().items():
+            wavelengths, _ = load_illuminant(path)
+            print(f"{name}: {wavelengths.min():g}-{wavelengths.max():g} nm")
+        return
+    cache = IlluminationCache(args.cache)
+    if args.command == "show":
+        for entry in cache.entries():
+            kind = "scene" if entry["size"] is None else "cube"
+            print(f"{entry['key']} ({kind}): {entry['settings']}")
+        return
+
+    import spectral
+    calibration = {"region": args.region, "spectrum": args.spectrum, "reflectance": args.reflectance}
+    if args.command == "estimate":
+        settings = calibration_settings(calibration)
+        if settings is None:
+            parser.error("estimate needs --region or --spectrum")
+        # A scene estimate comes from its first cube (the one showing the white reference)
+        for hdr_path in args.cubes[:1] if args.scene else args.cubes:
+            wavelengths = np.array([float(w) for w in spectral.open_image(hdr_path).metadata['wavelength']])
+            illumination = estimate_illumination(hdr_path, wavelengths, **settings)
+            if args.scene:
+                cache.store(args.scene, wavelengths, illumination, settings)
+            else:
+                cache.store(hdr_path, wavelengths, illumination, settings, _file_state(hdr_path))
+            print(f"Cached: {args.scene or hdr_path} (peak {illumination.max():.4g} at "
+                  f"{wavelengths[np.argmax(illumination)]:g} nm)")
+        return
+
+    from hsi2rgb import load_cmf_data
+    cmf = load_cmf_data(args.cmf)
+    illuminants = {illuminant_name(name): load_illuminant(name) for name in args.illuminants}
+    for hdr_path in args.cubes:
+        wavelengths = np.array([float(w) for w in spectral.open_image(hdr_path).metadata['wavelength']])
+        illumination = cache.estimate(hdr_path, wavelengths, calibration)
+        matched = {name: match_illuminant(wavelengths, curve, cmf) for name, curve in illuminants.items()}
+        paths = convert_envi_cube(hdr_path, args.output, illumination, matched, not args.no_reflectance,
+                                  args.tile_rows, args.precision)
+        for path in paths.values():
+            print(f"Saved: {path}")
+
+if __name__ == "__main__":
+    main()
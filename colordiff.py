@@ -0,0 +1,156 @@
+import os
+import argparse
+import numpy as np
+import spectral
+
+from apply_filter import load_transmission_curve
+from hsi2rgb import radiance_to_xyz, xyz_to_srgb
+
+DELTA_E_PERCENTILES = (50, 90, 95, 99)
+
+def xyz_to_lab(XYZ, white):
+    """
+    Convert CIE XYZ to CIELAB in float32.
+    Args:
+        XYZ: (... x 3) array.
+        white: Reference white (Xn, Yn, Zn) on the same scale as XYZ.
+    """
+    t = np.asarray(XYZ, dtype=np.float32) / np.asarray(white, dtype=np.float32)
+    delta = np.float32(6 / 29)
+    f = np.where(t > delta ** 3, np.cbrt(np.maximum(t, 0)), t / (3 * delta ** 2) + np.float32(4 / 29))
+    L = 116 * f[..., 1] - 16
+    a = 500 * (f[..., 0] - f[..., 1])
+    b = 200 * (f[..., 1] - f[..., 2])
+    return np.stack([L, a, b], axis=-1).astype(np.float32)
+
+def ciede2000(lab1, lab2, kL=1.0, kC=1.0, kH=1.0):
+    """
+    CIEDE2000 colour difference between two CIELAB arrays, fully vectorised (Sharma et al., 2005).
+    Returns:
+        float32 array of per-pixel Delta E 2000.
+    """
+    lab1 = np.asarray(lab1, dtype=np.float32)
+    lab2 = np.asarray(lab2, dtype=np.float32)
+    L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+    pow25_7 = np.float32(25.0 ** 7)
+
+    # Chroma-dependent a* rescaling
+    C_bar = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2
+    G = 0.5 * (1 - np.sqrt(C_bar ** 7 / (C_bar ** 7 + pow25_7)))
+    a1p, a2p = (1 + G) * a1, (1 + G) * a2
+    C1p, C2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+    h1p = np.arctan2(b1, a1p) % (2 * np.pi)
+    h2p = np.arctan2(b2, a2p) % (2 * np.pi)
+    chroma_zero = (C1p * C2p) == 0
+
+    # Differences in lightness, chroma and hue
+    dLp = L2 - L1
+    dCp = C2p - C1p
+    dhp = h2p - h1p
+    dhp = np.where(dhp > np.pi, dhp - 2 * np.pi, np.where(dhp < -np.pi, dhp + 2 * np.pi, dhp))
+    dhp = np.where(chroma_zero, 0, dhp)
+    dHp = 2 * np.sqrt(C1p * C2p) * np.sin(dhp / 2)
+
+    # Means used by the weighting functions
+    Lp_bar = (L1 + L2) / 2
+    Cp_bar = (C1p + C2p) / 2
+    h_sum = h1p + h2p
+    # Hues exactly opposite (|dh| = 180 deg) keep the plain mean, as in Sharma's test data; float32
+    # round-off must not push them into the wrapped branch, which moves the mean hue by 180 deg
+    hp_bar = np.where(np.abs(h1p - h2p) > np.pi + 1e-5,
+                      np.where(h_sum < 2 * np.pi, h_sum + 2 * np.pi, h_sum - 2 * np.pi), h_sum) / 2
+    hp_bar = np.where(chroma_zero, h_sum, hp_bar)
+
+    T = (1 - 0.17 * np.cos(hp_bar - np.radians(30)) + 0.24 * np.cos(2 * hp_bar)
+         + 0.32 * np.cos(3 * hp_bar + np.radians(6)) - 0.20 * np.cos(4 * hp_bar - np.radians(63)))
+    d_theta = np.radians(30) * np.exp(-((np.degrees(hp_bar) - 275) / 25) ** 2)
+    R_C = 2 * np.sqrt(Cp_bar ** 7 / (Cp_bar ** 7 + pow25_7))
+    S_L = 1 + 0.015 * (Lp_bar - 50) ** 2 / np.sqrt(20 + (Lp_bar - 50) ** 2)
+    S_C = 1 + 0.045 * Cp_bar
+    S_H = 1 + 0.015 * Cp_bar * T
+    R_T = -np.sin(2 * d_theta) * R_C
+
+    dL, dC, dH = dLp / (kL * S_L), dCp / (kC * S_C), dHp / (kH * S_H)
+    return np.sqrt(np.maximum(dL ** 2 + dC ** 2 + dH ** 2 + R_T * dC * dH, 0)).astype(np.float32)
+
+def equal_energy_white(matched_cmf):
+    """XYZ of an equal-energy spectrum through the matched CMFs, scaled to Y = 1."""
+    white = matched_cmf.sum(axis=0)
+    return white / white[1]
+
+def render_with_difference(hdr_path, transmission, cmf_wavelengths, cmf_values, tile_rows=256):
+    """
+    Render original and filtered XYZ from a single tile-wise read of a cube and compare them.
+    Each tile is projected once onto [CMF | CMF * transmission], so the filtered render needs
+    no second read or filtered copy of the cube.
+    Args:
+        hdr_path: Path to the ENVI header of the unfiltered cube.
+        transmission: Filter transmission matched to the cube's bands.
+        cmf_wavelengths, cmf_values: Colour matching functions (X, Y, Z columns).
+        tile_rows: Number of image rows per tile.
+    Returns:
+        XYZ_original, XYZ_filtered: float32 (rows x cols x 3), scaled so the original's max Y is 1.
+        delta_e: float32 (rows x cols) CIEDE2000 map.
+        white: Reference white used for CIELAB.
+    """
+    hdr_image = spectral.open_image(hdr_path)
+    memmap = hdr_image.open_memmap(interleave='bip')
+    rows, cols, bands = memmap.shape
+    cube_wavelengths = np.array([float(w) for w in hdr_image.metadata['wavelength']])
+    matched_cmf = np.stack([np.interp(cube_wavelengths, cmf_wavelengths, cmf_values[:, i], left=0, right=0)
+                            for i in range(3)], axis=1)
+    projection = np.hstack([matched_cmf, matched_cmf * np.asarray(transmission)[:, None]]).astype(np.float32)
+
+    XYZ = np.empty((rows, cols, 6), dtype=np.float32)
+    for r0 in range(0, rows, tile_rows):
+        tile = np.asarray(memmap[r0:r0 + tile_rows], dtype=np.float32)
+        XYZ[r0:r0 + tile_rows] = radiance_to_xyz(tile, projection)
+    scale = 1.0 / (XYZ[..., 1].max() + 1e-12)
+    XYZ *= scale
+    XYZ_original, XYZ_filtered = XYZ[..., :3], XYZ[..., 3:]
+
+    # CIELAB and Delta E are evaluated tile-wise to bound the float32 temporaries
+    white = equal_energy_white(matched_cmf)
+    delta_e = np.empty((rows, cols), dtype=np.float32)
+    for r0 in range(0, rows, tile_rows):
+        delta_e[r0:r0 + tile_rows] = ciede2000(xyz_to_lab(XYZ_original[r0:r0 + tile_rows], white),
+                                                xyz_to_lab(XYZ_filtered[r0:r0 + tile_rows], white))
+    return XYZ_original, XYZ_filtered, delta_e, white
+
+def delta_e_summary(delta_e, percentiles=DELTA_E_PERCENTILES):
+    """Mean, max and percentiles of a Delta E map."""
+    summary = {"mean": float(delta_e.mean()), "max": float(delta_e.max())}
+    for q, value in zip(percentiles, np.percentile(delta_e, percentiles)):
+        summary[f"p{q}"] = float(value)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Colour difference between original and filtered renders.")
+    parser.add_argument("cubes", nargs="+", help="ENVI headers of unfiltered cubes")
+    parser.add_argument("--filter", required=True, help="Transmission curve (tools/filters/*.txt)")
+    parser.add_argument("--cmf", default=os.path.join("cmfs", "cmf_2.csv"))
+    parser.add_argument("--output", help="Folder for RGB renders and Delta E maps")
+    args = parser.parse_args()
+
+    import matplotlib.pyplot as plt
+    cmf_data = np.loadtxt(args.cmf, delimiter=",")
+    filter_wavelengths, filter_values = load_transmission_curve(args.filter)
+    filter_name = os.path.splitext(os.path.basename(args.filter))[0]
+    for hdr_path in args.cubes:
+        cube_wavelengths = np.array([float(w) for w in spectral.open_image(hdr_path).metadata['wavelength']])
+        transmission = np.interp(cube_wavelengths, filter_wavelengths, filter_values)
+        XYZ_original, XYZ_filtered, delta_e, _ = render_with_difference(hdr_path, transmission,
+                                                                          cmf_data[:, 0], cmf_data[:, 1:4])
+        summary = delta_e_summary(delta_e)
+        print(f"{hdr_path}: " + ", ".join(f"dE00 {k} = {v:.2f}" for k, v in summary.items()))
+
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+            stem = os.path.join(args.output, os.path.splitext(os.path.basename(hdr_path))[0])
+            for suffix, XYZ in (("rgb", XYZ_original), (f"{filter_name}_rgb", XYZ_filtered)):
+                plt.imsave(f"{stem}_{suffix}.png", xyz_to_srgb(np.clip(XYZ / XYZ.max(), 0, 1)))
+            np.save(f"{stem}_{filter_name}_dE00.npy", delta_e)
+
+if __name__ == "__main__":
+    main()
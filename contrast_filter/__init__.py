@@ -0,0 +1,32 @@
+"""
+Contrast evaluation of spectrally filtered hyperspectral images.
+
+Importing the package is cheap: names are grouped into loaders, spectral_ops, metrics and
+rendering, and each one imports its defining module (and that module's dependencies) only
+when first used, e.g. ``from contrast_filter.metrics import peli_contrast``.
+
+An installed distribution bundles the flat script modules as ``contrast_filter/_modules``
+(see pyproject.toml); that folder is put on ``sys.path`` so their plain imports of one another
+resolve without installing them as top-level modules.
+"""
+import importlib
+import os
+import sys
+
+_MODULES = os.path.join(os.path.dirname(__file__), "_modules")
+if os.path.isdir(_MODULES) and _MODULES not in sys.path:
+    sys.path.append(_MODULES)
+
+SUBMODULES = ("loaders", "spectral_ops", "metrics", "rendering")
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    for submodule in SUBMODULES:
+        module = importlib.import_module(f"{__name__}.{submodule}")
+        if name in module.__all__:
+            return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(SUBMODULES)
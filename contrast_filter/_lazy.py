@@ -0,0 +1,19 @@
+import importlib
+
+def lazy_exports(exports):
+    """
+    Module-level __getattr__/__dir__ that import the defining module on first attribute access.
+    Args:
+        exports: {public name: defining module}.
+    Returns:
+        (__getattr__, __dir__, __all__) for the calling module.
+    """
+    def __getattr__(name):
+        if name not in exports:
+            raise AttributeError(f"module has no attribute {name!r}")
+        return getattr(importlib.import_module(exports[name]), name)
+
+    def __dir__():
+        return sorted(exports)
+
+    return __getattr__, __dir__, sorted(exports)
@@ -0,0 +1,26 @@
+"""Cube, curve and image loaders."""
+from contrast_filter._lazy import lazy_exports
+
+__getattr__, __dir__, __all__ = lazy_exports({
+    "load_hyperspectral_image": "hsi2rgb",
+    "load_cmf_data": "hsi2rgb",
+    "load_illuminant_data": "hsi2rgb",
+    "load_transmission_curve": "apply_filter",
+    "save_transmission_curve": "apply_filter",
+    "load_luminance": "paired_eval",
+    "load_cube": "precision",
+    "save_cube": "precision",
+    "load_hdf5_cube": "precision",
+    "save_hdf5_cube": "precision",
+    "Prefetcher": "prefetch",
+    "envi_reader": "prefetch",
+    "envi_tile_items": "prefetch",
+    "envi_tile_reader": "prefetch",
+    "sidq_reader": "prefetch",
+    "image_reader": "prefetch",
+    "open_index": "cube_index",
+    "get_cube_stats": "cube_index",
+    "open_store": "metric_store",
+    "cached_metrics": "metric_store",
+    "load_metrics": "metric_store",
+})
@@ -0,0 +1,21 @@
+"""Global and local contrast metrics."""
+from contrast_filter._lazy import lazy_exports
+
+__getattr__, __dir__, __all__ = lazy_exports({
+    "GLOBAL_METRICS": "measurement",
+    "calculate_global_contrast": "measurement",
+    "luminance_contrast": "measurement",
+    "peli_contrast": "pelicontrast",
+    "peli_band_contrast": "pelicontrast",
+    "center_surround_response": "dogcontrast",
+    "dog_contrast_metrics": "dogcontrast",
+    "ahumada_beard_contrast": "cab_clb_contrast",
+    "iordache_contrast": "cab_clb_contrast",
+    "directional_energy": "gaborcontrast",
+    "wavelet_energy": "waveletcontrast",
+    "level_statistics": "waveletcontrast",
+    "ROIContrast": "roi_contrast",
+    "evaluate_group": "paired_eval",
+    "local_contrast_maps": "paired_eval",
+    "sweep_image": "param_sweep",
+})
@@ -0,0 +1,11 @@
+"""Rendering of cubes to RGB and the in-memory pipeline."""
+from contrast_filter._lazy import lazy_exports
+
+__getattr__, __dir__, __all__ = lazy_exports({
+    "convert_and_save_images": "hsi2rgb",
+    "process_hdr_file": "spectral2rgb",
+    "render_with_difference": "colordiff",
+    "render_quicklook": "quicklook",
+    "run_pipeline": "pipeline",
+    "load_config": "pipeline",
+})
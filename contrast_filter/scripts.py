@@ -0,0 +1,36 @@
+"""
+Console entry points: each runs the main() of a flat module (see [project.scripts] in pyproject.toml).
+Importing contrast_filter first makes the modules bundled with an installed package importable.
+"""
+import importlib
+
+def _main(module):
+    def run():
+        return importlib.import_module(module).main()
+    run.__name__ = module
+    return run
+
+apply_filter = _main("apply_filter")
+hsi2rgb = _main("hsi2rgb")
+spectral2rgb = _main("spectral2rgb")
+pipeline = _main("pipeline")
+colordiff = _main("colordiff")
+measurement = _main("measurement")
+paired_eval = _main("paired_eval")
+report = _main("report")
+roi_contrast = _main("roi_contrast")
+param_sweep = _main("param_sweep")
+optimize_filter = _main("optimize_filter")
+cube_index = _main("cube_index")
+quicklook = _main("quicklook")
+crop_image = _main("crop_image")
+benchmark = _main("benchmark")
+precision = _main("precision")
+ingest = _main("ingest")
+service = _main("service")
+shard = _main("shard")
+approximate = _main("approximate")
+transmission_field = _main("transmission_field")
+calibration = _main("calibration")
+local_metrics = _main("local_metrics")
+local_vis = _main("local_vis")
@@ -0,0 +1,18 @@
+"""Spectral operations: filter transmission, resampling and colour projection."""
+from contrast_filter._lazy import lazy_exports
+
+__getattr__, __dir__, __all__ = lazy_exports({
+    "apply_transmission": "apply_filter",
+    "match_transmission_to_cube": "apply_filter",
+    "TransmissionField": "transmission_field",
+    "load_filter": "transmission_field",
+    "IlluminationCache": "calibration",
+    "match_illuminant": "calibration",
+    "reflectance_gains": "calibration",
+    "relight_tile": "calibration",
+    "match_values_to_cube": "hsi2rgb",
+    "radiance_to_xyz": "hsi2rgb",
+    "xyz_to_srgb": "hsi2rgb",
+    "xyz_to_lab": "colordiff",
+    "ciede2000": "colordiff",
+})
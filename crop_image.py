@@ -1,27 +1,35 @@
 import cv2
 import os
+import csv
+import json
+import argparse
 import numpy as np
-import tkinter as tk
-from tkinter import filedialog
+from concurrent.futures import ThreadPoolExecutor
 import spectral
 
+from quicklook import cached_quicklook, to_full_resolution
+
 # Initialize global variables for cropping
 start_point = None
 end_point = None
 cropping = False
 cropped_img = None
 cropped_cube = None
+crop_origin = (0, 0)
+preview_stride = 1  # Cube pixels per displayed pixel (quick-look previews are subsampled)
 
 def select_image():
     """Opens a file dialog for the user to select an image."""
+    import tkinter as tk
+    from tkinter import filedialog
     root = tk.Tk()
     root.withdraw()  # Hide the root window
-    image_path = filedialog.askopenfilename(title="Select an Image")
+    image_path = filedialog.askopenfilename(title="Select an Image or HDR Cube")
     return image_path
 
 def crop_event(event, x, y, flags, param):
     """Handles the mouse events for selecting the cropping region."""
-    global start_point, end_point, cropping, cropped_img, cropped_cube
+    global start_point, end_point, cropping, cropped_img, cropped_cube, crop_origin
 
     if event == cv2.EVENT_LBUTTONDOWN:
         start_point = (x, y)
@@ -42,36 +50,122 @@ def crop_event(event, x, y, flags, param):
 
         if x_max > x_min and y_max > y_min:
             cropped_img = img[y_min:y_max, x_min:x_max]
-            cropped_cube = cube[y_min:y_max, x_min:x_max, :]
+            x0, y0, x1, y1 = to_full_resolution(x_min, y_min, x_max, y_max, preview_stride, cube.shape)
+            cropped_cube = cube[y0:y1, x0:x1, :]
+            crop_origin = (x0, y0)
             cv2.imshow("Cropped Image", cropped_img)
         else:
             print("Invalid crop area. Please try again.")
             cropped_img, cropped_cube = None, None
 
+def crop_metadata(hdr_metadata, x_min, y_min):
+    """Copy ENVI metadata for a crop starting at (x_min, y_min), keeping georeferencing consistent."""
+    metadata = hdr_metadata.copy()
+    # The crop is written as a new file without the source header offset
+    metadata.pop('header offset', None)
+    metadata['wavelength'] = hdr_metadata.get('wavelength')
+    if 'map info' in metadata:
+        # Move the tie point's pixel location so it still refers to the same map coordinate
+        map_info = list(metadata['map info'])
+        map_info[1] = str(float(map_info[1]) - x_min)
+        map_info[2] = str(float(map_info[2]) - y_min)
+        metadata['map info'] = map_info
+    for key, offset in (('x start', x_min), ('y start', y_min)):
+        metadata[key] = str(int(float(metadata.get(key, 0))) + offset)
+    return {k: v for k, v in metadata.items() if v is not None}
+
+def save_crop(save_path, cropped_cube, metadata):
+    """Saves a cropped spectral cube, replacing NaN values with zero."""
+    if cropped_cube.size == 0:
+        print("Warning: Cropped area is empty. Skipping save.")
+        return None
+    if np.isnan(cropped_cube).any():
+        print("Warning: NaN values found in cropped cube. Replacing with zero.")
+        cropped_cube = np.nan_to_num(cropped_cube, nan=0.0)
+    spectral.envi.save_image(save_path, cropped_cube, dtype=np.float32, metadata=metadata, force=True)
+    return save_path
+
 def save_cropped_cube(crop_folder, count, hdr_metadata):
     """Saves the cropped spectral cube in the specified folder with wavelength metadata."""
     global cropped_cube
     if cropped_cube is not None:
-        # Check if the cropped area is non-zero
-        if cropped_cube.size == 0:
-            print("Warning: Cropped area is empty. Skipping save.")
-            return
-
-        # Handle NaN values by replacing them with zero
-        if np.isnan(cropped_cube).any():
-            print("Warning: NaN values found in cropped cube. Replacing with zero.")
-            cropped_cube = np.nan_to_num(cropped_cube, nan=0.0)
-
-        # Prepare metadata and save path
         save_path = os.path.join(crop_folder, f"cropped_cube_{count}.hdr")
-        metadata = hdr_metadata.copy()
-        metadata['wavelength'] = hdr_metadata['wavelength']
-
-        # Save the cropped cube with updated metadata
-        spectral.envi.save_image(save_path, cropped_cube, dtype=np.float32, metadata=metadata)
-        print(f"Cropped spectral cube saved as: {save_path}")
-
-def main():
+        metadata = crop_metadata(hdr_metadata, crop_origin[0], crop_origin[1])
+        if save_crop(save_path, np.asarray(cropped_cube), metadata):
+            print(f"Cropped spectral cube saved as: {save_path}")
+
+def load_crop_spec(spec_path):
+    """
+    Load a batch crop specification.
+    JSON: [{"cube": "scene/capture/x.hdr", "label": "road", "rect": [x, y, width, height]}, ...]
+    CSV: columns cube, label, x, y, width, height.
+    Relative cube paths are resolved against the spec file's folder.
+    Entries are not validated here, so one malformed entry only fails its own crop.
+    """
+    if spec_path.endswith(".json"):
+        with open(spec_path) as f:
+            entries = json.load(f)
+    else:
+        with open(spec_path, newline="") as f:
+            entries = [{"cube": row.get("cube"), "label": row.get("label"),
+                        "rect": [row.get(k) for k in ("x", "y", "width", "height")]}
+                       for row in csv.DictReader(f)]
+    base_folder = os.path.dirname(os.path.abspath(spec_path))
+    for entry in entries:
+        if entry.get("cube"):
+            entry["cube"] = os.path.join(base_folder, entry["cube"])
+    return entries
+
+def crop_name(entry):
+    """Output file name of a batch crop: labels repeat across cubes, so the cube's stem is part of it."""
+    stem = os.path.splitext(os.path.basename(entry["cube"]))[0]
+    return f"{stem}_{entry['label']}.hdr"
+
+def crop_entry(entry, output_folder):
+    """Read one ROI through the cube's memory map and save it; only the ROI's rows and columns are read."""
+    x, y, width, height = (int(v) for v in entry["rect"])
+    hdr_info = spectral.envi.open(entry["cube"])
+    memmap = hdr_info.open_memmap(interleave='bip')
+    rows, cols, _ = memmap.shape
+    x_min, y_min = max(x, 0), max(y, 0)
+    x_max, y_max = min(x + width, cols), min(y + height, rows)
+    cropped = np.array(memmap[y_min:y_max, x_min:x_max, :])
+
+    save_path = os.path.join(output_folder, crop_name(entry))
+    return save_crop(save_path, cropped, crop_metadata(hdr_info.metadata, x_min, y_min))
+
+def batch_crop(spec_path, output_folder=None, workers=8):
+    """
+    Crop every (cube, ROI, label) entry of a spec file in parallel threads.
+    Entries that would write the same file are rejected up front; an entry that fails
+    is reported and skipped without stopping the others.
+    """
+    entries = load_crop_spec(spec_path)
+    output_folder = output_folder or os.path.join(os.path.dirname(os.path.abspath(spec_path)), "crop")
+    os.makedirs(output_folder, exist_ok=True)
+
+    names = {}
+    for index, entry in enumerate(entries):
+        if entry.get("cube") and entry.get("label"):
+            names.setdefault(crop_name(entry), []).append(index)
+    clashes = {name: indices for name, indices in names.items() if len(indices) > 1}
+    if clashes:
+        raise ValueError(f"Spec entries write the same crop: {clashes}")
+
+    def crop(indexed):
+        index, entry = indexed
+        try:
+            return crop_entry(entry, output_folder)
+        except Exception as error:
+            print(f"Error: entry {index} ({entry.get('cube')}, {entry.get('label')}): {error!r}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        saved = [path for path in pool.map(crop, enumerate(entries)) if path]
+    print(f"Saved {len(saved)}/{len(entries)} crops to {output_folder}")
+    return saved
+
+def interactive_crop():
     count = 1
     while True:
         image_path = select_image()
@@ -79,26 +173,33 @@ def main():
             print("No image selected. Exiting.")
             break
 
-        global img, cube
-
-        # Load the image
-        img = cv2.imread(image_path)
-        if img is None:
-            print("Error loading image. Try again.")
-            continue
-
-        # Find the HDR file in the 'capture' subfolder
-        base_folder = os.path.dirname(image_path)
-        hdr_folder = os.path.join(base_folder, "capture")
-        hdr_file = [f for f in os.listdir(hdr_folder) if f.endswith('.hdr')]
-        if not hdr_file:
-            print(f"No HDR file found in '{hdr_folder}'.")
-            continue
+        global img, cube, preview_stride
 
-        hdr_path = os.path.join(hdr_folder, hdr_file[0])
-        print(f"Loading HDR file: {hdr_path}")
+        if image_path.endswith('.hdr'):
+            # Preview the cube directly from a few memory-mapped bands
+            hdr_path = image_path
+            base_folder = os.path.dirname(hdr_path)
+            img, preview_stride = cached_quicklook(hdr_path)
+        else:
+            # Load the image
+            img = cv2.imread(image_path)
+            preview_stride = 1
+            if img is None:
+                print("Error loading image. Try again.")
+                continue
+
+            # Find the HDR file in the 'capture' subfolder
+            base_folder = os.path.dirname(image_path)
+            hdr_folder = os.path.join(base_folder, "capture")
+            hdr_file = [f for f in os.listdir(hdr_folder) if f.endswith('.hdr')]
+            if not hdr_file:
+                print(f"No HDR file found in '{hdr_folder}'.")
+                continue
+            hdr_path = os.path.join(hdr_folder, hdr_file[0])
+
+        print(f"Opening HDR file: {hdr_path}")
         hdr_info = spectral.envi.open(hdr_path)
-        cube = hdr_info.load()
+        cube = hdr_info.open_memmap(interleave='bip')  # Only cropped regions are read from disk
 
         hdr_metadata = hdr_info.metadata
 
@@ -123,5 +224,17 @@ def main():
                 cv2.destroyAllWindows()
                 return
 
+def main():
+    parser = argparse.ArgumentParser(description="Crop spectral cubes interactively or from a spec file.")
+    parser.add_argument("--spec", help="JSON/CSV list of (cube, label, ROI) entries for headless batch cropping")
+    parser.add_argument("--output", help="Output folder for batch crops (default: 'crop' next to the spec)")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.spec:
+        batch_crop(args.spec, args.output, args.workers)
+    else:
+        interactive_crop()
+
 if __name__ == "__main__":
     main()
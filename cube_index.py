@@ -0,0 +1,274 @@
+import os
+import time
+import hashlib
+import sqlite3
+import argparse
+import numpy as np
+
+PERCENTILES = (0.1, 1, 5, 25, 50, 75, 95, 99, 99.9)
+HIST_BINS = 256
+SAMPLE_BYTES = 1 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cubes (
+    path TEXT PRIMARY KEY,
+    scene TEXT,
+    variant TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    hdr_size INTEGER,
+    hdr_mtime_ns INTEGER,
+    fingerprint TEXT,
+    rows INTEGER,
+    cols INTEGER,
+    bands INTEGER,
+    dtype TEXT,
+    interleave TEXT,
+    wavelengths BLOB,
+    band_min BLOB,
+    band_max BLOB,
+    band_mean BLOB,
+    band_var BLOB,
+    y_min REAL,
+    y_max REAL,
+    y_mean REAL,
+    y_p1 REAL,
+    y_p50 REAL,
+    y_p99 REAL,
+    dynamic_range REAL,
+    y_percentiles BLOB,
+    y_hist BLOB,
+    y_hist_edges BLOB,
+    indexed_at REAL
+);
+CREATE INDEX IF NOT EXISTS cubes_scene ON cubes (scene, variant);
+"""
+
+ARRAY_COLUMNS = ("wavelengths", "band_min", "band_max", "band_mean", "band_var",
+                 "y_percentiles", "y_hist", "y_hist_edges")
+
+def open_index(db_path="cube_index.sqlite"):
+    """Open (and create if needed) the cube statistics index."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    # Indexes built before header states were recorded get the columns (their entries read as stale)
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(cubes)")}
+    for column in ("hdr_size", "hdr_mtime_ns"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE cubes ADD COLUMN {column} INTEGER")
+    return conn
+
+def data_file_path(hdr_path):
+    """Return the ENVI data file that belongs to a header."""
+    import spectral
+    return spectral.open_image(hdr_path).filename
+
+def file_fingerprint(path, sample_bytes=SAMPLE_BYTES):
+    """
+    Cheap content fingerprint of a (possibly multi-GB) file.
+    Hashes the size plus the first, middle and last sample_bytes instead of the whole file.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        for offset in sorted({0, max(0, size // 2 - sample_bytes // 2), max(0, size - sample_bytes)}):
+            f.seek(offset)
+            digest.update(f.read(sample_bytes))
+    return digest.hexdigest()
+
+def cube_fingerprint(hdr_path):
+    """Fingerprint of an ENVI header together with its data file."""
+    data_path = data_file_path(hdr_path)
+    return hashlib.sha1((file_fingerprint(hdr_path) + file_fingerprint(data_path)).encode()).hexdigest()
+
+def _file_state(hdr_path):
+    """
+    (size, mtime_ns, hdr_size, hdr_mtime_ns) of the data file and the header, used to detect
+    stale entries without hashing; header edits (wavelengths, gains, interleave) count too.
+    """
+    stat = os.stat(data_file_path(hdr_path))
+    hdr_stat = os.stat(hdr_path)
+    return stat.st_size, stat.st_mtime_ns, hdr_stat.st_size, hdr_stat.st_mtime_ns
+
+def has_data_file(hdr_path):
+    """True if the header's data file can be found."""
+    try:
+        return os.path.exists(data_file_path(hdr_path))
+    except Exception:
+        return False
+
+def _merge_moments(count, mean, m2, block):
+    """Merge a block (pixels x bands) into running per-band mean/M2 (Chan et al.)."""
+    n = block.shape[0]
+    block_mean = block.mean(axis=0)
+    block_m2 = ((block - block_mean) ** 2).sum(axis=0)
+    total = count + n
+    delta = block_mean - mean
+    mean = mean + delta * (n / total)
+    m2 = m2 + block_m2 + delta ** 2 * (count * n / total)
+    return total, mean, m2
+
+def compute_cube_stats(hdr_path, y_bar_wavelengths, y_bar_values, block_rows=64):
+    """
+    Compute compact summaries of a cube in one streaming pass over its rows.
+    Args:
+        hdr_path: Path to the ENVI header.
+        y_bar_wavelengths, y_bar_values: Luminance (Y-bar) weighting function.
+        block_rows: Number of image rows read per step.
+    Returns:
+        Dictionary of scalar and array statistics.
+    """
+    import spectral
+    hdr_image = spectral.open_image(hdr_path)
+    memmap = hdr_image.open_memmap(interleave='bip')
+    rows, cols, bands = memmap.shape
+    cube_wavelengths = np.array([float(w) for w in hdr_image.metadata.get('wavelength', range(bands))])
+    y_bar = np.interp(cube_wavelengths, y_bar_wavelengths, y_bar_values, left=0.0, right=0.0)
+
+    band_min = np.full(bands, np.inf)
+    band_max = np.full(bands, -np.inf)
+    count, mean, m2 = 0, np.zeros(bands), np.zeros(bands)
+    luminance = np.empty((rows, cols), dtype=np.float32)
+
+    for r0 in range(0, rows, block_rows):
+        block = np.asarray(memmap[r0:r0 + block_rows], dtype=np.float64).reshape(-1, bands)
+        np.minimum(band_min, block.min(axis=0), out=band_min)
+        np.maximum(band_max, block.max(axis=0), out=band_max)
+        count, mean, m2 = _merge_moments(count, mean, m2, block)
+        luminance[r0:r0 + block_rows] = (block @ y_bar).reshape(-1, cols)
+
+    # The luminance plane is bands-times smaller than the cube, so its exact statistics are cheap
+    percentiles = np.percentile(luminance, PERCENTILES)
+    hist, edges = np.histogram(luminance, bins=HIST_BINS)
+    p = dict(zip(PERCENTILES, percentiles))
+    return {
+        "rows": rows, "cols": cols, "bands": bands,
+        "dtype": str(memmap.dtype), "interleave": hdr_image.metadata.get('interleave', ''),
+        "wavelengths": cube_wavelengths, "band_min": band_min, "band_max": band_max,
+        "band_mean": mean, "band_var": m2 / max(count, 1),
+        "y_min": float(luminance.min()), "y_max": float(luminance.max()), "y_mean": float(luminance.mean()),
+        "y_p1": float(p[1]), "y_p50": float(p[50]), "y_p99": float(p[99]),
+        "dynamic_range": float(p[99] / max(p[1], 1e-12)),
+        "y_percentiles": percentiles, "y_hist": hist, "y_hist_edges": edges,
+    }
+
+def index_cube(conn, hdr_path, y_bar_wavelengths, y_bar_values, block_rows=64):
+    """Compute and store the statistics of one cube, replacing any previous entry."""
+    hdr_path = os.path.abspath(hdr_path)
+    size, mtime_ns, hdr_size, hdr_mtime_ns = _file_state(hdr_path)
+    stats = compute_cube_stats(hdr_path, y_bar_wavelengths, y_bar_values, block_rows)
+
+    # Scene folders are laid out as <scene>/<variant>/<cube>.hdr (variant: original, DBAMP, DBN)
+    variant_folder = os.path.dirname(hdr_path)
+    record = dict(stats, path=hdr_path, scene=os.path.basename(os.path.dirname(variant_folder)),
+                  variant=os.path.basename(variant_folder), size=size, mtime_ns=mtime_ns,
+                  hdr_size=hdr_size, hdr_mtime_ns=hdr_mtime_ns,
+                  fingerprint=cube_fingerprint(hdr_path), indexed_at=time.time())
+    for column in ARRAY_COLUMNS:
+        record[column] = np.asarray(record[column], dtype=np.float64).tobytes()
+
+    columns = ", ".join(record)
+    placeholders = ", ".join(f":{k}" for k in record)
+    conn.execute(f"INSERT OR REPLACE INTO cubes ({columns}) VALUES ({placeholders})", record)
+    conn.commit()
+
+def is_fresh(conn, hdr_path):
+    """True if the cube has an entry and neither its header nor its data file has changed since indexing."""
+    hdr_path = os.path.abspath(hdr_path)
+    row = conn.execute("SELECT size, mtime_ns, hdr_size, hdr_mtime_ns FROM cubes WHERE path = ?",
+                       (hdr_path,)).fetchone()
+    if row is None or not os.path.exists(hdr_path) or not has_data_file(hdr_path):
+        return False
+    return tuple(row) == _file_state(hdr_path)
+
+def update_index(conn, folder, cmf_file, block_rows=64):
+    """
+    Index every .hdr cube below folder, skipping entries that are still fresh.
+    Entries whose files have disappeared are removed.
+    """
+    cmf_data = np.loadtxt(cmf_file, delimiter=",")
+    seen = set()
+    for dirpath, _, files in os.walk(folder):
+        for file_name in sorted(files):
+            if not file_name.endswith(".hdr"):
+                continue
+            hdr_path = os.path.abspath(os.path.join(dirpath, file_name))
+            seen.add(hdr_path)
+            if is_fresh(conn, hdr_path):
+                continue
+            if not has_data_file(hdr_path):
+                print(f"Skipping (no data file): {hdr_path}")
+                continue
+            print(f"Indexing: {hdr_path}")
+            index_cube(conn, hdr_path, cmf_data[:, 0], cmf_data[:, 2], block_rows)
+
+    # A plain prefix comparison: LIKE would treat '_' and '%' in folder names as wildcards
+    prefix = os.path.join(os.path.abspath(folder), "")
+    for row in conn.execute("SELECT path FROM cubes WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)).fetchall():
+        if row["path"] not in seen:
+            conn.execute("DELETE FROM cubes WHERE path = ?", (row["path"],))
+    conn.commit()
+
+def _decode(row):
+    record = dict(row)
+    for column in ARRAY_COLUMNS:
+        record[column] = np.frombuffer(record[column], dtype=np.float64)
+    return record
+
+def get_cube_stats(conn, hdr_path, check_fresh=True):
+    """Return the stored statistics of a cube, or None if it is missing or stale."""
+    hdr_path = os.path.abspath(hdr_path)
+    if check_fresh and not is_fresh(conn, hdr_path):
+        return None
+    row = conn.execute("SELECT * FROM cubes WHERE path = ?", (hdr_path,)).fetchone()
+    return _decode(row) if row is not None else None
+
+def indexed_band_max(hdr_path, db_path="cube_index.sqlite"):
+    """
+    Per-band maxima of a cube's stored values from a fresh index entry, or None when there is no
+    index, no entry or a stale one. Lets writers choose storage gains without re-reading the cube.
+    """
+    if not os.path.exists(db_path):
+        return None
+    conn = open_index(db_path)
+    try:
+        stats = get_cube_stats(conn, hdr_path)
+    finally:
+        conn.close()
+    return None if stats is None else stats["band_max"]
+
+def query(conn, where="1", params=(), order_by="path", limit=None):
+    """
+    Query decoded index entries, e.g. query(conn, "scene = ? AND variant = ?", ("Trails", "DBAMP")).
+    """
+    sql = f"SELECT * FROM cubes WHERE {where} ORDER BY {order_by}"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    return [_decode(row) for row in conn.execute(sql, params)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the per-cube statistics index.")
+    parser.add_argument("--db", default="cube_index.sqlite")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Index all cubes below a folder")
+    build.add_argument("folder")
+    build.add_argument("--cmf", default=os.path.join("cmfs", "cmf_2.csv"))
+    build.add_argument("--block-rows", type=int, default=64)
+    search = subparsers.add_parser("query", help="List cubes matching an SQL condition")
+    search.add_argument("where", nargs="?", default="1")
+    search.add_argument("--order-by", default="dynamic_range DESC")
+    search.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = open_index(args.db)
+    if args.command == "build":
+        update_index(conn, args.folder, args.cmf, args.block_rows)
+    else:
+        columns = ["scene", "variant", "rows", "cols", "bands", "y_max", "y_mean", "dynamic_range"]
+        sql = f"SELECT path, {', '.join(columns)} FROM cubes WHERE {args.where} ORDER BY {args.order_by} LIMIT ?"
+        for row in conn.execute(sql, (args.limit,)):
+            print(", ".join(f"{k}={row[k]}" for k in ["path"] + columns))
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 import numpy as np
 import cv2
-import matplotlib.pyplot as plt
 
 def center_surround_response(image, rc, rs):
     """
@@ -72,6 +71,7 @@ def visualize_dog_contrast(image_path, rc=2, rs=5):
         rc: Radius for center Gaussian.
         rs: Radius for surround Gaussian.
     """
+    import matplotlib.pyplot as plt
     # Load image and convert to grayscale
     image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
     if image is None:
@@ -111,6 +111,7 @@ def visualize_dog_contrast(image_path, rc=2, rs=5):
     plt.tight_layout()
     plt.show()
 
-# Example Usage
-image_path = "lena.png"  # Replace with your image path
-visualize_dog_contrast(image_path, rc=2, rs=5)
+if __name__ == "__main__":
+    # Example Usage
+    image_path = "lena.png"  # Replace with your image path
+    visualize_dog_contrast(image_path, rc=2, rs=5)
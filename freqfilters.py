@@ -0,0 +1,121 @@
+import threading
+import numpy as np
+from collections import OrderedDict
+from functools import lru_cache, wraps
+
+def pad_plan(shape, max_sigma, truncate=4.0):
+    """
+    Padding and FFT size for filtering a plane with Gaussians up to max_sigma.
+    Reflective padding of truncate * max_sigma keeps the circular FFT convolution
+    close to the reflect-mode spatial filters used elsewhere.
+    Returns:
+        pad: Padding added on every side.
+        fft_shape: Padded shape rounded up to fast FFT lengths.
+    """
+    return fft_plan(shape, int(np.ceil(truncate * max_sigma)) + 1)
+
+def fft_plan(shape, pad):
+    """
+    Plan for a plane padded by pad pixels on every side.
+    Padded planes are rounded up to fast FFT lengths; the zeros this appends lie beyond the
+    reflective padding. pad=0 keeps the plane's own shape, so filtering is exactly circular.
+    """
+    from scipy import fft
+    if pad == 0:
+        return 0, tuple(shape)
+    fft_shape = tuple(fft.next_fast_len(n + 2 * pad, real=True) for n in shape)
+    return pad, fft_shape
+
+def forward(image, plan, half=True):
+    """FFT of a reflect-padded float32 plane; half=True stores only the real-FFT half spectrum."""
+    from scipy import fft
+    pad, fft_shape = plan
+    padded = np.asarray(image, dtype=np.float32)
+    if pad:
+        padded = np.pad(padded, pad, mode='symmetric')
+    if half:
+        return fft.rfft2(padded, s=fft_shape, workers=-1)
+    return fft.fft2(padded, s=fft_shape, workers=-1)
+
+def inverse(spectrum, plan, shape, half=True):
+    """Inverse of forward, cropped back to the original plane."""
+    from scipy import fft
+    pad, fft_shape = plan
+    if half:
+        spatial = fft.irfft2(spectrum, s=fft_shape, workers=-1)
+    else:
+        spatial = fft.ifft2(spectrum, s=fft_shape, workers=-1).real
+    return spatial[pad:pad + shape[0], pad:pad + shape[1]].astype(np.float32)
+
+@lru_cache(maxsize=64)
+def frequency_grid(fft_shape, half=True):
+    """Vertical and horizontal frequencies (cycles/pixel) of a half or full spectrum."""
+    from scipy import fft
+    fy = fft.fftfreq(fft_shape[0]).astype(np.float32)[:, None]
+    fx = (fft.rfftfreq if half else fft.fftfreq)(fft_shape[1]).astype(np.float32)[None, :]
+    return fy, fx
+
+@lru_cache(maxsize=128)
+def gaussian_transfer(fft_shape, sigma):
+    """Frequency response of a unit-sum Gaussian with standard deviation sigma (pixels)."""
+    fy, fx = frequency_grid(fft_shape)
+    return np.exp(-2.0 * (np.pi * sigma) ** 2 * (fy ** 2 + fx ** 2)).astype(np.float32)
+
+@lru_cache(maxsize=32)
+def _kernel_transfer(fft_shape, kernel_bytes, kernel_shape):
+    from scipy import fft
+    kernel = np.frombuffer(kernel_bytes, dtype=np.float64).reshape(kernel_shape)
+    # Centre the kernel on the origin so the response has no phase shift
+    placed = np.zeros(fft_shape, dtype=np.float64)
+    placed[:kernel_shape[0], :kernel_shape[1]] = kernel
+    placed = np.roll(placed, (-(kernel_shape[0] // 2), -(kernel_shape[1] // 2)), axis=(0, 1))
+    return fft.rfft2(placed).astype(np.complex64)
+
+def kernel_transfer(fft_shape, kernel):
+    """Frequency response of a small spatial kernel (cached by kernel contents)."""
+    kernel = np.ascontiguousarray(kernel, dtype=np.float64)
+    return _kernel_transfer(fft_shape, kernel.tobytes(), kernel.shape)
+
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+    return 0
+
+def bank_cache(max_bytes):
+    """
+    Least-recently-used cache for filter banks, bounded by the bytes of the cached arrays rather
+    than by their count (a full-resolution bank can be hundreds of MB). A result larger than
+    max_bytes is returned without being kept. Like lru_cache, callers must not modify the result.
+    """
+    def decorator(function):
+        entries, lock = OrderedDict(), threading.Lock()
+        used = [0]
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            key = args + tuple(sorted(kwargs.items()))
+            with lock:
+                if key in entries:
+                    entries.move_to_end(key)
+                    return entries[key][0]
+            result = function(*args, **kwargs)
+            size = _nbytes(result)
+            if size <= max_bytes:
+                with lock:
+                    if key not in entries:
+                        entries[key] = (result, size)
+                        used[0] += size
+                    while used[0] > max_bytes:
+                        used[0] -= entries.popitem(last=False)[1][1]
+            return result
+
+        def cache_clear():
+            with lock:
+                entries.clear()
+                used[0] = 0
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
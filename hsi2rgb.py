@@ -1,21 +1,17 @@
 import numpy as np
 import spectral
-import matplotlib.pyplot as plt
-from scipy.interpolate import interp1d
 import os
-from tkinter import Tk
-from tkinter import filedialog
-import pandas as pd
 
 # Function to load the hyperspectral image
-def load_hyperspectral_image(file_path):
-    hdr_image = spectral.open_image(file_path)
-    cube = hdr_image.load()
+def load_hyperspectral_image(file_path, dtype=np.float32):
+    from precision import load_cube
+    cube = load_cube(file_path, dtype)  # applies any data gain, keeps dtype
     cube = cube / cube.max()
     return cube
 
 def load_illuminant_data(file_path):
     """Load wavelength and single value column from an illuminant CSV file."""
+    import pandas as pd
     df = pd.read_csv(file_path)
     wavelengths = df.iloc[:, 0].values  # First column for wavelengths
     values = df.iloc[:, 1].values       # Second column for illuminant values
@@ -23,6 +19,7 @@ def load_illuminant_data(file_path):
 
 def load_cmf_data(file_path):
     """Load wavelength and X, Y, Z values from a CMF CSV file."""
+    import pandas as pd
     df = pd.read_csv(file_path)
     wavelengths = df.iloc[:, 0].values      # First column for wavelengths
     cmf_values = df.iloc[:, 1:4].values     # Columns 1, 2, 3 for X, Y, Z values
@@ -38,16 +35,39 @@ def xyz_to_srgb(XYZ):
 
 def match_values_to_cube(cube_wavelengths, target_wavelengths, target_values):
     """Interpolate target values to match cube wavelengths."""
+    from scipy.interpolate import interp1d
     interpolation_func = interp1d(target_wavelengths, target_values, kind='linear', fill_value="extrapolate", axis=0)
     return interpolation_func(cube_wavelengths)
 
+# Function to project radiance (rows x cols x bands) onto matched CMFs
+def radiance_to_xyz(radiance, matched_cmf):
+    r, c, w = radiance.shape
+    radiance_flat = radiance.reshape((r * c, w))
+    XYZ_flat = np.dot(radiance_flat, matched_cmf)  # Result is (r * c, 3)
+    return XYZ_flat.reshape((r, c, -1))  # Reshape back to (r, c, 3)
+
 # Function to convert and save RGB images
-def convert_and_save_images(folder_path, cmf_file):
+def convert_and_save_images(folder_path, cmf_file, illuminant_file=None, cache_path=None):
+    """
+    Render every cube below folder_path to sRGB.
+    With an illuminant (a tools/sources spectrum or an illuminant CSV) the cubes are relit: cubes
+    with an illumination estimate in the calibration cache are converted to reflectance first,
+    others are taken to be reflectance already.
+    """
     # Load illuminant and CMF data
+    import matplotlib.pyplot as plt
     cmf_wavelengths, cmf_values = load_cmf_data(cmf_file)
+    illuminant, cache = None, None
+    if illuminant_file:
+        from calibration import DEFAULT_CALIBRATION, IlluminationCache, load_illuminant
+        illuminant = load_illuminant(illuminant_file)
+        cache_path = cache_path or DEFAULT_CALIBRATION["cache"]
+        cache = IlluminationCache(cache_path) if os.path.exists(cache_path) else None
 
     # Create the output directory with illuminant and CMF info
     cmf_name = os.path.splitext(os.path.basename(cmf_file))[0]
+    if illuminant_file:
+        cmf_name = f"{os.path.splitext(os.path.basename(illuminant_file))[0]}_{cmf_name}"
     output_root = os.path.join(os.path.dirname(folder_path), f'rgb_{cmf_name}')
     os.makedirs(output_root, exist_ok=True)
 
@@ -64,12 +84,16 @@ def convert_and_save_images(folder_path, cmf_file):
 
                 # Match illuminant and CMF values to the cube's wavelengths
                 matched_cmf = match_values_to_cube(cube_wavelengths, cmf_wavelengths, cmf_values)
+                if illuminant is not None:
+                    from calibration import match_illuminant, reflectance_gains
+                    gains = match_illuminant(cube_wavelengths, illuminant, (cmf_wavelengths, cmf_values))
+                    estimate = cache.lookup(file_path) if cache is not None else None
+                    if estimate is not None:
+                        gains = gains * reflectance_gains(np.interp(cube_wavelengths, *estimate))
+                    matched_cmf = matched_cmf * gains[:, None]
 
                 # Transform Radiance to CIE XYZ
-                r, c, w = radiance.shape
-                radiance_flat = radiance.reshape((r * c, w))
-                XYZ_flat = np.dot(radiance_flat, matched_cmf)  # Result is (r * c, 3)
-                XYZ = XYZ_flat.reshape((r, c, 3))  # Reshape back to (r, c, 3)
+                XYZ = radiance_to_xyz(radiance, matched_cmf)
                 XYZ = np.clip(XYZ / np.max(XYZ), 0, 1)
 
                 # Convert XYZ to sRGB
@@ -92,11 +116,13 @@ def convert_and_save_images(folder_path, cmf_file):
 
 # Main code to select folder and convert images
 def main():
+    from tkinter import Tk, filedialog
     Tk().withdraw()  # Hides the root window
     folder_path = filedialog.askdirectory(title='Select Folder with HDR Images')
 
     # Select illuminant file
-    illuminant_file = filedialog.askopenfilename(title="Select Illuminant CSV File", filetypes=[("CSV files", "*.csv")])
+    illuminant_file = filedialog.askopenfilename(title="Select Illuminant File", initialdir=os.path.join("tools", "sources"),
+                                                 filetypes=[("Illuminant files", "*.txt *.csv")])
     if not illuminant_file:
         print("No illuminant file selected. Exiting.")
         return
@@ -107,7 +133,7 @@ def main():
         print("No CMF file selected. Exiting.")
         return
 
-    convert_and_save_images(folder_path, illuminant_file, cmf_file)
+    convert_and_save_images(folder_path, cmf_file, illuminant_file)
 
 if __name__ == "__main__":
     main()
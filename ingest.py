@@ -0,0 +1,320 @@
+import os
+import sys
+import csv
+import json
+import time
+import queue
+import argparse
+import threading
+import traceback
+from typing import NamedTuple
+import numpy as np
+
+import instrument
+
+WATCHED_FOLDERS = ("original", "capture")
+DATA_EXTENSIONS = (".raw", ".img", ".dat", ".bil", ".bip", ".bsq", "")
+TEMPORARY_SUFFIXES = (".tmp", ".part", ".partial", ".crdownload", "~")
+
+class Capture(NamedTuple):
+    """A complete .hdr/data pair found by the scanner."""
+    hdr_path: str
+    data_path: str
+    signature: tuple     # (inode, size, mtime_ns) of the header and of the data file
+    landed: float        # modification time of the newer file: when the capture finished writing
+    detected: float      # when the scanner found it complete
+
+def is_temporary(name):
+    """Names that writers use before an atomic rename (hidden files, .tmp/.part suffixes)."""
+    return name.startswith(".") or name.lower().endswith(TEMPORARY_SUFFIXES)
+
+def find_data_file(hdr_path):
+    """The data file next to a header (same stem, usual ENVI extensions), or None while it is missing."""
+    stem = os.path.splitext(hdr_path)[0]
+    for extension in DATA_EXTENSIONS:
+        for candidate in (stem + extension, stem + extension.upper()):
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+def expected_size(hdr_path):
+    """
+    Data file size the header describes, or None when the header is incomplete (still being
+    written) or does not describe a plain cube.
+    """
+    from spectral.io import envi
+    try:
+        header = envi.read_envi_header(hdr_path)
+        dtype = np.dtype(envi.envi_to_dtype[str(header["data type"])])
+        cells = int(header["lines"]) * int(header["samples"]) * int(header["bands"])
+        return cells * dtype.itemsize + int(header.get("header offset", 0))
+    except Exception:
+        return None
+
+def is_below(path, folders):
+    """Whether path is one of folders or lies anywhere below one of them."""
+    path = os.path.realpath(path)
+    return any(os.path.commonpath([path, folder]) == folder for folder in folders)
+
+def find_watch_folders(roots, names=WATCHED_FOLDERS, exclude=()):
+    """
+    Folders called original or capture below the roots (a root with such a name is included).
+    Folders in exclude and everything below them are skipped, e.g. the pipeline's own output
+    folder, whose output/original/ holds copies of the cubes rather than new captures.
+    """
+    exclude = [os.path.realpath(folder) for folder in exclude]
+    folders = set()
+    for root in roots:
+        if is_below(root, exclude):
+            continue
+        if os.path.basename(os.path.normpath(root)) in names:
+            folders.add(root)
+        for folder, subfolders, _ in os.walk(root):
+            subfolders[:] = [name for name in subfolders if not is_below(os.path.join(folder, name), exclude)]
+            folders.update(os.path.join(folder, name) for name in subfolders if name in names)
+    return sorted(folders)
+
+class CaptureScanner:
+    """
+    Polls the watch folders for capture pairs that are complete.
+    A pair is complete when the header parses, the data file has the size the header
+    describes, and neither file changed for settle seconds. Temporary names are ignored, so
+    captures written elsewhere and renamed into place are picked up on the first poll.
+    A capture is reported once per signature: rewriting or replacing it reports it again.
+    Args:
+        roots: Scene folders or data roots; watch folders are rediscovered every rescan seconds.
+        settle: Seconds both files must be unchanged.
+        done: {hdr_path: signature} of captures that need no processing (e.g. from a previous run).
+        exclude: Folders never watched, with everything below them.
+    """
+
+    def __init__(self, roots, settle=1.0, rescan=30.0, done=None, exclude=()):
+        self.roots = roots
+        self.exclude = exclude
+        self.settle = settle
+        self.rescan = rescan
+        self.done = dict(done or {})
+        self._folders = []
+        self._scanned_at = -np.inf
+
+    def folders(self, now):
+        if now - self._scanned_at >= self.rescan:
+            self._folders = find_watch_folders(self.roots, exclude=self.exclude)
+            self._scanned_at = now
+        return self._folders
+
+    def poll(self, now=None):
+        """Captures that became complete since the last poll, oldest first."""
+        now = time.time() if now is None else now
+        ready = []
+        for folder in self.folders(now):
+            try:
+                names = os.listdir(folder)
+            except FileNotFoundError:
+                continue
+            for name in names:
+                if not name.lower().endswith(".hdr") or is_temporary(name):
+                    continue
+                capture = self.check(os.path.join(folder, name), now)
+                if capture is not None:
+                    ready.append(capture)
+        return sorted(ready, key=lambda capture: capture.landed)
+
+    def check(self, hdr_path, now):
+        """The Capture of hdr_path if it is complete and not done yet, else None."""
+        data_path = find_data_file(hdr_path)
+        if data_path is None:
+            return None
+        try:
+            stats = (os.stat(hdr_path), os.stat(data_path))
+        except FileNotFoundError:
+            return None
+        signature = tuple((s.st_ino, s.st_size, s.st_mtime_ns) for s in stats)
+        if self.done.get(hdr_path) == signature:
+            return None
+        landed = max(s.st_mtime for s in stats)
+        if now - landed < self.settle:
+            return None
+        size = expected_size(hdr_path)
+        if size is None or stats[1].st_size < size:
+            return None
+        self.done[hdr_path] = signature
+        return Capture(hdr_path, data_path, signature, landed, now)
+
+def read_latency_log(latency_path):
+    """{hdr_path: signature} of the captures a previous run processed successfully."""
+    done = {}
+    if latency_path and os.path.exists(latency_path):
+        with open(latency_path) as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("error") is None:
+                    done[record["cube"]] = tuple(tuple(s) for s in record["signature"])
+    return done
+
+def latency_summary(records):
+    """Percentiles of the end-to-end latency (capture landed -> metrics written) in seconds."""
+    latencies = np.array([r["latency_seconds"] for r in records if r["error"] is None])
+    if latencies.size == 0:
+        return {"captures": 0}
+    return {"captures": int(latencies.size), "p50": float(np.percentile(latencies, 50)),
+            "p95": float(np.percentile(latencies, 95)), "max": float(latencies.max())}
+
+class IngestDaemon:
+    """
+    Long-running ingest: new captures go through filter -> render -> metrics as they land.
+    The scanner feeds a bounded queue consumed by worker threads; when the workers fall
+    behind, the scanner waits instead of piling captures up in memory. CMFs, filter curves,
+    transmissions resampled to each wavelength grid and the metric FFT kernels stay loaded
+    between captures.
+    Args:
+        config: pipeline config (see pipeline.DEFAULT_CONFIG); its cubes entry is ignored. Its trace
+                and prometheus paths configure the process-wide tracer (via pipeline.load_resources).
+        roots: Folders to watch.
+        results: CSV the metric rows of every capture are appended to.
+        latency_path: JSON-lines log with one record per capture (also read on start-up so
+                      captures processed by an earlier run are skipped).
+        queue_size: Captures waiting for a worker at most.
+    """
+
+    def __init__(self, config, roots, results="ingest_metrics.csv", latency_path="ingest_latency.jsonl",
+                 queue_size=4, workers=1, poll=0.5, settle=1.0, rescan=30.0):
+        from pipeline import load_resources
+        self.config = config
+        self.resources = load_resources(config)
+        self.results = results
+        self.latency_path = latency_path
+        # The pipeline writes persisted cubes to <output>/original/ etc., which must not be re-ingested
+        self.scanner = CaptureScanner(roots, settle, rescan, read_latency_log(latency_path),
+                                      exclude=[config["output"]])
+        self.queue = queue.Queue(queue_size)
+        self.workers = workers
+        self.poll_interval = poll
+        self.records = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def stop(self):
+        self._stop.set()
+
+    def submit(self, capture):
+        """Queue a capture, waiting while the queue is full. False if the daemon stopped meanwhile."""
+        while not self._stop.is_set():
+            try:
+                self.queue.put(capture, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def process(self, capture):
+        """Process one capture and record its metric rows and latency."""
+        from pipeline import process_cube
+        started = time.time()
+        rows, error = [], None
+        try:
+            with instrument.stage("ingest", capture.hdr_path):
+                rows = process_cube(self.config, self.resources, capture.hdr_path)
+        except Exception:
+            # Keep the daemon alive; the capture is retried if it is rewritten or on restart
+            print(f"Error processing {capture.hdr_path}:", file=sys.stderr)
+            traceback.print_exc()
+            error = traceback.format_exc(limit=1).strip().splitlines()[-1]
+        finished = time.time()
+        record = {"cube": capture.hdr_path, "signature": capture.signature, "landed": capture.landed,
+                  "detected": capture.detected, "started": started, "finished": finished,
+                  "detect_seconds": capture.detected - capture.landed,
+                  "queue_seconds": started - capture.detected, "process_seconds": finished - started,
+                  "latency_seconds": finished - capture.landed, "error": error}
+        with self._lock:
+            self.append_rows(rows)
+            if self.latency_path:
+                with open(self.latency_path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+            self.records.append(record)
+            instrument.get_tracer().write_prometheus()
+        status = "failed" if error else f"{len(rows)} rows"
+        print(f"Ingested: {capture.hdr_path} ({status}) latency {record['latency_seconds']:.2f} s "
+              f"[detect {record['detect_seconds']:.2f}, queue {record['queue_seconds']:.2f}, "
+              f"process {record['process_seconds']:.2f}]")
+        return record
+
+    def append_rows(self, rows):
+        if not rows:
+            return
+        new_file = not os.path.exists(self.results) or os.path.getsize(self.results) == 0
+        with open(self.results, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+
+    def work(self):
+        while True:
+            capture = self.queue.get()
+            if capture is None:
+                return
+            self.process(capture)
+
+    def run(self, once=False):
+        """
+        Scan and process until stop() (or Ctrl-C). With once, process the captures that are
+        complete now and return. Returns the latency records of this run.
+        """
+        threads = [threading.Thread(target=self.work, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        print(f"Watching: {', '.join(self.scanner.folders(time.time())) or 'no capture folders yet'}")
+        try:
+            while not self._stop.is_set():
+                for capture in self.scanner.poll():
+                    if not self.submit(capture):
+                        break
+                if once:
+                    break
+                self._stop.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            print("Stopping after the captures in progress.")
+            self._stop.set()
+            # Queued captures are not logged, so a restart picks them up again
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+        for _ in threads:
+            self.queue.put(None)
+        for thread in threads:
+            thread.join()
+        return self.records
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch capture folders and score new cubes as they land.")
+    parser.add_argument("roots", nargs="+", help="Scene folders or data roots containing original/ or capture/")
+    parser.add_argument("--config", help="pipeline JSON config (filters, metrics, persist, precision...)")
+    parser.add_argument("--results", default="ingest_metrics.csv")
+    parser.add_argument("--latency", default="ingest_latency.jsonl", help="Per-capture latency log")
+    parser.add_argument("--queue", type=int, default=4, help="Captures waiting for a worker at most")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--poll", type=float, default=0.5, help="Seconds between scans")
+    parser.add_argument("--settle", type=float, default=1.0, help="Seconds a capture must be unchanged")
+    parser.add_argument("--once", action="store_true", help="Process the complete captures and exit")
+    parser.add_argument("--trace", help="JSON-lines stage trace (overrides the config)")
+    parser.add_argument("--prometheus", help="Prometheus text file with per-stage totals, rewritten after "
+                                             "every capture (overrides the config)")
+    args = parser.parse_args()
+
+    from pipeline import load_config
+    config = load_config(args.config, trace=args.trace, prometheus=args.prometheus)
+    daemon = IngestDaemon(config, args.roots, args.results, args.latency, args.queue, args.workers,
+                          args.poll, args.settle)
+    records = daemon.run(once=args.once)
+    summary = latency_summary(records)
+    if summary["captures"]:
+        print(f"Ingested {summary['captures']} captures: latency p50 {summary['p50']:.2f} s, "
+              f"p95 {summary['p95']:.2f} s, max {summary['max']:.2f} s")
+    if any(r["error"] for r in records):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
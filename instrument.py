@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRIC_PREFIX = "contrast"
+
+def peak_rss():
+    """Peak resident set size of this process in bytes (0 where unavailable)."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class StageRecord:
+    """
+    Measurements of one stage run on one file; becomes one line of the JSON trace.
+    parent names the enclosing stage of a nested span (None at the top level). process_peak_rss
+    is the process's peak resident set size when the stage ended: the peak so far, not the stage's own.
+    """
+
+    def __init__(self, stage, file=None, parent=None):
+        self.stage = stage
+        self.file = file
+        self.parent = parent
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.large_allocations = []
+        self.error = None
+        self.wall_seconds = self.cpu_seconds = 0.0
+        self.process_peak_rss = 0
+
+    def add_bytes(self, read=0, written=0):
+        self.bytes_read += int(read)
+        self.bytes_written += int(written)
+
+    def as_dict(self):
+        return {"stage": self.stage, "parent": self.parent, "file": self.file, "wall_seconds": self.wall_seconds,
+                "cpu_seconds": self.cpu_seconds, "bytes_read": self.bytes_read,
+                "bytes_written": self.bytes_written, "process_peak_rss_bytes": self.process_peak_rss,
+                "large_allocations": self.large_allocations, "error": self.error}
+
+class Tracer:
+    """
+    Per-stage, per-file timings, bytes moved and memory, exported as a JSON-lines trace and a
+    Prometheus text file (for node_exporter's textfile collector).
+    Stages opened inside another stage are sub-stages: their time is also part of the enclosing
+    stage, so they are totalled separately (per parent) and top-level totals count time once.
+    Args:
+        trace_path: JSON-lines file appended with one record per stage run (None: not written).
+        prometheus_path: Prometheus text file rewritten by write_prometheus (None: not written).
+        allocation_threshold: With track_allocations, report allocation sites holding at least
+                              this many bytes at the end of a stage.
+        track_allocations: Trace allocations with tracemalloc (numpy reports its buffers to it);
+                           slows everything down, so off by default.
+    """
+
+    def __init__(self, trace_path=None, prometheus_path=None, allocation_threshold=64 * 2 ** 20,
+                 track_allocations=False):
+        self.trace_path = trace_path
+        self.prometheus_path = prometheus_path
+        self.allocation_threshold = allocation_threshold
+        self.track_allocations = track_allocations
+        self.totals = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if track_allocations:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @property
+    def current(self):
+        """Innermost running stage of this thread (None outside stages)."""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def stage(self, name, file=None):
+        """Measure the enclosed block as stage name on file; errors are recorded and re-raised."""
+        stack = self._stack()
+        record = StageRecord(name, file, stack[-1].stage if stack else None)
+        stack.append(record)
+        if self.track_allocations:
+            import tracemalloc
+            before = tracemalloc.take_snapshot()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        except BaseException as e:
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record.wall_seconds = time.perf_counter() - wall
+            record.cpu_seconds = time.process_time() - cpu
+            record.process_peak_rss = peak_rss()
+            if self.track_allocations:
+                record.large_allocations = self._large_allocations(before)
+            stack.pop()
+            self._finish(record)
+
+    def _large_allocations(self, before):
+        import tracemalloc
+        growth = tracemalloc.take_snapshot().compare_to(before, "lineno")
+        return [{"site": str(stat.traceback), "bytes": stat.size_diff}
+                for stat in growth if stat.size_diff >= self.allocation_threshold]
+
+    def _finish(self, record):
+        with self._lock:
+            totals = self.totals.setdefault((record.stage, record.parent), Counter())
+            totals.update(calls=1, errors=int(record.error is not None), wall_seconds=record.wall_seconds,
+                          cpu_seconds=record.cpu_seconds, bytes_read=record.bytes_read,
+                          bytes_written=record.bytes_written)
+            if self.trace_path:
+                with open(self.trace_path, "a") as f:
+                    f.write(json.dumps(dict(record.as_dict(), timestamp=time.time())) + "\n")
+
+    def add_bytes(self, read=0, written=0):
+        """
+        Attribute bytes read/written to the running stages of this thread: the innermost one and
+        the stages enclosing it, like their time.
+        """
+        for record in self._stack():
+            record.add_bytes(read, written)
+
+    def write_prometheus(self, path=None):
+        """
+        Write per-stage totals in the Prometheus text exposition format (atomically).
+        Top-level stages go to contrast_stage_*_total{stage}, nested ones to
+        contrast_substage_*_total{stage, parent}, so summing a stage series never counts time twice.
+        """
+        path = path or self.prometheus_path
+        if not path:
+            return
+        series = [("calls", "counter", "Stage runs"), ("errors", "counter", "Stage runs that raised"),
+                  ("wall_seconds", "counter", "Wall-clock time in stage"),
+                  ("cpu_seconds", "counter", "Process CPU time in stage"),
+                  ("bytes_read", "counter", "Bytes read in stage"),
+                  ("bytes_written", "counter", "Bytes written in stage")]
+        lines = []
+        with self._lock:
+            stages = sorted((k, v) for k, v in self.totals.items() if k[1] is None)
+            substages = sorted((k, v) for k, v in self.totals.items() if k[1] is not None)
+            for key, kind, help_text in series:
+                metric = f"{METRIC_PREFIX}_stage_{key}_total"
+                lines += [f"# HELP {metric} {help_text}.", f"# TYPE {metric} {kind}"]
+                lines += [f'{metric}{{stage="{stage}"}} {totals[key]:g}' for (stage, _), totals in stages]
+            for key, kind, help_text in series if substages else ():
+                metric = f"{METRIC_PREFIX}_substage_{key}_total"
+                lines += [f"# HELP {metric} {help_text} (nested stage, included in its parent).",
+                          f"# TYPE {metric} {kind}"]
+                lines += [f'{metric}{{stage="{stage}",parent="{parent}"}} {totals[key]:g}'
+                          for (stage, parent), totals in substages]
+        lines += [f"# HELP {METRIC_PREFIX}_peak_rss_bytes Peak resident set size of the process so far.",
+                  f"# TYPE {METRIC_PREFIX}_peak_rss_bytes gauge", f"{METRIC_PREFIX}_peak_rss_bytes {peak_rss()}"]
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, path)
+
+_tracer = Tracer()
+
+def configure(**kwargs):
+    """Replace the process-wide tracer (keyword arguments as Tracer) and return it."""
+    global _tracer
+    _tracer = Tracer(**kwargs)
+    return _tracer
+
+def get_tracer():
+    return _tracer
+
+def stage(name, file=None):
+    """Measure a block with the process-wide tracer: `with instrument.stage("load", path): ...`."""
+    return _tracer.stage(name, file)
+
+def add_bytes(read=0, written=0):
+    """Attribute bytes to the running stages of the process-wide tracer."""
+    _tracer.add_bytes(read, written)
+
+class SamplingProfiler:
+    """
+    Opt-in sampling profiler for single-file deep dives.
+    A background thread records the Python stack of the profiled thread every interval seconds;
+    write() saves them in the folded-stack format read by flamegraph.pl and speedscope.
+    Usage:
+        with SamplingProfiler("cube.folded"):
+            process_hdr_file(...)
+    """
+
+    def __init__(self, output_path=None, interval=0.005):
+        self.output_path = output_path
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+
+    def _sample(self, thread_id):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, args=(threading.get_ident(),), daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        if self.output_path:
+            self.write(self.output_path)
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
@@ -2,48 +2,59 @@
 
 import os
 import numpy as np
-import pandas as pd
-from skimage.io import imread
-from skimage.color import rgb2gray
+
+from metric_store import SCENE_NAMES, open_store, cached_metrics, scene_name
+
+GLOBAL_METRICS = ["max_min_ratio", "weber_contrast", "michelson_contrast", "rms_contrast"]
 
 # Function to calculate global contrast metrics
 def calculate_global_contrast(image):
-    luminance = rgb2gray(image)
+    # plt.imsave writes RGBA PNGs; the alpha channel carries no luminance
+    from skimage.color import rgb2gray
+    return luminance_contrast(rgb2gray(image[..., :3]))
+
+# Global contrast metrics on an already computed luminance plane (means accumulated in float64)
+def luminance_contrast(luminance):
     max_min_ratio = luminance.max() / (luminance.min() + 1e-6)
     weber_contrast = (luminance.max() - luminance.min()) / (luminance.min() + 1e-6)
     michelson_contrast = (luminance.max() - luminance.min()) / (luminance.max() + luminance.min() + 1e-6)
-    rms_contrast = np.sqrt(np.mean((luminance - luminance.mean())**2))
+    mean = luminance.mean(dtype=np.float64)
+    rms_contrast = np.sqrt(np.mean((luminance - mean)**2, dtype=np.float64))
     return max_min_ratio, weber_contrast, michelson_contrast, rms_contrast
 
-# Process all images in a folder and compute metrics
-def process_scene(folder_path):
+# Process all images in a folder and compute metrics (reusing stored values when a store is given)
+def process_scene(folder_path, store=None, scene=None, filter_name="original"):
+    from skimage.io import imread
     metrics = []
     for subdir, _, files in os.walk(folder_path):
         for file in files:
             if file.endswith('.png'):
                 image_path = os.path.join(subdir, file)
-                image = imread(image_path)
-                metrics.append(calculate_global_contrast(image))
+                compute = lambda: calculate_global_contrast(imread(image_path))
+                metrics.append(cached_metrics(store, image_path, GLOBAL_METRICS, compute,
+                                              filter=filter_name, scene=scene))
     metrics = np.array(metrics)
     return metrics.mean(axis=0) if metrics.size > 0 else [0, 0, 0, 0]
 
-# Directories for each scene
-input_folder = "Scott_rgb"
-scenes = ["Old-Snow-Scenarios/original", "Tarmac/original", "Trails/original"]
-scene_names = ["Snow", "Tarmac", "Trails", "No Filter"]
-
-# Calculating metrics for each scene
-results = []
-for scene in scenes:
-    scene_path = os.path.join(input_folder, scene)
-    scene_metrics = process_scene(scene_path)
-    results.append(scene_metrics)
-
-# Adding a "No Filter" row as placeholder (simulating no filter metrics calculation)
-# Assuming "No Filter" metrics calculation is the mean of other metrics for simplicity
-no_filter_metrics = np.mean(results, axis=0)
-results.append(no_filter_metrics)
-
-# Creating the result table
-columns = ["max_min_ratio", "weber_contrast", "michelson_contrast", "rms_contrast"]
-contrast_table = pd.DataFrame(results, columns=columns, index=scene_names)
\ No newline at end of file
+def main():
+    # Directories for each scene and filter render
+    input_folder = "Scott_rgb"
+    filters = ["original", "DBAMP", "DBN"]
+
+    # Per-image metrics go to the store; unchanged images are not recomputed
+    store = open_store("metrics.sqlite")
+    for scene in SCENE_NAMES:
+        for filter_name in filters:
+            scene_path = os.path.join(input_folder, scene, filter_name)
+            process_scene(scene_path, store=store, scene=scene_name(scene), filter_name=filter_name)
+
+    # Creating the result table from the stored per-image values
+    from report import load_frame, summary_table
+    contrast_table = summary_table(load_frame(store, metrics=GLOBAL_METRICS))
+    print(contrast_table.to_string(index=False))
+    contrast_table.to_csv("contrast_table.csv", index=False)
+    print("Saved: contrast_table.csv")
+    return contrast_table
+
+if __name__ == "__main__":
+    main()
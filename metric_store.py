@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import sqlite3
+import numpy as np
+
+from cube_index import file_fingerprint
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    image_hash TEXT NOT NULL,
+    filter TEXT NOT NULL,
+    illuminant TEXT NOT NULL,
+    observer TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    params TEXT NOT NULL,
+    value REAL,
+    image_path TEXT,
+    scene TEXT,
+    created_at REAL,
+    PRIMARY KEY (image_hash, filter, illuminant, observer, metric, params)
+);
+CREATE INDEX IF NOT EXISTS metrics_scene ON metrics (scene, filter, metric);
+"""
+
+KEY_COLUMNS = ("image_hash", "filter", "illuminant", "observer", "metric", "params")
+
+# Scene labels stored with the metrics of the Scott capture folders
+SCENE_NAMES = {"Old-Snow-Scenarios": "Snow", "Tarmac": "Tarmac", "Trails": "Trails"}
+
+def open_store(db_path="metrics.sqlite", timeout=60.0):
+    """
+    Open (and create if needed) the metric store.
+    WAL mode lets parallel workers append while others read; writers wait on the lock
+    for up to timeout seconds instead of failing.
+    """
+    conn = sqlite3.connect(db_path, timeout=timeout)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def params_key(params):
+    """Canonical text form of a parameter dictionary."""
+    return json.dumps(params or {}, sort_keys=True, separators=(",", ":"))
+
+def scene_name(folder):
+    """
+    Scene label of a capture folder, shared by every writer so one scene is never stored under two names.
+    Known folders are mapped through SCENE_NAMES (Old-Snow-Scenarios -> Snow); others keep their base name.
+    """
+    name = os.path.basename(os.path.normpath(folder))
+    return SCENE_NAMES.get(name, name)
+
+def image_hash(image_path):
+    """Content fingerprint used to key metrics of an image or cube file."""
+    return file_fingerprint(image_path)
+
+def lookup_metrics(conn, image_hash, metrics, filter="", illuminant="", observer="", params=None):
+    """Return {metric: value} for the requested metrics that are already stored."""
+    placeholders = ", ".join("?" for _ in metrics)
+    sql = (f"SELECT metric, value FROM metrics WHERE image_hash = ? AND filter = ? AND illuminant = ? "
+           f"AND observer = ? AND params = ? AND metric IN ({placeholders})")
+    rows = conn.execute(sql, (image_hash, filter, illuminant, observer, params_key(params), *metrics))
+    return dict(rows.fetchall())
+
+def record_metrics(conn, image_hash, values, filter="", illuminant="", observer="", params=None,
+                   image_path=None, scene=None):
+    """
+    Append metric values; existing keys are left untouched (the store is append-only).
+    Args:
+        values: Dictionary {metric: value}.
+    """
+    now = time.time()
+    rows = [(image_hash, filter, illuminant, observer, metric, params_key(params), float(value),
+             image_path, scene, now) for metric, value in values.items()]
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+def cached_metrics(conn, image_path, metrics, compute, filter="", illuminant="", observer="",
+                   params=None, scene=None):
+    """
+    Return the requested metrics for an image, computing them only on a cache miss.
+    Args:
+        conn: Store connection, or None to always compute.
+        image_path: File the metrics are computed from (its content hash is the key).
+        metrics: Metric names returned by compute, in order.
+        compute: Callable returning a sequence of values in the order of metrics.
+    Returns:
+        List of values in the order of metrics.
+    """
+    if conn is None:
+        return list(compute())
+    key = image_hash(image_path)
+    stored = lookup_metrics(conn, key, metrics, filter, illuminant, observer, params)
+    if len(stored) == len(metrics):
+        return [stored[m] for m in metrics]
+
+    values = dict(zip(metrics, compute()))
+    record_metrics(conn, key, values, filter, illuminant, observer, params,
+                   image_path=os.path.abspath(image_path), scene=scene)
+    return [values[m] for m in metrics]
+
+def load_metrics(conn, **where):
+    """
+    Load metric rows in bulk as a DataFrame, e.g. load_metrics(conn, scene="Trails", metric="rms_contrast").
+    Values may also be lists, which select any of the listed values.
+    """
+    import pandas as pd
+    clauses, args = [], []
+    for column, value in where.items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        clauses.append(f"{column} IN ({', '.join('?' for _ in values)})")
+        args.extend(values)
+    sql = "SELECT * FROM metrics"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return pd.read_sql_query(sql, conn, params=args)
+
+def metric_matrix(frame, index="image_hash", columns="metric"):
+    """Pivot a load_metrics frame to a (images x metrics) float array with its labels."""
+    table = frame.pivot_table(index=index, columns=columns, values="value", aggfunc="first")
+    return np.asarray(table.values, dtype=np.float64), list(table.index), list(table.columns)
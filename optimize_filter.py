@@ -0,0 +1,231 @@
+import os
+import json
+import argparse
+import numpy as np
+import spectral
+from multiprocessing import Pool
+
+from apply_filter import load_transmission_curve, save_transmission_curve
+from measurement import luminance_contrast
+from pelicontrast import peli_contrast
+
+SCENES = ["Old-Snow-Scenarios", "Tarmac", "Trails"]
+METRICS = ["weber", "michelson", "rms", "peli"]
+
+# Surrogate shared with the worker processes (set by _init_worker)
+_surrogate = None
+
+def interpolation_matrix(source_wavelengths, target_wavelengths):
+    """Linear interpolation from source to target wavelengths as a (target x source) matrix."""
+    from scipy.interpolate import interp1d
+    eye = np.eye(len(source_wavelengths))
+    interpolation_func = interp1d(source_wavelengths, eye, kind='linear', fill_value="extrapolate", axis=0)
+    return interpolation_func(target_wavelengths)
+
+def rbf_basis(wavelengths, n_basis=12):
+    """Gaussian bumps evenly spread over the wavelength grid, one column per basis function."""
+    centers = np.linspace(wavelengths[0], wavelengths[-1], n_basis)
+    width = centers[1] - centers[0]
+    return np.exp(-0.5 * ((wavelengths[:, None] - centers[None, :]) / width) ** 2)
+
+def weights_to_curve(weights, basis, bounds=(0.0, 1.0)):
+    """Map unconstrained basis weights to a smooth curve that stays within bounds."""
+    low, high = bounds
+    return low + (high - low) / (1.0 + np.exp(-basis @ weights))
+
+def luminous_transmittance(transmission, v_lambda, illuminant):
+    """Luminous transmittance of a curve for a photopic observer and illuminant (all on one grid)."""
+    weight = v_lambda * illuminant
+    return np.sum(transmission * weight) / np.sum(weight)
+
+def build_surrogate(base_folder, scenes, cmf_file, wavelengths, stride=8):
+    """
+    Precompute the luminance operator of every cube on a subsampled grid.
+    Args:
+        base_folder: Folder containing the scene subfolders.
+        scenes: Scene subfolder names; cubes are read from <scene>/original.
+        cmf_file: CMF CSV file (wavelength, X, Y, Z).
+        wavelengths: Grid the candidate transmission curves are defined on.
+        stride: Spatial subsampling step.
+    Returns:
+        List of (rows, cols, A) where luminance = (A @ transmission).reshape(rows, cols).
+    """
+    cmf_data = np.loadtxt(cmf_file, delimiter=",")
+    operators = []
+    for scene in scenes:
+        input_folder = os.path.join(base_folder, scene, "original")
+        for file_name in sorted(os.listdir(input_folder)):
+            if not file_name.endswith(".hdr"):
+                continue
+            hdr_path = os.path.join(input_folder, file_name)
+            print(f"Projecting: {hdr_path}")
+
+            # Only the strided pixels are read from the memory-mapped cube
+            hdr_image = spectral.open_image(hdr_path)
+            cube = hdr_image.open_memmap(interleave='bip')[::stride, ::stride, :]
+            cube = np.asarray(cube, dtype=np.float64)
+            cube_wavelengths = np.array([float(w) for w in hdr_image.metadata['wavelength']])
+
+            # Y-bar and curve interpolation are folded into one (pixels x grid) matrix
+            y_bar = np.interp(cube_wavelengths, cmf_data[:, 0], cmf_data[:, 2], left=0.0, right=0.0)
+            to_cube = interpolation_matrix(wavelengths, cube_wavelengths)
+            r, c, w = cube.shape
+            A = (cube.reshape((r * c, w)) * y_bar) @ to_cube
+            operators.append((r, c, A.astype(np.float32)))
+    return operators
+
+def surrogate_metric(luminance, metric, sigma=1.5):
+    """Score one normalised luminance plane; larger is better."""
+    luminance = luminance / (luminance.max() + 1e-12)
+    if metric == "peli":
+        # peli_contrast expects 8-bit scaled input
+        return float(np.mean(np.abs(peli_contrast(luminance * 255.0, sigma=sigma))))
+    max_min_ratio, weber, michelson, rms = luminance_contrast(luminance)
+    return float({"weber": weber, "michelson": michelson, "rms": rms}[metric])
+
+def evaluate_curve(transmission, surrogate, metric):
+    """Mean surrogate metric of a transmission curve over the dataset."""
+    scores = [surrogate_metric((A @ transmission).reshape(r, c), metric) for r, c, A in surrogate]
+    return float(np.mean(scores))
+
+def _init_worker(surrogate):
+    global _surrogate
+    _surrogate = surrogate
+
+def _objective(args):
+    """Penalised objective evaluated inside a worker process."""
+    weights, basis, bounds, metric, v_lambda, illuminant, tau_range = args
+    transmission = weights_to_curve(weights, basis, bounds)
+    score = evaluate_curve(transmission, _surrogate, metric)
+
+    # Keep the luminous transmittance inside the requested band
+    tau = luminous_transmittance(transmission, v_lambda, illuminant)
+    violation = max(0.0, tau_range[0] - tau) + max(0.0, tau - tau_range[1])
+    return score - 100.0 * violation, score, tau
+
+def load_checkpoint(checkpoint_path):
+    """Load the search state written by save_checkpoint, or None if there is none."""
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as f:
+        state = json.load(f)
+    for key in ("mean", "best_weights"):
+        state[key] = np.array(state[key])
+    return state
+
+def save_checkpoint(checkpoint_path, state):
+    """Write the search state atomically so an interrupted run can resume."""
+    serialisable = {k: (v.tolist() if isinstance(v, np.ndarray) else v) for k, v in state.items()}
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(serialisable, f)
+    os.replace(tmp_path, checkpoint_path)
+
+def optimise_filter(surrogate, wavelengths, v_lambda, illuminant, metric="michelson", n_basis=12,
+                    bounds=(0.02, 0.98), tau_range=(0.18, 0.43), population=24, generations=40,
+                    sigma=1.0, workers=None, checkpoint_path=None, seed=0):
+    """
+    Search a smooth transmission curve maximising a dataset contrast objective.
+    Uses a (mu/mu, lambda) evolution strategy; each generation is evaluated in parallel.
+    Args:
+        surrogate: Output of build_surrogate.
+        wavelengths: Grid the curve is defined on.
+        v_lambda: Photopic luminosity function on the grid.
+        illuminant: Illuminant SPD on the grid (for the luminous transmittance).
+        metric: One of METRICS.
+        tau_range: Allowed luminous transmittance (default: sunglass category 2).
+        checkpoint_path: JSON file the search state is saved to and resumed from. It records the
+                         run parameters (all but generations), and a checkpoint written with
+                         different ones is refused rather than resumed.
+    Returns:
+        best_curve: Best transmission curve found.
+        state: Final search state (best score, luminous transmittance, history).
+    """
+    basis = rbf_basis(wavelengths, n_basis)
+    mu = population // 2
+    recombination = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+    recombination /= recombination.sum()
+
+    # Compared through JSON so tuples and lists of a reloaded checkpoint match
+    run = json.loads(json.dumps({"metric": metric, "n_basis": n_basis, "bounds": bounds, "tau_range": tau_range,
+                                 "population": population, "sigma": sigma, "seed": seed,
+                                 "wavelengths": np.asarray(wavelengths, dtype=float).tolist()}))
+    state = load_checkpoint(checkpoint_path)
+    if state is not None and state.get("run") != run:
+        saved = state.get("run") or {}
+        changed = sorted(key for key in run if saved.get(key) != run[key])
+        raise ValueError(f"Checkpoint {checkpoint_path} was written with different run parameters ({', '.join(changed)}); "
+                         "delete it or choose another checkpoint file")
+    if state is None:
+        state = {"run": run, "generation": 0, "mean": np.zeros(n_basis), "sigma": sigma,
+                 "best_weights": np.zeros(n_basis), "best_fitness": -np.inf,
+                 "best_score": None, "best_tau": None, "history": []}
+    # The generator state is checkpointed, so a resumed search draws what an uninterrupted one would
+    rng = np.random.default_rng(seed)
+    if "rng" in state:
+        rng.bit_generator.state = state["rng"]
+
+    with Pool(workers, initializer=_init_worker, initargs=(surrogate,)) as pool:
+        while state["generation"] < generations:
+            candidates = state["mean"] + state["sigma"] * rng.standard_normal((population, n_basis))
+            jobs = [(w, basis, bounds, metric, v_lambda, illuminant, tau_range) for w in candidates]
+            results = np.array(pool.map(_objective, jobs))
+            order = np.argsort(-results[:, 0])
+
+            # Recombine the best half and shrink the step size when the mean stops improving
+            new_mean = recombination @ candidates[order[:mu]]
+            improved = results[order[0], 0] > state["best_fitness"]
+            state["sigma"] *= 1.1 if improved else 0.85
+            state["mean"] = new_mean
+            if improved:
+                state["best_weights"] = candidates[order[0]]
+                state["best_fitness"], state["best_score"], state["best_tau"] = map(float, results[order[0]])
+            state["generation"] += 1
+            state["history"].append(state["best_fitness"])
+            print(f"Generation {state['generation']}: best {metric} = {state['best_score']:.5f} "
+                  f"(tau_v = {state['best_tau']:.3f})")
+
+            state["rng"] = rng.bit_generator.state
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, state)
+
+    return weights_to_curve(state["best_weights"], basis, bounds), state
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimise a filter transmission curve for contrast.")
+    parser.add_argument("base_folder", help="Folder with the scene subfolders")
+    parser.add_argument("--scenes", nargs="+", default=SCENES)
+    parser.add_argument("--metric", choices=METRICS, default="michelson")
+    parser.add_argument("--cmf", default=os.path.join("cmfs", "cmf_2.csv"))
+    parser.add_argument("--illuminant", default=os.path.join("tools", "sources", "CIE_D65.txt"))
+    parser.add_argument("--template", default=os.path.join("tools", "filters", "amp.txt"),
+                        help="Filter file whose wavelength grid the curve is defined on")
+    parser.add_argument("--stride", type=int, default=8)
+    parser.add_argument("--basis", type=int, default=12)
+    parser.add_argument("--population", type=int, default=24)
+    parser.add_argument("--generations", type=int, default=40)
+    parser.add_argument("--tau-min", type=float, default=0.18)
+    parser.add_argument("--tau-max", type=float, default=0.43)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--checkpoint", default="optimise_filter.json")
+    parser.add_argument("--output", default=os.path.join("tools", "filters", "optimised.txt"))
+    args = parser.parse_args()
+
+    wavelengths, _ = load_transmission_curve(args.template)
+    cmf_data = np.loadtxt(args.cmf, delimiter=",")
+    v_lambda = np.interp(wavelengths, cmf_data[:, 0], cmf_data[:, 2], left=0.0, right=0.0)
+    illuminant_wavelengths, illuminant_values = load_transmission_curve(args.illuminant)
+    illuminant = np.interp(wavelengths, illuminant_wavelengths, illuminant_values)
+
+    surrogate = build_surrogate(args.base_folder, args.scenes, args.cmf, wavelengths, stride=args.stride)
+    best_curve, state = optimise_filter(surrogate, wavelengths, v_lambda, illuminant, metric=args.metric,
+                                        n_basis=args.basis, tau_range=(args.tau_min, args.tau_max),
+                                        population=args.population, generations=args.generations,
+                                        workers=args.workers, checkpoint_path=args.checkpoint)
+
+    save_transmission_curve(args.output, wavelengths, best_curve)
+    print(f"Saved optimised curve to {args.output} ({args.metric} = {state['best_score']:.5f}, "
+          f"tau_v = {state['best_tau']:.3f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import os
+import argparse
+import numpy as np
+
+import freqfilters
+from measurement import luminance_contrast, GLOBAL_METRICS
+
+FILTER_FOLDERS = ("original", "DBAMP", "DBN")
+FILTERED_SUFFIX = "_Filtered"
+IMAGE_EXTENSIONS = (".png", ".tif", ".tiff")
+
+DEFAULT_PARAMS = {"peli_sigma": 1.5, "dog_rc": 2, "dog_rs": 5, "cab_sigma_b": 3, "cab_sigma_i": 1}
+LOCAL_METRICS = ("peli", "dog_center", "dog_surround", "dog_cps", "cab", "iordache")
+MAP_STATISTICS = ("mean", "variance", "max", "min")
+
+def pair_key(image_path):
+    """
+    Identify the capture an image was rendered from and which filter it shows.
+    Handles both '<name>_Filtered.tif' next to '<name>.tif' (SIDQ) and
+    '<scene>/<original|DBAMP|DBN>/<name>.png' (Scott) layouts.
+    Returns:
+        key: Capture identifier shared by all renders of one scene.
+        label: Filter label ('original' for the unfiltered render).
+    """
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    folder = os.path.dirname(os.path.abspath(image_path))
+    if stem.endswith(FILTERED_SUFFIX):
+        return (folder, stem[:-len(FILTERED_SUFFIX)]), FILTERED_SUFFIX.lstrip("_")
+    if os.path.basename(folder) in FILTER_FOLDERS:
+        return (os.path.dirname(folder), stem), os.path.basename(folder)
+    return (folder, stem), "original"
+
+def match_groups(image_paths, reference="original"):
+    """Group image paths into {key: {label: path}}, keeping only groups that contain the reference."""
+    groups = {}
+    for image_path in image_paths:
+        key, label = pair_key(image_path)
+        groups.setdefault(key, {})[label] = image_path
+    return {key: group for key, group in sorted(groups.items()) if reference in group and len(group) > 1}
+
+def find_groups(folder, reference="original"):
+    """Walk a folder and return the matched (original, filtered...) groups."""
+    paths = [os.path.join(dirpath, f) for dirpath, _, files in os.walk(folder)
+             for f in files if f.lower().endswith(IMAGE_EXTENSIONS)]
+    return match_groups(paths, reference)
+
+def load_luminance(image_path):
+    """Load an image as a float32 luminance plane in [0, 1]."""
+    import cv2
+    image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError(f"Image could not be loaded: {image_path}")
+    scale = np.iinfo(image.dtype).max if np.issubdtype(image.dtype, np.integer) else 1.0
+    image = image.astype(np.float32) / scale
+    if image.ndim == 3:
+        # OpenCV channel order is BGR(A); same weights as skimage's rgb2gray
+        image = image[..., 2] * 0.2125 + image[..., 1] * 0.7154 + image[..., 0] * 0.0721
+    return image
+
+def _local_maps(spectrum, image, plan, params):
+    """All local contrast maps of one plane from its (shared-plan) spectrum."""
+    shape = image.shape
+    fft_shape = plan[1]
+    blur = lambda sigma: freqfilters.inverse(spectrum * freqfilters.gaussian_transfer(fft_shape, sigma), plan, shape)
+    eps = 1e-6
+
+    # Peli: bandpass at sigma over lowpass at 2 sigma
+    sigma = params["peli_sigma"]
+    maps = {"peli": (image - blur(sigma)) / (blur(2 * sigma) + eps)}
+
+    # DoG centre/surround with the surround weighted as in dogcontrast.center_surround_response
+    rc, rs = params["dog_rc"], params["dog_rs"]
+    Rc = blur(rc)
+    Rs = blur(rs) * (0.85 * (rc / rs) ** 2)
+    maps["dog_center"] = (Rc - Rs) / (Rc + eps)
+    maps["dog_surround"] = (Rc - Rs) / (Rs + eps)
+    maps["dog_cps"] = (Rc - Rs) / (Rc + Rs + eps)
+
+    # Ahumada & Beard: the cascaded blur is one product in the frequency domain
+    b_transfer = freqfilters.gaussian_transfer(fft_shape, params["cab_sigma_b"])
+    b = freqfilters.inverse(spectrum * b_transfer, plan, shape)
+    m = freqfilters.inverse(spectrum * (b_transfer * freqfilters.gaussian_transfer(fft_shape, params["cab_sigma_i"])),
+                            plan, shape)
+    maps["cab"] = b / (m + eps) - 1
+
+    # Iordache: ratio to the mean of the 8 neighbours
+    kernel = np.ones((3, 3)) / 8.0
+    kernel[1, 1] = 0
+    bs = freqfilters.inverse(spectrum * freqfilters.kernel_transfer(fft_shape, kernel), plan, shape)
+    maps["iordache"] = image / (bs + eps)
+    return maps
+
+def local_contrast_maps(planes, params=None, plan=None):
+    """
+    All local contrast maps of planes that share one shape, with one padding/FFT plan for all.
+    Args:
+        planes: Dictionary {key: luminance plane}.
+        params: Metric parameters (defaults to DEFAULT_PARAMS).
+        plan: freqfilters plan to use instead of the padding the metrics need, e.g.
+              (0, fft_shape) for patches that already carry that margin of real pixels.
+    Returns:
+        {key: {metric: map}}
+    """
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    shapes = {plane.shape for plane in planes.values()}
+    if len(shapes) != 1:
+        raise ValueError(f"Renders of one capture must share geometry, got {sorted(shapes)}")
+    if plan is None:
+        max_sigma = max(2 * params["peli_sigma"], params["dog_rs"], params["cab_sigma_b"] + params["cab_sigma_i"])
+        plan = freqfilters.pad_plan(shapes.pop(), max_sigma)
+    return {key: _local_maps(freqfilters.forward(plane, plan), plane, plan, params) for key, plane in planes.items()}
+
+def summarise_map(contrast_map):
+    """Mean, variance, max and min of a contrast map (the contrast_metrics_local.csv columns)."""
+    return {"mean": float(contrast_map.mean()), "variance": float(contrast_map.var()),
+            "max": float(contrast_map.max()), "min": float(contrast_map.min())}
+
+def evaluate_group(luminances, reference="original", params=None):
+    """
+    Evaluate all metrics for one (original, filtered...) group with shared setup.
+    The padding/FFT plan and every filter response are built once per group and reused
+    for all of its renders (and, through the cache, for later groups of the same size).
+    Args:
+        luminances: Dictionary {label: luminance plane}; all planes share one shape.
+        reference: Label of the unfiltered render.
+        params: Metric parameters (defaults to DEFAULT_PARAMS).
+    Returns:
+        maps: {label: {metric: map}}
+        deltas: {label: {metric: map - reference map}} for every non-reference label
+        summary: List of tidy rows (label, metric, statistic, value, delta).
+    """
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    maps = local_contrast_maps(luminances, params)
+
+    deltas, summary = {}, []
+    reference_global = dict(zip(GLOBAL_METRICS, luminance_contrast(luminances[reference])))
+    reference_stats = {metric: summarise_map(contrast_map) for metric, contrast_map in maps[reference].items()}
+    for label, plane in luminances.items():
+        global_values = dict(zip(GLOBAL_METRICS, luminance_contrast(plane)))
+        for metric, value in global_values.items():
+            summary.append({"label": label, "metric": metric, "statistic": "value", "value": float(value),
+                            "delta": float(value - reference_global[metric])})
+        if label != reference:
+            deltas[label] = {metric: maps[label][metric] - maps[reference][metric] for metric in maps[label]}
+        for metric, contrast_map in maps[label].items():
+            stats = summarise_map(contrast_map) if label != reference else reference_stats[metric]
+            for statistic, value in stats.items():
+                summary.append({"label": label, "metric": metric, "statistic": statistic, "value": value,
+                                "delta": value - reference_stats[metric][statistic]})
+            if label != reference:
+                summary.append({"label": label, "metric": metric, "statistic": "mean_abs_delta",
+                                "value": float(np.abs(deltas[label][metric]).mean()), "delta": np.nan})
+    return maps, deltas, summary
+
+def _store_entries(group, reference, params):
+    """
+    (label, image hash, params, metric names) under which a group's summary is stored.
+    Global values do not depend on the parameters and share measurement.process_scene's entries;
+    mean_abs_delta also depends on the reference render, so it is keyed by the hash of both renders.
+    """
+    import hashlib
+    from metric_store import image_hash
+    hashes = {label: image_hash(path) for label, path in group.items()}
+    local_names = [f"{metric}_{statistic}" for metric in LOCAL_METRICS for statistic in MAP_STATISTICS]
+    entries = []
+    for label in group:
+        entries.append((label, hashes[label], None, list(GLOBAL_METRICS)))
+        entries.append((label, hashes[label], params, local_names))
+        if label != reference:
+            pair_hash = hashlib.sha1((hashes[label] + hashes[reference]).encode()).hexdigest()
+            entries.append((label, pair_hash, params, [f"{metric}_mean_abs_delta" for metric in LOCAL_METRICS]))
+    return entries
+
+def cached_group(conn, group, reference="original", params=None):
+    """The summary rows of a group rebuilt from the metric store, or None unless all of them are stored."""
+    from metric_store import lookup_metrics
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    values = {label: {} for label in group}
+    for label, key, entry_params, names in _store_entries(group, reference, params):
+        stored = lookup_metrics(conn, key, names, filter=label, params=entry_params)
+        if len(stored) < len(names):
+            return None
+        values[label].update(stored)
+
+    # Same row order as evaluate_group
+    summary = []
+    for label in group:
+        delta = lambda name: values[label][name] - values[reference][name]
+        for metric in GLOBAL_METRICS:
+            summary.append({"label": label, "metric": metric, "statistic": "value",
+                            "value": values[label][metric], "delta": delta(metric)})
+        for metric in LOCAL_METRICS:
+            for statistic in MAP_STATISTICS:
+                name = f"{metric}_{statistic}"
+                summary.append({"label": label, "metric": metric, "statistic": statistic,
+                                "value": values[label][name], "delta": delta(name)})
+            if label != reference:
+                summary.append({"label": label, "metric": metric, "statistic": "mean_abs_delta",
+                                "value": values[label][f"{metric}_mean_abs_delta"], "delta": np.nan})
+    return summary
+
+def record_group(conn, group, summary, reference="original", params=None, scene=None):
+    """Append a group's summary rows to the metric store (one entry per render, metric and statistic)."""
+    from metric_store import record_metrics
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    values = {label: {} for label in group}
+    for row in summary:
+        name = row["metric"] if row["statistic"] == "value" else f"{row['metric']}_{row['statistic']}"
+        values[row["label"]][name] = row["value"]
+    for label, key, entry_params, names in _store_entries(group, reference, params):
+        record_metrics(conn, key, {name: values[label][name] for name in names}, filter=label, params=entry_params,
+                       image_path=os.path.abspath(group[label]), scene=scene)
+
+def evaluate_folder(folder, reference="original", params=None, prefetch=2, store=None):
+    """
+    Evaluate every matched group below folder and return a tidy DataFrame of summaries.
+    The renders of the next prefetch groups are decoded in background threads.
+    With a metric store connection, groups whose renders are all stored are not decoded again
+    and new summaries are recorded (scene = metric_store.scene_name of the folder holding the capture).
+    """
+    import pandas as pd
+    from metric_store import scene_name
+    from prefetch import Prefetcher
+
+    def read_group(group, allocate):
+        return {label: load_luminance(path) for label, path in group.items()}
+
+    groups = find_groups(folder, reference)
+    summaries = {}
+    if store is not None:
+        for key, group in groups.items():
+            summary = cached_group(store, group, reference, params)
+            if summary is not None:
+                summaries[key] = summary
+    pending = {key: group for key, group in groups.items() if key not in summaries}
+    for key, entry in zip(pending, Prefetcher(pending.values(), read_group, depth=prefetch)):
+        group, luminances = entry.item, entry.data
+        print(f"Evaluating: {key[1]} ({', '.join(sorted(group))})")
+        _, _, summaries[key] = evaluate_group(luminances, reference, params)
+        if store is not None:
+            record_group(store, group, summaries[key], reference, params, scene=scene_name(key[0]))
+
+    rows = []
+    for key, group in groups.items():
+        for row in summaries[key]:
+            rows.append(dict(row, group=os.path.join(*key), image=group[row["label"]]))
+    return pd.DataFrame(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Paired evaluation of original vs filtered renders.")
+    parser.add_argument("folder")
+    parser.add_argument("--reference", default="original")
+    parser.add_argument("--output", default="paired_metrics.csv")
+    parser.add_argument("--db", default="metrics.sqlite", help="Metric store (empty string to disable)")
+    args = parser.parse_args()
+
+    from metric_store import open_store
+    table = evaluate_folder(args.folder, args.reference, store=open_store(args.db) if args.db else None)
+    table.to_csv(args.output, index=False)
+    print(f"Saved: {args.output}")
+
+if __name__ == "__main__":
+    main()
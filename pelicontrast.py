@@ -1,7 +1,10 @@
 import numpy as np
 import cv2
-import matplotlib.pyplot as plt
-from scipy.ndimage import gaussian_filter
+
+import freqfilters
+
+# Banks hold (n_bands + 1) float32 planes of the half spectrum: about 200 MB for 11 bands at 3840 x 2160
+BANK_CACHE_BYTES = 512 << 20
 
 def peli_contrast(image, sigma=1.5):
     """
@@ -12,6 +15,7 @@ def peli_contrast(image, sigma=1.5):
     Returns:
         peli_contrast_map: Peli's Local Band-Limited Contrast map.
     """
+    from scipy.ndimage import gaussian_filter
     # Ensure the image is in float format for computations
     image = image.astype(np.float32) / 255.0
 
@@ -26,6 +30,65 @@ def peli_contrast(image, sigma=1.5):
 
     return peli_contrast_map
 
+@freqfilters.bank_cache(BANK_CACHE_BYTES)
+def cosine_log_bank(fft_shape, image_size, n_bands, half_spectrum=True):
+    """
+    Octave-spaced cosine-log filters and the lowpass below the first band.
+    Band k is centred on 2**k cycles/image and spans 2**(k-1) to 2**(k+1); neighbouring
+    bands sum to one, so the lowpass below band k+1 is the lowpass below band k plus band k.
+    Recent banks are kept up to BANK_CACHE_BYTES in total, so images of one size share a bank.
+    Args:
+        fft_shape: Shape of the (padded) FFT.
+        image_size: Image size in pixels that defines 'cycles/image' (largest side).
+        n_bands: Number of bandpass filters.
+        half_spectrum: Build the filters for a real-FFT half spectrum.
+    Returns:
+        lowpass: Transfer function of the lowpass below band 1.
+        bands: (n_bands x ...) stack of bandpass transfer functions.
+    """
+    fy, fx = freqfilters.frequency_grid(fft_shape, half_spectrum)
+    radius = np.hypot(fy, fx) * image_size  # cycles/image
+    log_radius = np.log2(np.maximum(radius, 1e-6))
+
+    lowpass = np.where(radius <= 1, 1.0, np.where(radius < 2, 0.5 * (1 + np.cos(np.pi * log_radius)), 0.0))
+    bands = np.empty((n_bands,) + radius.shape, dtype=np.float32)
+    for k in range(1, n_bands + 1):
+        inside = (radius > 2 ** (k - 1)) & (radius < 2 ** (k + 1))
+        bands[k - 1] = np.where(inside, 0.5 * (1 + np.cos(np.pi * log_radius - np.pi * k)), 0.0)
+    return lowpass.astype(np.float32), bands
+
+def peli_band_contrast(image, n_bands=None, pad=0, half_spectrum=True):
+    """
+    Compute Peli's band-limited contrast for all octave bands from a single forward FFT.
+    Args:
+        image: Grayscale input image (integer images are scaled by their dtype range).
+        n_bands: Number of octave bands (default: every band up to the Nyquist frequency).
+        pad: Reflective padding in pixels (0 filters circularly, like Peli's original formulation).
+        half_spectrum: Keep only the real-FFT half spectrum (halves memory and FFT work).
+    Returns:
+        contrast: (n_bands x H x W) stack, band k being a_k / l_k.
+        frequencies: Band centre frequencies in cycles/image.
+    """
+    if np.issubdtype(image.dtype, np.integer):
+        image = image.astype(np.float32) / np.iinfo(image.dtype).max
+    shape = image.shape
+    image_size = max(shape)
+    if n_bands is None:
+        n_bands = max(1, int(np.log2(image_size)) - 1)
+
+    plan = freqfilters.fft_plan(shape, pad)
+    lowpass, bands = cosine_log_bank(plan[1], image_size, n_bands, half_spectrum)
+    spectrum = freqfilters.forward(image, plan, half_spectrum)
+
+    # One inverse transform per band; the lowpass denominators accumulate in the spatial domain
+    contrast = np.empty((n_bands,) + shape, dtype=np.float32)
+    local_mean = freqfilters.inverse(spectrum * lowpass, plan, shape, half_spectrum)
+    for k in range(n_bands):
+        band = freqfilters.inverse(spectrum * bands[k], plan, shape, half_spectrum)
+        np.divide(band, local_mean + 1e-6, out=contrast[k])
+        local_mean += band
+    return contrast, 2.0 ** np.arange(1, n_bands + 1)
+
 def normalize_image(image):
     """
     Normalize the image to range [0, 1] for visualization.
@@ -43,6 +106,7 @@ def visualize_peli_contrast(image_path, sigma=1.5):
         image_path: Path to the input image (grayscale or RGB).
         sigma: Standard deviation for Gaussian filter.
     """
+    import matplotlib.pyplot as plt
     # Load image and convert to grayscale
     image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
     if image is None:
@@ -69,6 +133,7 @@ def visualize_peli_contrast(image_path, sigma=1.5):
     plt.tight_layout()
     plt.show()
 
-# Example Usage
-image_path = "lena.png"  # Replace with your image path
-visualize_peli_contrast(image_path, sigma=1.5)
+if __name__ == "__main__":
+    # Example Usage
+    image_path = "lena.png"  # Replace with your image path
+    visualize_peli_contrast(image_path, sigma=1.5)
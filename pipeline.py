@@ -0,0 +1,475 @@
+import os
+import csv
+import glob
+import json
+import argparse
+from typing import Callable, NamedTuple
+import numpy as np
+import spectral
+
+import instrument
+
+DEFAULT_CONFIG = {
+    "cubes": [],                 # ENVI headers, glob patterns or folders (searched recursively)
+    "cmf": os.path.join("cmfs", "cmf_2.csv"),
+    "filters": {"DBAMP": os.path.join("tools", "filters", "amp.txt"),   # curves, or field specs (.json)
+                "DBN": os.path.join("tools", "filters", "neural.txt")},
+    "reference": "original",
+    "illuminants": [],           # tools/sources names or spectrum files; relights every render (<label>@<illuminant>)
+    "calibration": {},           # calibration.DEFAULT_CALIBRATION overrides (white region or reference spectrum)
+    "tile_rows": 256,
+    "precision": "default",      # precision.POLICIES name or {"storage", "compute", "accumulate"}
+    "prefetch": 2,               # tiles read ahead in background threads (0 reads synchronously)
+    "metrics": ["global", "local"],
+    "params": {},                # overrides of paired_eval.DEFAULT_PARAMS
+    "quantize": True,            # round renders to 8 bits as the PNG round trip does
+    "persist": [],               # any of "filtered", "rgb", "luminance"
+    "output": "pipeline_output",
+    "results": "pipeline_metrics.csv",
+    "trace": None,               # JSON-lines stage trace
+    "prometheus": None,          # Prometheus text file with per-stage totals
+    "track_allocations": False,  # tracemalloc report of large allocation sites per stage (slow)
+    "allocation_threshold_mb": 64,  # smallest allocation growth reported by track_allocations
+}
+
+PERSISTABLE = ("filtered", "rgb", "luminance")
+
+class CubeTile(NamedTuple):
+    """Rows [row, row + len(data)) of a cube as float32 (rows x cols x bands)."""
+    row: int
+    data: np.ndarray
+
+class CubeSource(NamedTuple):
+    """An opened cube: geometry, wavelengths and a lazy stream of its tiles."""
+    hdr_path: str
+    shape: tuple
+    wavelengths: np.ndarray
+    metadata: dict
+    tiles: object
+
+class Stage(NamedTuple):
+    """A pipeline node: function(*values[inputs]) is stored as values[name]."""
+    name: str
+    inputs: tuple
+    function: Callable
+
+def run_stages(stages, values, keep=(), sinks=None, file=None):
+    """
+    Run stages in dependency order.
+    Every stage runs as soon as its inputs exist; a value is dropped once its last consumer
+    has run unless it is listed in keep, so only the products asked for stay in memory.
+    Args:
+        stages: Iterable of Stage.
+        values: Dictionary of source values; receives stage outputs.
+        keep: Names of values to return.
+        sinks: {name: function(value)} called when a value is produced (persistence).
+        file: File the run works on, recorded with each stage's instrumentation.
+    Returns:
+        Dictionary of the kept values.
+    """
+    pending = list(stages)
+    consumers = {}
+    for stage in pending:
+        for name in stage.inputs:
+            consumers[name] = consumers.get(name, 0) + 1
+    sinks = sinks or {}
+    while pending:
+        ready = [stage for stage in pending if all(name in values for name in stage.inputs)]
+        if not ready:
+            missing = sorted({n for stage in pending for n in stage.inputs if n not in values})
+            raise ValueError(f"Unsatisfied stage inputs: {missing}")
+        for stage in ready:
+            with instrument.stage(stage.name, file):
+                values[stage.name] = stage.function(*(values[name] for name in stage.inputs))
+                if stage.name in sinks:
+                    sinks[stage.name](values[stage.name])
+            pending.remove(stage)
+            for name in stage.inputs:
+                consumers[name] -= 1
+                if consumers[name] == 0 and name not in keep:
+                    del values[name]
+    return {name: values[name] for name in keep if name in values}
+
+def open_source(hdr_path, tile_rows=256, prefetch=0, dtype=np.float32):
+    """
+    Open a cube as a CubeSource whose tiles are read from the memory map on demand.
+    Tiles are decoded to dtype radiance (applying any ENVI data gain/offset).
+    With prefetch > 0 the next tiles are read in background threads into reused buffers
+    (a tile's data is then only valid until the next tile is requested).
+    """
+    from precision import data_gain, decode
+    hdr_image = spectral.open_image(hdr_path)
+    memmap = hdr_image.open_memmap(interleave='bip')
+    wavelengths = np.array([float(w) for w in hdr_image.metadata['wavelength']])
+    gain_offset = data_gain(hdr_image.metadata)
+
+    def tiles():
+        if prefetch:
+            from prefetch import Prefetcher, envi_tile_items, envi_tile_reader
+            reader = Prefetcher(envi_tile_items(hdr_path, tile_rows), envi_tile_reader(memmap.dtype), depth=prefetch)
+            for entry in reader:
+                instrument.add_bytes(read=entry.data.nbytes)
+                yield CubeTile(entry.item[1], decode(entry.data, gain_offset, dtype))
+            stats = reader.summary()
+            print(f"Read: {stats['megabytes']:.1f} MB at {stats['throughput']:.1f} MB/s "
+                  f"(waited {stats['wait_seconds']:.2f} s for I/O)")
+            return
+        for row in range(0, memmap.shape[0], tile_rows):
+            stored = memmap[row:row + tile_rows]
+            instrument.add_bytes(read=stored.nbytes)
+            yield CubeTile(row, decode(stored, gain_offset, dtype))
+
+    return CubeSource(hdr_path, memmap.shape, wavelengths, hdr_image.metadata, tiles())
+
+def transmissions(source, filter_curves, reference="original", cache=None):
+    """
+    Filter transmissions matched to the cube's bands, with the reference as all-pass.
+    Transmission fields become transmission_field.MatchedField objects.
+    With a cache dictionary, the curves matched to a wavelength grid are reused by later cubes.
+    """
+    from apply_filter import match_transmission_to_cube
+    from transmission_field import TransmissionField
+    key = (reference, tuple(filter_curves), tuple(source.wavelengths))
+    if cache is not None and key in cache:
+        return cache[key]
+    matched = {reference: np.ones(len(source.wavelengths))}
+    for label, curve in filter_curves.items():
+        if isinstance(curve, TransmissionField):
+            matched[label] = curve.match(source.wavelengths)
+        else:
+            matched[label] = match_transmission_to_cube(source.wavelengths, *curve)
+    if cache is not None:
+        cache[key] = matched
+    return matched
+
+def render_xyz(source, matched, cmf, filtered_sink=None, dtype=np.float32, accumulate=None, relight=None):
+    """
+    Stream the cube tile by tile into one XYZ plane per filter.
+    Each tile is projected once onto the CMFs weighted by every transmission, so no filtered
+    cube is materialised; filtered tiles are only formed when filtered_sink asks for them.
+    A transmission field adds one projection per basis curve; its XYZ is the weighted sum of
+    those projections, so the per-pixel transmission is never formed either.
+    Relighting folds each illuminant's per-band gains into the same projection, so every
+    filter under every illuminant still costs a single pass over the tile.
+    Args:
+        source: CubeSource.
+        matched: {label: transmission per band or transmission_field.MatchedField}.
+        cmf: (cmf_wavelengths, cmf_values) as from hsi2rgb.load_cmf_data.
+        filtered_sink: Optional function(label, tile, transmission) persisting filtered tiles.
+        dtype: dtype of the XYZ planes.
+        accumulate: dtype of the projection (default: the tiles' own dtype).
+        relight: Optional {illuminant: per-band gains} from calibration.relighting.
+    Returns:
+        {label: XYZ plane (rows x cols x 3)}, labelled <label>@<illuminant> when relit.
+    """
+    from calibration import relit_label
+    from hsi2rgb import match_values_to_cube, radiance_to_xyz
+    from transmission_field import MatchedField
+    base_cmf = match_values_to_cube(source.wavelengths, *cmf)
+    if relight is None:
+        entries = [(label, matched[label], base_cmf, None) for label in matched]
+    else:
+        entries = [(relit_label(label, name), matched[label], base_cmf * gains[:, None], gains)
+                   for name, gains in relight.items() for label in matched]
+    labels = [entry[0] for entry in entries]
+    columns, fields = [], {}
+    for i, (_, transmission, matched_cmf, _) in enumerate(entries):
+        if isinstance(transmission, MatchedField):
+            fields[i] = transmission
+            columns += [matched_cmf * curve[:, None] for curve in transmission.basis]
+        else:
+            columns.append(matched_cmf * transmission[:, None])
+    projection = np.hstack(columns)
+
+    rows, cols = source.shape[:2]
+    XYZ = np.empty((rows, cols, 3 * len(labels)), dtype=dtype)
+    tiles = iter(source.tiles)
+    while True:
+        # Reading (or waiting for prefetched) tiles and filtering them are traced as separate spans
+        with instrument.stage("load", source.hdr_path):
+            tile = next(tiles, None)
+        if tile is None:
+            break
+        with instrument.stage("filter", source.hdr_path):
+            radiance = tile.data if accumulate is None else tile.data.astype(accumulate, copy=False)
+            projected = radiance_to_xyz(radiance, projection.astype(radiance.dtype))
+            if not fields:
+                XYZ[tile.row:tile.row + len(tile.data)] = projected
+            else:
+                column = 0
+                for i, label in enumerate(labels):
+                    target = XYZ[tile.row:tile.row + len(tile.data), :, 3 * i:3 * i + 3]
+                    if i in fields:
+                        field = fields[i]
+                        weights = field.weights(source.shape, tile.row, len(tile.data)).astype(projected.dtype)
+                        parts = projected[..., column:column + 3 * len(field.basis)]
+                        target[...] = np.einsum('rck,rckj->rcj', weights, parts.reshape(parts.shape[:2] + (-1, 3)))
+                        column += 3 * len(field.basis)
+                    else:
+                        target[...] = projected[..., column:column + 3]
+                        column += 3
+            if filtered_sink is not None:
+                for label, transmission, _, gains in entries:
+                    relit = tile if gains is None else CubeTile(tile.row, tile.data * gains.astype(tile.data.dtype))
+                    filtered_sink(label, relit, transmission)
+    return {label: XYZ[..., 3 * i:3 * i + 3] for i, label in enumerate(labels)}
+
+def render_rgb(planes, quantize=True):
+    """sRGB renders as hsi2rgb.convert_and_save_images makes them (each scaled by its own XYZ max)."""
+    from hsi2rgb import xyz_to_srgb
+    renders = {}
+    for label, XYZ in planes.items():
+        RGB = xyz_to_srgb(np.clip(XYZ / np.max(XYZ), 0, 1)).astype(XYZ.dtype)
+        renders[label] = np.floor(RGB * 255) / 255 if quantize else RGB
+    return renders
+
+def render_luminance(renders):
+    """Luminance planes with skimage's rgb2gray weights, as measurement.calculate_global_contrast."""
+    weights = np.array([0.2125, 0.7154, 0.0721])
+    return {label: RGB @ weights.astype(RGB.dtype) for label, RGB in renders.items()}
+
+def measure(luminances, metrics=("global", "local"), reference="original", params=None):
+    """
+    Global and/or local contrast rows for one cube's renders (paired_eval summary layout).
+    Relit renders (<label>@<illuminant>) are measured against the reference under the same
+    illuminant, and their rows carry an "illuminant" column.
+    """
+    from calibration import split_label
+    groups = {}
+    for label, plane in luminances.items():
+        name, illuminant = split_label(label)
+        groups.setdefault(illuminant, {})[name] = plane
+    if list(groups) != [None]:
+        rows = []
+        for illuminant, group in groups.items():
+            rows += [dict(row, illuminant=illuminant) for row in measure(group, metrics, reference, params)]
+        return rows
+    if "local" in metrics:
+        from paired_eval import evaluate_group
+        _, _, summary = evaluate_group(luminances, reference, params)
+        return summary
+    from measurement import luminance_contrast, GLOBAL_METRICS
+    reference_values = luminance_contrast(luminances[reference])
+    rows = []
+    for label, plane in luminances.items():
+        for metric, value, ref in zip(GLOBAL_METRICS, luminance_contrast(plane), reference_values):
+            rows.append({"label": label, "metric": metric, "statistic": "value",
+                         "value": float(value), "delta": float(value - ref)})
+    return rows
+
+class Persister:
+    """
+    Writers for intermediate products that the config asks to keep, under output/<label>/.
+    The reference render is not filtered, so no filtered cube is written for it (the source is that cube).
+    """
+
+    def __init__(self, output, persist, storage="float32", reference="original"):
+        unknown = set(persist) - set(PERSISTABLE)
+        if unknown:
+            raise ValueError(f"Unknown products to persist: {sorted(unknown)}")
+        if "filtered" in persist:
+            from precision import check_envi_storage
+            check_envi_storage(storage)
+        self.output = output
+        self.persist = set(persist)
+        self.storage = storage
+        self.reference = reference
+        self._cubes = {}
+
+    def path(self, label, name):
+        folder = os.path.join(self.output, label)
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, name)
+
+    def filtered_sink(self, source, scale=1.0, matched=None):
+        """
+        Tile writer for filtered cubes in the storage dtype, or None when they are not persisted.
+        uint16/float16 outputs share one data gain chosen from an upper bound of the source
+        times scale, the largest relighting gain if any, and times the largest transmission
+        peak of matched (fields whose weights exceed one can brighten the cube), which costs an
+        extra read only for float sources.
+        """
+        if "filtered" not in self.persist:
+            return None
+        from precision import data_gain, encode_with_gain, storage_gain, storage_metadata, stream_peak
+        from transmission_field import apply_matched, matched_peak
+        name = os.path.basename(source.hdr_path)
+        gain = 1.0
+        if self.storage != "float32":
+            image = spectral.open_image(source.hdr_path)
+            transmission_peak = max([matched_peak(m) for m in (matched or {}).values()] + [1.0])
+            gain = storage_gain(stream_peak(image.open_memmap(interleave='bip'), data_gain(image.metadata),
+                                            hdr_path=source.hdr_path) * scale * transmission_peak, self.storage)
+        metadata = storage_metadata(source.metadata, source.shape[2], gain)
+
+        def write(label, tile, transmission):
+            if label == self.reference:
+                return
+            key = (source.hdr_path, label)
+            if key not in self._cubes:
+                image = spectral.envi.create_image(self.path(label, name), metadata, dtype=self.storage,
+                                                   interleave='bip', force=True)
+                self._cubes[key] = image.open_memmap(writable=True)
+            filtered = apply_matched(transmission, tile.data, source.shape, tile.row)
+            stored = encode_with_gain(filtered, self.storage, gain)
+            self._cubes[key][tile.row:tile.row + len(tile.data)] = stored
+            instrument.add_bytes(written=stored.nbytes)
+        return write
+
+    def sinks(self, source):
+        """Sinks for run_stages keyed by stage name."""
+        stem = os.path.splitext(os.path.basename(source.hdr_path))[0]
+        sinks = {}
+        if "rgb" in self.persist:
+            def save_rgb(renders):
+                import matplotlib.pyplot as plt
+                for label, RGB in renders.items():
+                    plt.imsave(self.path(label, f"{stem}_rgb.png"), RGB)
+                    instrument.add_bytes(written=os.path.getsize(self.path(label, f"{stem}_rgb.png")))
+            sinks["rgb"] = save_rgb
+        if "luminance" in self.persist:
+            def save_luminance(luminances):
+                for label, plane in luminances.items():
+                    np.save(self.path(label, f"{stem}_luminance.npy"), plane)
+                    instrument.add_bytes(written=plane.nbytes)
+            sinks["luminance"] = save_luminance
+        return sinks
+
+    def close(self, source):
+        """Flush the filtered cubes of one source."""
+        for key in [k for k in self._cubes if k[0] == source.hdr_path]:
+            self._cubes.pop(key).flush()
+
+def cube_stages(config, filter_curves, cmf, persister, source, cache=None, illuminants=None, illumination=None):
+    """
+    The DAG for one cube: tiles -> XYZ planes -> RGB -> luminance -> metric rows.
+    With illuminants, a relight stage turns the scene's cached illumination estimate
+    (calibration.IlluminationCache) into per-illuminant gains for the render.
+    """
+    from calibration import relighting
+    from precision import get_policy
+    policy = get_policy(config["precision"])
+
+    def xyz(s, m, relight):
+        scale = 1.0 if relight is None else max(float(np.max(gains)) for gains in relight.values())
+        return render_xyz(s, m, cmf, persister.filtered_sink(source, scale, m), policy.compute, policy.accumulate,
+                          relight)
+
+    return [
+        Stage("matched", ("source",), lambda s: transmissions(s, filter_curves, config["reference"], cache)),
+        Stage("relight", ("source",), lambda s: relighting(s, illuminants, cmf, illumination, config["calibration"])),
+        Stage("xyz", ("source", "matched", "relight"), xyz),
+        Stage("rgb", ("xyz",), lambda planes: render_rgb(planes, config["quantize"])),
+        Stage("luminance", ("rgb",), render_luminance),
+        Stage("metrics", ("luminance",),
+              lambda lum: measure(lum, config["metrics"], config["reference"], config["params"])),
+    ]
+
+def load_config(file_path=None, **overrides):
+    """Read a JSON config on top of DEFAULT_CONFIG; non-None keyword overrides win."""
+    config = dict(DEFAULT_CONFIG)
+    if file_path:
+        with open(file_path) as f:
+            config.update(json.load(f))
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    return config
+
+def find_cubes(entries):
+    """Expand header paths, glob patterns and folders into a sorted list of .hdr files."""
+    paths = set()
+    for entry in entries:
+        if os.path.isdir(entry):
+            paths.update(os.path.join(d, f) for d, _, files in os.walk(entry) for f in files if f.endswith(".hdr"))
+        else:
+            paths.update(p for p in glob.glob(entry) if p.endswith(".hdr"))
+    return sorted(paths)
+
+class Resources(NamedTuple):
+    """Everything a run loads once and shares between cubes."""
+    cmf: tuple
+    filter_curves: dict
+    policy: object
+    persister: Persister
+    matched: dict        # transmissions per wavelength grid, filled as cubes are processed
+    illuminants: dict = None                # {name: illuminant curve} to relight into
+    illumination: object = None             # calibration.IlluminationCache when relighting
+
+def load_resources(config):
+    """Load the CMFs, filter curves and illuminants of a config and set up its persister and tracer."""
+    from calibration import DEFAULT_CALIBRATION, IlluminationCache, illuminant_name, load_illuminant
+    from hsi2rgb import load_cmf_data
+    from precision import get_policy
+    from transmission_field import load_filter
+    cmf = load_cmf_data(config["cmf"])
+    filter_curves = {label: load_filter(path) for label, path in config["filters"].items()}
+    policy = get_policy(config["precision"])
+    persister = Persister(config["output"], config["persist"], policy.storage, config["reference"])
+    illuminants = {illuminant_name(name): load_illuminant(name) for name in config["illuminants"]}
+    illumination = None
+    if illuminants:
+        illumination = IlluminationCache(dict(DEFAULT_CALIBRATION, **config["calibration"])["cache"])
+    if config["trace"] or config["prometheus"] or config["track_allocations"]:
+        instrument.configure(trace_path=config["trace"], prometheus_path=config["prometheus"],
+                             track_allocations=config["track_allocations"],
+                             allocation_threshold=int(config["allocation_threshold_mb"] * 2 ** 20))
+    return Resources(cmf, filter_curves, policy, persister, {}, illuminants, illumination)
+
+def process_cube(config, resources, hdr_path):
+    """Run filter -> render -> metrics for one cube. Returns its tidy metric rows."""
+    source = open_source(hdr_path, config["tile_rows"], config["prefetch"], resources.policy.compute)
+    stages = cube_stages(config, resources.filter_curves, resources.cmf, resources.persister, source,
+                         resources.matched, resources.illuminants, resources.illumination)
+    try:
+        result = run_stages(stages, {"source": source}, keep=("metrics",),
+                            sinks=resources.persister.sinks(source), file=hdr_path)
+    finally:
+        resources.persister.close(source)
+    return [dict(cube=hdr_path, **row) for row in result["metrics"]]
+
+def run_pipeline(config):
+    """
+    Run filter -> render -> metrics for every configured cube without intermediate files.
+    Returns:
+        List of tidy rows (cube, label, metric, statistic, value, delta).
+    """
+    resources = load_resources(config)
+    rows = []
+    for hdr_path in find_cubes(config["cubes"]):
+        print(f"Processing: {hdr_path}")
+        rows.extend(process_cube(config, resources, hdr_path))
+    instrument.get_tracer().write_prometheus()
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Filter, render and measure cubes in memory.")
+    parser.add_argument("config", nargs="?", help="JSON config (keys as pipeline.DEFAULT_CONFIG)")
+    parser.add_argument("--cubes", nargs="+", help="Override the configured cubes")
+    parser.add_argument("--persist", nargs="*", choices=PERSISTABLE, help="Intermediate products to save")
+    parser.add_argument("--results", help="Output CSV")
+    parser.add_argument("--trace", help="JSON-lines stage trace")
+    parser.add_argument("--track-allocations", action="store_true", default=None,
+                        help="Report large allocation sites of every stage in the trace (tracemalloc; slow)")
+    parser.add_argument("--allocation-threshold-mb", type=float,
+                        help="Smallest allocation growth reported by --track-allocations")
+    parser.add_argument("--profile", help="Run under the sampling profiler and save folded stacks here")
+    args = parser.parse_args()
+
+    config = load_config(args.config, cubes=args.cubes, persist=args.persist, results=args.results,
+                         trace=args.trace, track_allocations=args.track_allocations,
+                         allocation_threshold_mb=args.allocation_threshold_mb)
+    if args.profile:
+        with instrument.SamplingProfiler(args.profile):
+            rows = run_pipeline(config)
+    else:
+        rows = run_pipeline(config)
+    if not rows:
+        print("No cubes found.")
+        return
+    with open(config["results"], "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Saved: {config['results']}")
+
+if __name__ == "__main__":
+    main()
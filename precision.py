@@ -0,0 +1,241 @@
+import os
+import argparse
+from typing import NamedTuple
+import numpy as np
+
+STORAGE_DTYPES = ("uint16", "float16", "float32")
+ENVI_STORAGE_DTYPES = ("uint16", "float32")  # ENVI has no half-precision data type
+COMPUTE_DTYPES = ("float32", "float64")
+FLOAT16_MAX = float(np.finfo(np.float16).max)
+
+class PrecisionPolicy(NamedTuple):
+    """
+    Numeric precision of each stage.
+    storage: dtype of cubes written to disk (uint16 and float16 carry a data gain);
+             float16 is for SIDQ HDF5 files only, as ENVI has no half-precision type.
+    compute: dtype of cube tiles, XYZ planes and contrast maps.
+    accumulate: dtype of the spectral projection and of metric reductions.
+    """
+    storage: str = "float32"
+    compute: str = "float32"
+    accumulate: str = "float64"
+
+POLICIES = {
+    "reference": PrecisionPolicy("float32", "float64", "float64"),
+    "default": PrecisionPolicy("float32", "float32", "float64"),
+    "half": PrecisionPolicy("float16", "float32", "float64"),
+    "uint16": PrecisionPolicy("uint16", "float32", "float64"),
+    "fast": PrecisionPolicy("float16", "float32", "float32"),
+}
+# Policies whose storage dtype ENVI can hold (the SIDQ HDF5 writers accept them all)
+ENVI_POLICIES = sorted(name for name, policy in POLICIES.items() if policy.storage in ENVI_STORAGE_DTYPES)
+
+def get_policy(policy=None):
+    """Resolve a policy given as None (default), a name from POLICIES, a dict or a PrecisionPolicy."""
+    if policy is None:
+        return POLICIES["default"]
+    if isinstance(policy, str):
+        if policy not in POLICIES:
+            raise ValueError(f"Precision policy must be one of {sorted(POLICIES)}, got {policy}")
+        return POLICIES[policy]
+    if isinstance(policy, dict):
+        policy = PrecisionPolicy(**policy)
+    if policy.storage not in STORAGE_DTYPES:
+        raise ValueError(f"Storage dtype must be one of {STORAGE_DTYPES}, got {policy.storage}")
+    for stage in ("compute", "accumulate"):
+        if getattr(policy, stage) not in COMPUTE_DTYPES:
+            raise ValueError(f"{stage.capitalize()} dtype must be one of {COMPUTE_DTYPES}, got {getattr(policy, stage)}")
+    return policy
+
+def storage_gain(peak, storage):
+    """ENVI data gain that fits values up to peak into the storage dtype (stored value * gain = value)."""
+    if storage == "uint16":
+        return peak / 65535 if peak > 0 else 1.0
+    if storage == "float16" and peak > FLOAT16_MAX / 2:
+        return peak / FLOAT16_MAX * 2
+    return 1.0
+
+def encode_with_gain(values, storage, gain):
+    """Convert values to the storage dtype with a known gain."""
+    if storage == "uint16":
+        return np.round(np.clip(values / gain, 0, 65535)).astype(np.uint16)
+    if storage == "float16":
+        return (values / gain).astype(np.float16)
+    return np.asarray(values, dtype=np.float32)
+
+def encode(cube, storage):
+    """
+    Convert a cube to its storage dtype.
+    uint16 spreads [0, max] over the full integer range; float16 is rescaled only when values
+    would overflow. The scale is returned as the ENVI 'data gain'.
+    Returns:
+        (stored array, gain)
+    """
+    gain = storage_gain(float(np.max(cube)), storage)
+    return encode_with_gain(cube, storage, gain), gain
+
+def stream_peak(memmap, gain_offset=None, chunk_rows=256, hdr_path=None):
+    """
+    Upper bound of a cube's decoded values for choosing a gain before streaming it out.
+    With hdr_path, a fresh cube_index entry supplies the per-band maxima without reading the cube.
+    Otherwise integer-stored cubes use the dtype range without reading; float cubes are scanned by rows.
+    """
+    from cube_index import indexed_band_max
+    indexed = indexed_band_max(hdr_path) if hdr_path is not None else None
+    if indexed is not None:
+        peak = np.asarray(indexed, dtype=np.float64)
+    elif np.issubdtype(memmap.dtype, np.integer):
+        peak = np.full(memmap.shape[2], float(np.iinfo(memmap.dtype).max))
+    else:
+        peak = np.max([np.max(memmap[r:r + chunk_rows], axis=(0, 1)) for r in range(0, memmap.shape[0], chunk_rows)],
+                      axis=0).astype(np.float64)
+    if gain_offset is not None:
+        peak = peak * gain_offset[0] + gain_offset[1]
+    return float(np.max(peak))
+
+def storage_metadata(metadata, bands, gain):
+    """Header metadata with the data gain of an encoded cube (omitted when it is one); offsets are dropped."""
+    metadata = dict(metadata)
+    metadata.pop("data gain values", None)
+    metadata.pop("data offset values", None)
+    if gain != 1.0:
+        metadata["data gain values"] = [f"{gain:.9g}"] * bands
+    return metadata
+
+def data_gain(metadata, dtype=np.float32):
+    """Per-band (gain, offset) from ENVI metadata, or None when the header has neither."""
+    gains, offsets = metadata.get("data gain values"), metadata.get("data offset values")
+    if gains is None and offsets is None:
+        return None
+    bands = len(gains if gains is not None else offsets)
+    gains = np.array([float(g) for g in gains], dtype=dtype) if gains is not None else np.ones(bands, dtype)
+    offsets = np.array([float(o) for o in offsets], dtype=dtype) if offsets is not None else np.zeros(bands, dtype)
+    return gains, offsets
+
+def decode(stored, gain_offset=None, dtype=np.float32):
+    """Stored (... x bands) values as dtype radiance, applying (gain, offset) from data_gain."""
+    values = np.asarray(stored, dtype=dtype)
+    if gain_offset is not None:
+        gains, offsets = gain_offset
+        values = values * gains.astype(dtype) + offsets.astype(dtype)
+    return values
+
+def check_envi_storage(storage):
+    if storage not in ENVI_STORAGE_DTYPES:
+        raise ValueError(f"ENVI cubes can be stored as {ENVI_STORAGE_DTYPES}, not {storage}")
+
+def save_cube(hdr_path, cube, metadata, policy=None, force=True):
+    """Save a (rows x cols x bands) ENVI cube with the policy's storage dtype."""
+    import spectral
+    storage = get_policy(policy).storage
+    check_envi_storage(storage)
+    stored, gain = encode(cube, storage)
+    spectral.envi.save_image(hdr_path, stored, dtype=stored.dtype, force=force,
+                             metadata=storage_metadata(metadata, cube.shape[2], gain))
+    return hdr_path
+
+def load_cube(hdr_path, dtype=np.float32):
+    """Load a cube as dtype radiance, applying any data gain/offset in its header."""
+    import spectral
+    image = spectral.open_image(hdr_path)
+    return decode(image.open_memmap(interleave='bip'), data_gain(image.metadata), dtype)
+
+def save_hdf5_cube(mat_path, cube, policy=None, dataset='hsi'):
+    """Save a cube as a SIDQ-style HDF5 dataset in the policy's storage dtype (gain in attribute 'data_gain')."""
+    import h5py
+    stored, gain = encode(cube, get_policy(policy).storage)
+    with h5py.File(mat_path, 'w') as file:
+        file.create_dataset(dataset, data=stored)
+        if gain != 1.0:
+            file[dataset].attrs['data_gain'] = gain
+    return mat_path
+
+def load_hdf5_cube(mat_path, dtype=np.float32, dataset='hsi'):
+    """Load a SIDQ-style HDF5 cube as dtype values, applying any 'data_gain' attribute."""
+    import h5py
+    with h5py.File(mat_path, 'r') as file:
+        values = np.asarray(file[dataset][:], dtype=dtype)
+        gain = file[dataset].attrs.get('data_gain')
+    return values * np.dtype(dtype).type(gain) if gain is not None else values
+
+def storage_bytes(shape, storage):
+    return int(np.prod(shape)) * np.dtype(storage).itemsize
+
+def render_metrics(cube, wavelengths, transmission, cmf, policy, params=None):
+    """
+    Original and filtered renders of an in-memory cube under a policy, and their metrics.
+    Storage is simulated by an encode/decode round trip. Renders are not rounded to 8 bits so
+    that the error of the numeric path itself is measured.
+    Returns:
+        {(label, metric, statistic): value}
+    """
+    from pipeline import CubeSource, CubeTile, render_xyz, render_rgb, render_luminance, measure
+    policy = get_policy(policy)
+    stored, gain = encode(cube, policy.storage)
+    radiance = decode(stored, (np.full(cube.shape[2], gain), np.zeros(cube.shape[2])), policy.compute)
+    source = CubeSource("", radiance.shape, wavelengths, {}, iter([CubeTile(0, radiance)]))
+    matched = {"original": np.ones(len(wavelengths)), "filtered": transmission}
+    planes = render_xyz(source, matched, cmf, dtype=policy.compute, accumulate=policy.accumulate)
+    luminances = render_luminance(render_rgb(planes, quantize=False))
+    rows = measure(luminances, ("global", "local"), "original", params)
+    return {(r["label"], r["metric"], r["statistic"]): r["value"] for r in rows}
+
+def validate(cubes, policies=None, filter_file=None, cmf_file=None):
+    """
+    Metric error of every policy relative to the 'reference' policy on each cube.
+    Args:
+        cubes: List of (name, cube, wavelengths).
+        policies: Policy names to evaluate (default: all of POLICIES).
+    Returns:
+        Tidy rows (cube, policy, storage, compute, accumulate, bytes_ratio, label, metric,
+        statistic, reference, value, abs_error, rel_error).
+    """
+    from apply_filter import load_transmission_curve, match_transmission_to_cube
+    from hsi2rgb import load_cmf_data
+    cmf = load_cmf_data(cmf_file or os.path.join("cmfs", "cmf_2.csv"))
+    curve = load_transmission_curve(filter_file or os.path.join("tools", "filters", "amp.txt"))
+    rows = []
+    for name, cube, wavelengths in cubes:
+        transmission = match_transmission_to_cube(wavelengths, *curve)
+        reference = render_metrics(cube, wavelengths, transmission, cmf, "reference")
+        for policy_name in policies or POLICIES:
+            policy = get_policy(policy_name)
+            values = render_metrics(cube, wavelengths, transmission, cmf, policy)
+            ratio = storage_bytes(cube.shape, policy.storage) / storage_bytes(cube.shape, "float32")
+            for key, value in values.items():
+                error = abs(value - reference[key])
+                rows.append(dict(cube=name, policy=policy_name, **policy._asdict(), bytes_ratio=ratio,
+                                 label=key[0], metric=key[1], statistic=key[2], reference=reference[key],
+                                 value=value, abs_error=error, rel_error=error / (abs(reference[key]) + 1e-12)))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Metric error introduced by each precision policy.")
+    parser.add_argument("cubes", nargs="*", help="Reference ENVI cubes")
+    parser.add_argument("--synthetic", action="append", help="Synthetic cube size ROWSxCOLSxBANDS (repeatable)")
+    parser.add_argument("--policies", nargs="+", choices=sorted(POLICIES))
+    parser.add_argument("--filter", help="Transmission curve (default: tools/filters/amp.txt)")
+    parser.add_argument("--output", default="precision_validation.csv")
+    args = parser.parse_args()
+
+    import spectral
+    import pandas as pd
+    cubes = []
+    for hdr_path in args.cubes:
+        wavelengths = np.array([float(w) for w in spectral.open_image(hdr_path).metadata['wavelength']])
+        cubes.append((hdr_path, load_cube(hdr_path, np.float64), wavelengths))
+    if args.synthetic or not cubes:
+        from benchmark import parse_size, synthetic_rows, synthetic_wavelengths
+        for size in args.synthetic or ["256x256x160"]:
+            rows, cols, bands = parse_size(size)
+            wavelengths = synthetic_wavelengths(bands)
+            cubes.append((f"synthetic_{size}", synthetic_rows(0, rows, cols, wavelengths).astype(np.float64), wavelengths))
+
+    table = pd.DataFrame(validate(cubes, args.policies, args.filter))
+    table.to_csv(args.output, index=False)
+    summary = table.groupby(["policy", "storage", "compute", "accumulate", "bytes_ratio"])["rel_error"]
+    print(summary.agg(["median", "max"]).sort_values("max").to_string())
+    print(f"Saved: {args.output}")
+
+if __name__ == "__main__":
+    main()
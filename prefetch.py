@@ -0,0 +1,191 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+import numpy as np
+
+class ReadStats(NamedTuple):
+    """Timing of one prefetched read."""
+    item: object
+    nbytes: int
+    read_seconds: float    # time the reader spent reading
+    wait_seconds: float    # time the consumer blocked waiting for it (I/O-bound when large)
+    stall_seconds: float   # time the reader blocked waiting for a free buffer (compute-bound when large)
+
+    @property
+    def throughput(self):
+        """Read throughput in MB/s."""
+        return self.nbytes / 1e6 / max(self.read_seconds, 1e-9)
+
+class Prefetched(NamedTuple):
+    item: object
+    data: object
+    stats: ReadStats
+
+class BufferPool:
+    """
+    A fixed number of reusable byte buffers handed out as typed arrays.
+    acquire blocks while every buffer is in use, which is what bounds how far readers
+    can run ahead of the consumer. A buffer grows when a larger array is requested and is
+    otherwise reused as is.
+    """
+
+    def __init__(self, count):
+        self._free = deque(np.empty(0, dtype=np.uint8) for _ in range(count))
+        self._cond = threading.Condition()
+
+    def acquire(self, shape, dtype):
+        """Return (array view, raw buffer) of the given shape and dtype, blocking until one is free."""
+        with self._cond:
+            while not self._free:
+                self._cond.wait()
+            raw = self._free.popleft()
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if raw.size < nbytes:
+            raw = np.empty(nbytes, dtype=np.uint8)
+        return raw[:nbytes].view(dtype).reshape(shape), raw
+
+    def release(self, raw):
+        with self._cond:
+            self._free.append(raw)
+            self._cond.notify()
+
+class Prefetcher:
+    """
+    Iterate over items while background threads read the next `depth` of them.
+    read(item, allocate) returns the item's data; allocate(shape, dtype) hands out a pooled
+    buffer to read into, at most once per item (readers that cannot read in place may ignore it).
+    Results come back in item order, and the data of one item stays valid until the next item
+    is requested.
+    Usage:
+        for entry in Prefetcher(paths, envi_reader(), depth=2):
+            process(entry.data)
+    """
+
+    def __init__(self, items, read, depth=2, workers=None):
+        self.items = iter(items)
+        self.read = read
+        self.depth = max(1, depth)
+        self.workers = workers or self.depth
+        # One buffer per read in flight plus the one the consumer is working on
+        self.pool = BufferPool(self.depth + 1)
+        self.stats = []
+        self._futures = deque()
+
+    def _read(self, item):
+        held, stall = [], [0.0]
+
+        def allocate(shape, dtype=np.float32):
+            start = time.perf_counter()
+            array, raw = self.pool.acquire(shape, dtype)
+            stall[0] += time.perf_counter() - start
+            held.append(raw)
+            return array
+
+        start = time.perf_counter()
+        data = self.read(item, allocate)
+        seconds = time.perf_counter() - start - stall[0]
+        return item, data, held, seconds, stall[0]
+
+    @property
+    def pending(self):
+        """Number of reads currently queued or in flight."""
+        return len(self._futures)
+
+    def __iter__(self):
+        self._futures = deque()
+        with ThreadPoolExecutor(self.workers) as executor:
+            for item in self.items:
+                self._futures.append(executor.submit(self._read, item))
+                if len(self._futures) >= self.depth:
+                    break
+            held = []
+            while self._futures:
+                start = time.perf_counter()
+                item, data, new_held, seconds, stall = self._futures.popleft().result()
+                wait = time.perf_counter() - start
+                for raw in held:
+                    self.pool.release(raw)
+                held = new_held
+                for next_item in self.items:
+                    self._futures.append(executor.submit(self._read, next_item))
+                    break
+                stats = ReadStats(item, _nbytes(data), seconds, wait, stall)
+                self.stats.append(stats)
+                yield Prefetched(item, data, stats)
+            for raw in held:
+                self.pool.release(raw)
+
+    def summary(self):
+        """Totals over every read so far: files, MB, MB/s, and consumer wait / reader stall seconds."""
+        nbytes = sum(s.nbytes for s in self.stats)
+        seconds = sum(s.read_seconds for s in self.stats)
+        return {"files": len(self.stats), "megabytes": nbytes / 1e6,
+                "throughput": nbytes / 1e6 / max(seconds, 1e-9),
+                "wait_seconds": sum(s.wait_seconds for s in self.stats),
+                "stall_seconds": sum(s.stall_seconds for s in self.stats)}
+
+def _nbytes(data):
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    if isinstance(data, (tuple, list)):
+        return sum(_nbytes(d) for d in data)
+    if isinstance(data, dict):
+        return sum(_nbytes(d) for d in data.values())
+    return 0
+
+def envi_reader(interleave='bip', dtype=np.float32):
+    """Reader of whole ENVI cubes (item: header path) into pooled (rows x cols x bands) buffers."""
+    import spectral
+
+    def read(hdr_path, allocate):
+        memmap = spectral.open_image(hdr_path).open_memmap(interleave=interleave)
+        out = allocate(memmap.shape, dtype)
+        np.copyto(out, memmap, casting='unsafe')
+        return out
+    return read
+
+def envi_tile_items(hdr_path, tile_rows=256):
+    """(hdr_path, first row, last row) items covering a cube, for envi_tile_reader."""
+    import spectral
+    rows = int(spectral.open_image(hdr_path).shape[0])
+    return [(hdr_path, row, min(row + tile_rows, rows)) for row in range(0, rows, tile_rows)]
+
+def envi_tile_reader(dtype=np.float32):
+    """Reader of row tiles (items from envi_tile_items) into pooled (rows x cols x bands) buffers."""
+    import spectral
+    memmaps = {}
+    lock = threading.Lock()
+
+    def read(item, allocate):
+        hdr_path, row0, row1 = item
+        with lock:
+            if hdr_path not in memmaps:
+                memmaps[hdr_path] = spectral.open_image(hdr_path).open_memmap(interleave='bip')
+            memmap = memmaps[hdr_path]
+        out = allocate((row1 - row0,) + memmap.shape[1:], dtype)
+        np.copyto(out, memmap[row0:row1], casting='unsafe')
+        return out
+    return read
+
+def sidq_reader(dataset='hsi'):
+    """Reader of SIDQ .mat (HDF5) cubes straight into pooled buffers with read_direct."""
+    import h5py
+
+    def read(mat_path, allocate):
+        with h5py.File(mat_path, 'r') as f:
+            source = f[dataset]
+            out = allocate(source.shape, source.dtype)
+            source.read_direct(out)
+        return out
+    return read
+
+def image_reader(loader=None):
+    """Reader of rendered images (default: paired_eval.load_luminance); decoders allocate their own arrays."""
+    if loader is None:
+        from paired_eval import load_luminance as loader
+
+    def read(image_path, allocate):
+        return loader(image_path)
+    return read
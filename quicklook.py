@@ -0,0 +1,116 @@
+import os
+import json
+import argparse
+import numpy as np
+import cv2
+import spectral
+
+RGB_WAVELENGTHS = (640, 550, 460)
+DEFAULT_CMF_FILE = os.path.join("cmfs", "cmf_2.csv")
+
+def band_indices(wavelengths, targets=RGB_WAVELENGTHS):
+    """Indices of the bands closest to the target wavelengths."""
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    return [int(np.argmin(np.abs(wavelengths - t))) for t in targets]
+
+def preview_stride(shape, max_size=1024):
+    """Spatial stride that keeps the larger preview side at or below max_size."""
+    return max(1, -(-max(shape[:2]) // max_size))
+
+def _to_uint8(rgb, gamma=0.4):
+    """Robustly stretch an RGB float image to 8 bits (99th percentile white, gamma as in spectral2rgb)."""
+    white = np.percentile(rgb, 99) + 1e-12
+    return (np.clip(rgb / white, 0, 1) ** gamma * 255).astype(np.uint8)
+
+def render_quicklook(hdr_path, mode="bands", bands=None, max_size=1024, cmf_file=None, band_step=4):
+    """
+    Render a preview straight from the memory-mapped cube without reading all of it.
+    Args:
+        hdr_path: Path to the ENVI header.
+        mode: 'bands' maps three bands to R, G, B; 'cmf' projects a strided subset of bands
+              through the colour matching functions.
+        bands: Band indices for 'bands' mode (default: closest to 640/550/460 nm).
+        max_size: Largest preview side in pixels.
+        cmf_file: CMF CSV for 'cmf' mode.
+        band_step: Use every band_step-th band in 'cmf' mode.
+    Returns:
+        preview: uint8 BGR image (OpenCV channel order).
+        stride: Spatial stride; preview pixel (x, y) is cube pixel (x * stride, y * stride).
+    """
+    hdr_image = spectral.open_image(hdr_path)
+    memmap = hdr_image.open_memmap(interleave='bip')
+    stride = preview_stride(memmap.shape, max_size)
+    wavelengths = np.array([float(w) for w in hdr_image.metadata.get('wavelength', range(memmap.shape[2]))])
+
+    if mode == "bands":
+        bands = bands or band_indices(wavelengths)
+        rgb = np.stack([np.asarray(memmap[::stride, ::stride, b], dtype=np.float32) for b in bands], axis=-1)
+    else:
+        from hsi2rgb import xyz_to_srgb
+        cmf_data = np.loadtxt(cmf_file or DEFAULT_CMF_FILE, delimiter=",")
+        selected = np.arange(0, memmap.shape[2], band_step)
+        cube = np.asarray(memmap[::stride, ::stride, selected], dtype=np.float32)
+        cmf = np.stack([np.interp(wavelengths[selected], cmf_data[:, 0], cmf_data[:, i], left=0, right=0)
+                        for i in (1, 2, 3)], axis=1)
+        XYZ = cube @ cmf
+        rgb = xyz_to_srgb(XYZ / (XYZ[..., 1].max() + 1e-12))
+    return cv2.cvtColor(_to_uint8(rgb), cv2.COLOR_RGB2BGR), stride
+
+def quicklook_paths(hdr_path):
+    """Preview image and sidecar paths stored next to the cube."""
+    stem = os.path.splitext(hdr_path)[0]
+    return stem + ".quicklook.png", stem + ".quicklook.json"
+
+def cached_quicklook(hdr_path, mode="bands", bands=None, max_size=1024, cmf_file=None, band_step=4):
+    """
+    Return the cached preview of a cube, rendering it if missing or outdated.
+    The sidecar records the data file's size/mtime and the render settings; in 'cmf' mode
+    these include the CMF file (path and mtime) and the band step.
+    """
+    image_path, sidecar_path = quicklook_paths(hdr_path)
+    data_stat = os.stat(spectral.open_image(hdr_path).filename)
+    settings = {"mode": mode, "bands": bands, "max_size": max_size,
+                "size": data_stat.st_size, "mtime_ns": data_stat.st_mtime_ns,
+                "cmf_file": None, "cmf_mtime_ns": None, "band_step": None}
+    if mode == "cmf":
+        cmf_file = os.path.abspath(cmf_file or DEFAULT_CMF_FILE)
+        settings.update(cmf_file=cmf_file, cmf_mtime_ns=os.stat(cmf_file).st_mtime_ns, band_step=band_step)
+
+    if os.path.exists(image_path) and os.path.exists(sidecar_path):
+        with open(sidecar_path) as f:
+            sidecar = json.load(f)
+        if {k: sidecar.get(k) for k in settings} == settings:
+            preview = cv2.imread(image_path)
+            if preview is not None:
+                return preview, sidecar["stride"]
+
+    preview, stride = render_quicklook(hdr_path, mode, bands, max_size, cmf_file, band_step)
+    cv2.imwrite(image_path, preview)
+    with open(sidecar_path, "w") as f:
+        json.dump(dict(settings, stride=stride), f)
+    return preview, stride
+
+def to_full_resolution(x_min, y_min, x_max, y_max, stride, shape=None):
+    """Map a preview rectangle to cube pixel coordinates (clipped to the cube when shape is given)."""
+    box = [x_min * stride, y_min * stride, x_max * stride, y_max * stride]
+    if shape is not None:
+        rows, cols = shape[:2]
+        box = [min(box[0], cols), min(box[1], rows), min(box[2], cols), min(box[3], rows)]
+    return tuple(box)
+
+def main():
+    parser = argparse.ArgumentParser(description="Render cached quick-look previews of ENVI cubes.")
+    parser.add_argument("cubes", nargs="+", help="ENVI header files")
+    parser.add_argument("--mode", choices=["bands", "cmf"], default="bands")
+    parser.add_argument("--bands", type=int, nargs=3)
+    parser.add_argument("--max-size", type=int, default=1024)
+    parser.add_argument("--cmf", default=DEFAULT_CMF_FILE)
+    parser.add_argument("--band-step", type=int, default=4, help="Use every n-th band in cmf mode")
+    args = parser.parse_args()
+
+    for hdr_path in args.cubes:
+        preview, stride = cached_quicklook(hdr_path, args.mode, args.bands, args.max_size, args.cmf, args.band_step)
+        print(f"Preview: {quicklook_paths(hdr_path)[0]} ({preview.shape[1]}x{preview.shape[0]}, stride {stride})")
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,117 @@
-import pandas as pd
+import os
+import argparse
 import numpy as np
 
-# Simulated results for global and local contrast measures
-# (Note: Replace these placeholder values with actual computations)
-scenes = ["Snow", "Trails", "Tarmac"]
-
-# Simulated global contrast measures (mean for each scene)
-global_contrast_data = {
-    "Scene": scenes,
-    "Max-Min Luminance Ratio": [2.57, 3.1, 2.9],
-    "Weber Contrast": [1.57, 1.8, 1.7],
-    "Michelson Contrast": [0.38, 0.45, 0.4],
-    "RMS Contrast": [0.07, 0.08, 0.06]
-}
-
-# Simulated local contrast statistics (mean, variance, max, min) for each scene
-local_contrast_data = {
-    "Scene": scenes,
-    "Mean (Local Contrast)": [0.1, 0.15, 0.12],
-    "Variance (Local Contrast)": [0.02, 0.03, 0.025],
-    "Max (Local Contrast)": [0.3, 0.4, 0.35],
-    "Min (Local Contrast)": [0.01, 0.02, 0.015],
-}
-
-# Overall statistics across all scenes
-overall_statistics = {
-    "Global Contrast": {
-        "Max-Min Luminance Ratio": np.mean([2.57, 3.1, 2.9]),
-        "Weber Contrast": np.mean([1.57, 1.8, 1.7]),
-        "Michelson Contrast": np.mean([0.38, 0.45, 0.4]),
-        "RMS Contrast": np.mean([0.07, 0.08, 0.06]),
-    },
-    "Local Contrast": {
-        "Mean": np.mean([0.1, 0.15, 0.12]),
-        "Variance": np.mean([0.02, 0.03, 0.025]),
-        "Max": np.mean([0.3, 0.4, 0.35]),
-        "Min": np.mean([0.01, 0.02, 0.015]),
-    }
-}
+from metric_store import open_store, load_metrics
+from measurement import GLOBAL_METRICS
+
+REFERENCE_FILTER = "original"
+# Rows of one image are only averaged within one rendering condition
+GROUP_COLUMNS = ["scene", "filter", "illuminant", "observer", "params"]
+
+def load_frame(conn, metrics=None, **where):
+    """
+    Load per-image metric rows from the store.
+    The store is append-only and keyed by content, so a re-rendered image keeps the rows of its old
+    content; only the newest row per image file and rendering condition is returned.
+    Returns a DataFrame with scene, filter, image (file name, shared by the renders of one capture),
+    metric and value columns.
+    """
+    if metrics is not None:
+        where["metric"] = list(metrics)
+    frame = load_metrics(conn, **where)
+    frame = frame.sort_values("created_at", kind="stable").drop_duplicates(
+        ["image_path", "filter", "illuminant", "observer", "metric", "params"], keep="last")
+    frame["image"] = frame["image_path"].map(lambda p: os.path.splitext(os.path.basename(p or ""))[0])
+    return frame[["scene", "filter", "illuminant", "observer", "image", "metric", "params", "value"]]
+
+def bootstrap_ci(values, n_resamples=5000, alpha=0.05, rng=None):
+    """
+    Percentile bootstrap confidence interval of the mean, for every column at once.
+    Args:
+        values: (samples x metrics) array.
+        n_resamples: Number of bootstrap resamples.
+        alpha: Two-sided significance level.
+    Returns:
+        low, high: Arrays with one bound per column.
+    """
+    rng = np.random.default_rng(rng)
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    n = values.shape[0]
+    if n < 2:
+        return values.mean(axis=0), values.mean(axis=0)
+
+    # All resamples are drawn and averaged as one (resamples x samples x metrics) operation
+    indices = rng.integers(0, n, size=(n_resamples, n))
+    means = np.nanmean(values[indices], axis=1)
+    low, high = np.nanpercentile(means, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    return low, high
 
-# Create DataFrames for global and local contrast
-global_contrast_df = pd.DataFrame(global_contrast_data)
-local_contrast_df = pd.DataFrame(local_contrast_data)
+def _summarise(frame, group_columns, n_resamples, alpha, rng):
+    """Mean, spread and bootstrap CI of value per group and metric."""
+    import pandas as pd
+    rows = []
+    for key, group in frame.groupby(group_columns, sort=True):
+        # One images x metrics matrix per group, so the bootstrap runs on all metrics together
+        duplicated = group.duplicated(["image", "metric"])
+        if duplicated.any():
+            raise ValueError(f"Several rows per image and metric in group {key}: "
+                             f"{sorted(group.loc[duplicated, 'image'].unique())[:5]}")
+        wide = group.pivot_table(index="image", columns="metric", values="value", aggfunc="first")
+        values = wide.to_numpy(dtype=np.float64)
+        low, high = bootstrap_ci(values, n_resamples, alpha, rng)
+        key = key if isinstance(key, tuple) else (key,)
+        for j, metric in enumerate(wide.columns):
+            column = values[:, j]
+            rows.append(dict(zip(group_columns, key), metric=metric, n=int(np.sum(~np.isnan(column))),
+                             mean=np.nanmean(column), std=np.nanstd(column), min=np.nanmin(column),
+                             max=np.nanmax(column), ci_low=low[j], ci_high=high[j]))
+    return pd.DataFrame(rows)
 
-# Add overall statistics to the tables
-global_contrast_df.loc[len(global_contrast_df)] = ["Overall Average"] + list(overall_statistics["Global Contrast"].values())
-local_contrast_df.loc[len(local_contrast_df)] = ["Overall Average"] + list(overall_statistics["Local Contrast"].values())
+def summary_table(frame, n_resamples=5000, alpha=0.05, rng=0):
+    """Group-by over scene x filter x illuminant x observer x params x metric with bootstrap confidence intervals."""
+    return _summarise(frame, GROUP_COLUMNS, n_resamples, alpha, rng)
 
+def paired_deltas(frame, reference=REFERENCE_FILTER):
+    """
+    Per-image differences between every filter and the reference render of the same capture.
+    Returns a DataFrame with scene, filter, image, metric, value (filtered), reference_value and delta.
+    """
+    keys = ["scene", "illuminant", "observer", "image", "metric", "params"]
+    original = frame[frame["filter"] == reference].drop(columns="filter")
+    filtered = frame[frame["filter"] != reference]
+    paired = filtered.merge(original, on=keys, suffixes=("", "_reference"))
+    paired = paired.rename(columns={"value_reference": "reference_value"})
+    paired["delta"] = paired["value"] - paired["reference_value"]
+    return paired
+
+def delta_table(frame, reference=REFERENCE_FILTER, n_resamples=5000, alpha=0.05, rng=0):
+    """Mean paired delta per condition (GROUP_COLUMNS) and metric with bootstrap confidence intervals."""
+    paired = paired_deltas(frame, reference)
+    paired = paired.drop(columns="value").rename(columns={"delta": "value"})
+    return _summarise(paired, GROUP_COLUMNS, n_resamples, alpha, rng)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build global and local contrast tables from the metric store.")
+    parser.add_argument("--db", default="metrics.sqlite")
+    parser.add_argument("--resamples", type=int, default=5000)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--output-prefix", default="contrast_report")
+    args = parser.parse_args()
+
+    frame = load_frame(open_store(args.db))
+    is_global = frame["metric"].isin(GLOBAL_METRICS)
+    tables = {
+        "global": summary_table(frame[is_global], args.resamples, args.alpha),
+        "local": summary_table(frame[~is_global], args.resamples, args.alpha),
+        "deltas": delta_table(frame, n_resamples=args.resamples, alpha=args.alpha),
+    }
+    for name, table in tables.items():
+        output_path = f"{args.output_prefix}_{name}.csv"
+        table.to_csv(output_path, index=False)
+        print(f"Saved: {output_path} ({len(table)} rows)")
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import os
+import csv
+import json
+import argparse
+import numpy as np
+from collections import OrderedDict
+
+def summed_area_tables(luminance):
+    """
+    Summed-area tables of a plane and of its square, with a leading row and column of zeros.
+    Pass a plane with its mean subtracted: the tables then stay small and box variances keep
+    their precision (E[x^2] - mean^2 cancels catastrophically on an uncentred plane).
+    """
+    values = np.asarray(luminance, dtype=np.float64)
+    sat = np.zeros((values.shape[0] + 1, values.shape[1] + 1))
+    sat2 = np.zeros_like(sat)
+    np.cumsum(np.cumsum(values, axis=0), axis=1, out=sat[1:, 1:])
+    np.cumsum(np.cumsum(values * values, axis=0), axis=1, out=sat2[1:, 1:])
+    return sat, sat2
+
+def running_extremum(values, size, axis, function):
+    """
+    Running max (function=np.maximum) or min (np.minimum) over windows of length size along axis,
+    using the van Herk/Gil-Werman block prefix/suffix scheme (three comparisons per sample).
+    Output index i covers input samples i .. i + size - 1.
+    """
+    values = np.moveaxis(values, axis, -1)
+    n = values.shape[-1]
+    blocks = -(-n // size)
+    fill = -np.inf if function is np.maximum else np.inf
+    padded = np.full(values.shape[:-1] + (blocks * size,), fill)
+    padded[..., :n] = values
+    shaped = padded.reshape(values.shape[:-1] + (blocks, size))
+    prefix = function.accumulate(shaped, axis=-1).reshape(padded.shape)
+    suffix = function.accumulate(shaped[..., ::-1], axis=-1)[..., ::-1].reshape(padded.shape)
+    result = function(suffix[..., :n - size + 1], prefix[..., size - 1:n])
+    return np.moveaxis(result, -1, axis)
+
+class ROIContrast:
+    """
+    Constant-time global contrast of rectangles and sliding windows on one luminance plane.
+    Summed-area tables are built once, so means and variances cost O(1) per rectangle.
+    Extrema come from running min/max planes when many rectangles share a size; each pair of
+    planes costs a pass over the image and two float64 planes of memory, so only the
+    max_extrema most recently used sizes are kept, and sizes whose rectangles cover less than
+    the image are read directly from the pixels instead.
+    """
+
+    def __init__(self, luminance, max_extrema=4):
+        self.luminance = np.asarray(luminance, dtype=np.float64)
+        self.offset = float(self.luminance.mean()) if self.luminance.size else 0.0
+        self.sat, self.sat2 = summed_area_tables(self.luminance - self.offset)
+        self.max_extrema = max_extrema
+        self._extrema = OrderedDict()
+
+    def extrema(self, height, width):
+        """Running (min, max) planes for height x width windows, indexed by the top-left corner."""
+        key = (height, width)
+        if key in self._extrema:
+            self._extrema.move_to_end(key)
+            return self._extrema[key]
+        lo = running_extremum(running_extremum(self.luminance, height, 0, np.minimum), width, 1, np.minimum)
+        hi = running_extremum(running_extremum(self.luminance, height, 0, np.maximum), width, 1, np.maximum)
+        self._extrema[key] = (lo, hi)
+        while len(self._extrema) > self.max_extrema:
+            self._extrema.popitem(last=False)
+        return lo, hi
+
+    def _box(self, table, x, y, w, h):
+        return table[y + h, x + w] - table[y, x + w] - table[y + h, x] + table[y, x]
+
+    def rectangles(self, rects):
+        """
+        Contrast of every rectangle in rects.
+        Rectangles are clipped to the image, like crops; one left empty by clipping raises a ValueError.
+        Args:
+            rects: (N x 4) integer array of (x, y, width, height).
+        Returns:
+            Dictionary of length-N arrays: mean, max_min_ratio, weber_contrast,
+            michelson_contrast, rms_contrast.
+        """
+        rects = np.atleast_2d(np.asarray(rects, dtype=np.int64))
+        x, y, w, h = self.clip(rects)
+        count = (w * h).astype(np.float64)
+        centred_mean = self._box(self.sat, x, y, w, h) / count
+        variance = self._box(self.sat2, x, y, w, h) / count - centred_mean ** 2
+        mean = centred_mean + self.offset
+
+        lum_min, lum_max = np.empty(len(rects)), np.empty(len(rects))
+        for size in {(int(a), int(b)) for a, b in zip(h, w)}:
+            selected = np.flatnonzero((h == size[0]) & (w == size[1]))
+            if size in self._extrema or selected.size * size[0] * size[1] >= self.luminance.size:
+                lo, hi = self.extrema(*size)
+                lum_min[selected] = lo[y[selected], x[selected]]
+                lum_max[selected] = hi[y[selected], x[selected]]
+                continue
+            # Reading these pixels costs less than a pass over the whole image
+            for i in selected:
+                region = self.luminance[y[i]:y[i] + size[0], x[i]:x[i] + size[1]]
+                lum_min[i], lum_max[i] = region.min(), region.max()
+        # The extrema are exact: a constant region has no variance, and no region spreads more than
+        # half its range, so rounding left over in the tables cannot show up as contrast
+        variance = np.clip(variance, 0, ((lum_max - lum_min) / 2) ** 2)
+        mean = np.clip(mean, lum_min, lum_max)
+        return contrast_from_moments(mean, variance, lum_min, lum_max)
+
+    def clip(self, rects):
+        """Clip (N x 4) rectangles to the image and return their x, y, width and height columns."""
+        rows, cols = self.luminance.shape
+        x, y, w, h = rects.T
+        x0, y0 = np.clip(x, 0, cols), np.clip(y, 0, rows)
+        x1, y1 = np.clip(x + w, 0, cols), np.clip(y + h, 0, rows)
+        empty = np.flatnonzero((x1 <= x0) | (y1 <= y0))
+        if empty.size:
+            raise ValueError(f"Rectangles outside the {cols}x{rows} image: {rects[empty].tolist()}")
+        return x0, y0, x1 - x0, y1 - y0
+
+    def windows(self, height, width, step=1):
+        """Contrast maps of all height x width windows placed every step pixels."""
+        rows = np.arange(0, self.luminance.shape[0] - height + 1, step)
+        cols = np.arange(0, self.luminance.shape[1] - width + 1, step)
+        y, x = np.meshgrid(rows, cols, indexing='ij')
+        rects = np.stack([x.ravel(), y.ravel(), np.full(x.size, width), np.full(x.size, height)], axis=1)
+        return {name: values.reshape(y.shape) for name, values in self.rectangles(rects).items()}
+
+    def polygon(self, points):
+        """Contrast inside a polygon given as [[x, y], ...] (cost proportional to its bounding box)."""
+        import cv2
+        points = np.asarray(points, dtype=np.int32)
+        x0, y0 = np.maximum(points.min(axis=0), 0)
+        x1, y1 = np.minimum(points.max(axis=0) + 1, self.luminance.shape[::-1])
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError(f"Polygon outside the image: {points.tolist()}")
+        mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        cv2.fillPoly(mask, [points - [x0, y0]], 1)
+        values = self.luminance[y0:y1, x0:x1][mask.astype(bool)]
+        return {name: float(value[0]) for name, value in contrast_from_moments(
+            np.array([values.mean()]), np.array([values.var()]),
+            np.array([values.min()]), np.array([values.max()])).items()}
+
+def contrast_from_moments(mean, variance, lum_min, lum_max):
+    """Global contrast metrics (as in measurement.luminance_contrast) from region moments and extrema."""
+    return {
+        "mean": mean,
+        "max_min_ratio": lum_max / (lum_min + 1e-6),
+        "weber_contrast": (lum_max - lum_min) / (lum_min + 1e-6),
+        "michelson_contrast": (lum_max - lum_min) / (lum_max + lum_min + 1e-6),
+        "rms_contrast": np.sqrt(variance),
+    }
+
+def load_rois(file_path):
+    """
+    Load regions of interest from JSON or CSV.
+    JSON: [{"label": "road", "rect": [x, y, w, h]}, {"label": "snow", "polygon": [[x, y], ...]}, ...]
+    CSV: columns label, x, y, width, height.
+    """
+    if file_path.endswith(".json"):
+        with open(file_path) as f:
+            return json.load(f)
+    with open(file_path, newline="") as f:
+        return [{"label": row["label"], "rect": [int(row[k]) for k in ("x", "y", "width", "height")]}
+                for row in csv.DictReader(f)]
+
+def roi_table(luminance, rois):
+    """Contrast metrics for every ROI as a list of dictionaries (rectangles are batched)."""
+    engine = ROIContrast(luminance)
+    for i, roi in enumerate(rois):
+        if "rect" not in roi and "polygon" not in roi:
+            raise ValueError(f"ROI {roi.get('label', i)!r} has neither a rect nor a polygon")
+    rows = [None] * len(rois)
+    rect_indices = [i for i, roi in enumerate(rois) if "rect" in roi]
+    if rect_indices:
+        results = engine.rectangles([rois[i]["rect"] for i in rect_indices])
+        for k, i in enumerate(rect_indices):
+            rows[i] = {name: float(values[k]) for name, values in results.items()}
+    for i, roi in enumerate(rois):
+        if "polygon" in roi:
+            rows[i] = engine.polygon(roi["polygon"])
+    return [dict(label=roi.get("label", str(i)), **row) for i, (roi, row) in enumerate(zip(rois, rows))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Global contrast over regions of interest.")
+    parser.add_argument("images", nargs="+", help="Rendered images to measure")
+    parser.add_argument("--rois", required=True, help="ROI list (JSON or CSV)")
+    parser.add_argument("--output", default="roi_contrast.csv")
+    args = parser.parse_args()
+
+    from paired_eval import load_luminance
+    rois = load_rois(args.rois)
+    rows = []
+    for image_path in args.images:
+        print(f"Processing: {image_path}")
+        rows.extend(dict(image=os.path.basename(image_path), **row) for row in roi_table(load_luminance(image_path), rois))
+
+    with open(args.output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Saved: {args.output}")
+
+if __name__ == "__main__":
+    main()
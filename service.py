@@ -0,0 +1,454 @@
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import argparse
+import threading
+import traceback
+import http.client
+import socketserver
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+from instrument import METRIC_PREFIX
+
+DEFAULT_PORT = 8765
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+# Request metric names -> paired_eval map names (global values come from measurement.luminance_contrast)
+LOCAL_METRICS = {"peli": ("peli",), "dog": ("dog_center", "dog_surround", "dog_cps"), "cab": ("cab",),
+                 "iordache": ("iordache",)}
+METRICS = ("global",) + tuple(LOCAL_METRICS)
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by the total weight of its entries
+    (bytes for arrays, one per entry by default).
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.weight = 0
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value, weight=1):
+        with self._lock:
+            if key in self._entries:
+                self.weight -= self._entries.pop(key)[1]
+            self._entries[key] = (value, weight)
+            self.weight += weight
+            while self.weight > self.capacity and len(self._entries) > 1:
+                self.weight -= self._entries.popitem(last=False)[1][1]
+
+    def __len__(self):
+        return len(self._entries)
+
+class Histogram:
+    """Cumulative histogram in the Prometheus layout (bucket upper bounds, sum and count)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+            self.total += value
+            self.count += 1
+
+    def lines(self, name, labels=""):
+        separator = "," if labels else ""
+        with self._lock:
+            lines = [f'{name}_bucket{{{labels}{separator}le="{bound:g}"}} {count}'
+                     for bound, count in zip(self.buckets, self.counts)]
+            lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {self.count}')
+            lines.append(f"{name}_sum{{{labels}}} {self.total:g}" if labels else f"{name}_sum {self.total:g}")
+            lines.append(f"{name}_count{{{labels}}} {self.count}" if labels else f"{name}_count {self.count}")
+        return lines
+
+def file_signature(*paths):
+    """(size, mtime_ns) of each file, so cached planes are dropped when an input is rewritten."""
+    return tuple((s.st_size, s.st_mtime_ns) for s in (os.stat(path) for path in paths))
+
+def params_key(params):
+    return json.dumps(params, sort_keys=True)
+
+class Batcher:
+    """
+    Coalesces concurrent local-metric requests.
+    Planes submitted within max_wait seconds of each other (up to max_batch) are evaluated
+    together: planes of one shape share a padding/FFT plan and the cached kernel spectra, and
+    a plane requested by several clients at once is evaluated once.
+    """
+
+    def __init__(self, max_batch=16, max_wait=0.005):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batch_sizes = Histogram(BATCH_BUCKETS)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, key, plane, params):
+        """Future of {metric: summary statistics} for one plane."""
+        future = Future()
+        self._queue.put((key, plane, params, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        from paired_eval import local_contrast_maps, summarise_map
+        while True:
+            batch = self._collect()
+            self.batch_sizes.observe(len(batch))
+            groups = {}
+            for key, plane, params, future in batch:
+                group = groups.setdefault((plane.shape, params_key(params)), ({}, {}, params))
+                group[0][key] = plane
+                group[1].setdefault(key, []).append(future)
+            for planes, futures, params in groups.values():
+                try:
+                    maps = local_contrast_maps(planes, params)
+                    results = {key: {metric: summarise_map(contrast_map) for metric, contrast_map in plane_maps.items()}
+                               for key, plane_maps in maps.items()}
+                except Exception as e:
+                    for waiting in futures.values():
+                        for future in waiting:
+                            future.set_exception(e)
+                    continue
+                for key, waiting in futures.items():
+                    for future in waiting:
+                        future.set_result(results[key])
+
+class ContrastService:
+    """
+    Contrast scores of images, luminance arrays and ENVI cubes, with warm state:
+    the CMFs and filter curves of the pipeline config are loaded once, transmissions are
+    resampled once per wavelength grid, kernel spectra stay in freqfilters' caches, and recent
+    luminance planes and scores are kept in LRU caches keyed by file signature.
+    Requests (JSON):
+        {"image": path} | {"luminance": path.npy} | {"cube": path.hdr, "filters": [labels]}
+        plus optional "metrics" (subset of METRICS) and "params" (paired_eval.DEFAULT_PARAMS keys).
+    """
+
+    def __init__(self, config=None, cache_bytes=512 * 2 ** 20, score_entries=4096, max_batch=16, max_wait=0.005):
+        from pipeline import load_config, load_resources
+        self.config = load_config(config)
+        self.resources = load_resources(self.config)
+        self.planes = LRUCache(cache_bytes)
+        self.scores = LRUCache(score_entries)
+        self.batcher = Batcher(max_batch, max_wait)
+        self.latency = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, seconds):
+        with self._lock:
+            histogram = self.latency.setdefault(endpoint, Histogram(LATENCY_BUCKETS))
+        histogram.observe(seconds)
+
+    def image_planes(self, path):
+        from paired_eval import load_luminance
+        key = ("image", os.path.abspath(path), file_signature(path))
+        plane = self.planes.get(key)
+        if plane is None:
+            plane = load_luminance(path)
+            self.planes.put(key, plane, plane.nbytes)
+        return {"image": (key, plane)}
+
+    def array_planes(self, path):
+        key = ("luminance", os.path.abspath(path), file_signature(path))
+        plane = self.planes.get(key)
+        if plane is None:
+            plane = np.load(path).astype(np.float32)
+            self.planes.put(key, plane, plane.nbytes)
+        return {"luminance": (key, plane)}
+
+    def cube_planes(self, hdr_path, labels=None):
+        """Luminance planes of a cube's renders (reference and filters), rendering only on a cache miss."""
+        from ingest import find_data_file
+        from pipeline import open_source, transmissions, render_xyz, render_rgb, render_luminance
+        config, resources = self.config, self.resources
+        labels = list(labels or [config["reference"]] + list(resources.filter_curves))
+        data_path = find_data_file(hdr_path)
+        if data_path is None:
+            raise FileNotFoundError(f"No data file next to {hdr_path}")
+        signature = file_signature(hdr_path, data_path)
+        keys = {label: ("cube", os.path.abspath(hdr_path), signature, label, config["quantize"]) for label in labels}
+        planes = {label: self.planes.get(key) for label, key in keys.items()}
+        if any(plane is None for plane in planes.values()):
+            source = open_source(hdr_path, config["tile_rows"], 0, resources.policy.compute)
+            matched = transmissions(source, resources.filter_curves, config["reference"], resources.matched)
+            unknown = set(labels) - set(matched)
+            if unknown:
+                raise ValueError(f"Unknown filters {sorted(unknown)}; configured: {sorted(matched)}")
+            xyz = render_xyz(source, {label: matched[label] for label in labels}, resources.cmf,
+                             dtype=resources.policy.compute, accumulate=resources.policy.accumulate)
+            planes = render_luminance(render_rgb(xyz, config["quantize"]))
+            for label, plane in planes.items():
+                self.planes.put(keys[label], plane, plane.nbytes)
+        return {label: (keys[label], planes[label]) for label in labels}
+
+    def score(self, request):
+        """Tidy rows (label, metric, statistic, value) for one request."""
+        from measurement import luminance_contrast, GLOBAL_METRICS
+        from paired_eval import DEFAULT_PARAMS
+        metrics = request.get("metrics") or list(METRICS)
+        unknown = set(metrics) - set(METRICS)
+        if unknown:
+            raise ValueError(f"Unknown metrics {sorted(unknown)}; available: {list(METRICS)}")
+        params = dict(DEFAULT_PARAMS, **request.get("params", {}))
+        if "image" in request:
+            planes = self.image_planes(request["image"])
+        elif "luminance" in request:
+            planes = self.array_planes(request["luminance"])
+        elif "cube" in request:
+            planes = self.cube_planes(request["cube"], request.get("filters"))
+        else:
+            raise ValueError("Request needs one of 'image', 'luminance' or 'cube'")
+
+        pending, rows = {}, []
+        for label, (key, plane) in planes.items():
+            if "global" in metrics:
+                values = self.scores.get((key, "global"))
+                if values is None:
+                    values = [float(v) for v in luminance_contrast(plane)]
+                    self.scores.put((key, "global"), values)
+                rows += [{"label": label, "metric": metric, "statistic": "value", "value": value}
+                         for metric, value in zip(GLOBAL_METRICS, values)]
+            if set(metrics) & set(LOCAL_METRICS):
+                stats = self.scores.get((key, params_key(params)))
+                pending[label] = (key, stats if stats is not None else self.batcher.submit(key, plane, params))
+        for label, (key, stats) in pending.items():
+            if isinstance(stats, Future):
+                stats = stats.result()
+                self.scores.put((key, params_key(params)), stats)
+            for metric in metrics:
+                for name in LOCAL_METRICS.get(metric, ()):
+                    rows += [{"label": label, "metric": name, "statistic": statistic, "value": value}
+                             for statistic, value in stats[name].items()]
+        return rows
+
+    def prometheus(self):
+        """Latency and batch-size histograms plus cache statistics in the Prometheus text format."""
+        name = f"{METRIC_PREFIX}_service_request_seconds"
+        lines = [f"# HELP {name} Request latency.", f"# TYPE {name} histogram"]
+        with self._lock:
+            latency = sorted(self.latency.items())
+        for endpoint, histogram in latency:
+            lines += histogram.lines(name, f'endpoint="{endpoint}"')
+        name = f"{METRIC_PREFIX}_service_batch_size"
+        lines += [f"# HELP {name} Planes evaluated per local-metric batch.", f"# TYPE {name} histogram"]
+        lines += self.batcher.batch_sizes.lines(name)
+        for cache_name, cache in (("planes", self.planes), ("scores", self.scores)):
+            for key, value in (("hits", cache.hits), ("misses", cache.misses), ("entries", len(cache)),
+                               ("weight", cache.weight)):
+                lines.append(f'{METRIC_PREFIX}_service_cache_{key}{{cache="{cache_name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+class Handler(BaseHTTPRequestHandler):
+    """POST /score with a JSON request; GET /metrics (Prometheus) and GET /health."""
+    service = None
+
+    def address_string(self):
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def reply(self, status, body, content_type="application/json"):
+        payload = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self.reply(200, self.service.prometheus(), "text/plain; version=0.0.4")
+        elif self.path == "/health":
+            self.reply(200, {"status": "ok"})
+        else:
+            self.reply(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/score":
+            self.reply(404, {"error": f"Unknown path {self.path}"})
+            return
+        start = time.perf_counter()
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            rows = self.service.score(request)
+            status, body = 200, {"results": rows}
+        except (ValueError, KeyError, FileNotFoundError) as e:
+            status, body = 400, {"error": f"{type(e).__name__}: {e}"}
+        except Exception as e:
+            traceback.print_exc()
+            status, body = 500, {"error": f"{type(e).__name__}: {e}"}
+        seconds = time.perf_counter() - start
+        self.service.observe("score", seconds)
+        self.reply(status, dict(body, seconds=seconds))
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(service, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, verbose=False):
+    """HTTP server for the service on localhost:port, or on a Unix socket when socket_path is given."""
+    handler = type("ServiceHandler", (Handler,), {"service": service})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, handler)
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+    server.verbose = verbose
+    return server
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=60):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class ServiceClient:
+    """Minimal client for the service (one connection per request, safe to share between threads)."""
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, timeout=60):
+        self.host, self.port, self.socket_path, self.timeout = host, port, socket_path, timeout
+
+    def _request(self, method, path, body=None):
+        if self.socket_path:
+            connection = UnixHTTPConnection(self.socket_path, self.timeout)
+        else:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            payload = json.dumps(body).encode() if body is not None else None
+            connection.request(method, path, payload, {"Content-Type": "application/json"} if payload else {})
+            response = connection.getresponse()
+            return response.status, response.read().decode()
+        finally:
+            connection.close()
+
+    def score(self, **request):
+        """Score one input (keyword arguments as a service request). Raises RuntimeError on errors."""
+        status, text = self._request("POST", "/score", request)
+        body = json.loads(text)
+        if status != 200:
+            raise RuntimeError(f"Service error {status}: {body.get('error')}")
+        return body["results"]
+
+    def metrics(self):
+        return self._request("GET", "/metrics")[1]
+
+def request_from_path(path, metrics=None, filters=None):
+    """Service request for a file: .hdr -> cube, .npy -> luminance, anything else -> image."""
+    extension = os.path.splitext(path)[1].lower()
+    kind = {".hdr": "cube", ".npy": "luminance"}.get(extension, "image")
+    request = {kind: os.path.abspath(path)}
+    if metrics:
+        request["metrics"] = metrics
+    if filters and kind == "cube":
+        request["filters"] = filters
+    return request
+
+def main():
+    parser = argparse.ArgumentParser(description="Localhost contrast-scoring service and client.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="Run the service")
+    serve.add_argument("--config", help="pipeline JSON config (CMF, filters, precision...)")
+    serve.add_argument("--cache-mb", type=float, default=512, help="Memory for cached luminance planes")
+    serve.add_argument("--max-batch", type=int, default=16)
+    serve.add_argument("--max-wait-ms", type=float, default=5.0, help="How long a batch waits for more requests")
+    serve.add_argument("--verbose", action="store_true", help="Log every request")
+    score = subparsers.add_parser("score", help="Score files with a running service")
+    score.add_argument("paths", nargs="+", help="Images, .npy luminance planes or ENVI headers")
+    score.add_argument("--metrics", nargs="+", choices=METRICS)
+    score.add_argument("--filters", nargs="+", help="Render labels for cubes (default: all configured)")
+    score.add_argument("--concurrency", type=int, default=4, help="Requests in flight")
+    score.add_argument("--repeat", type=int, default=1, help="Send every request this many times")
+    stats = subparsers.add_parser("stats", help="Print the service's Prometheus metrics")
+    for sub in (serve, score, stats):
+        sub.add_argument("--host", default="127.0.0.1")
+        sub.add_argument("--port", type=int, default=DEFAULT_PORT)
+        sub.add_argument("--socket", help="Unix socket path instead of TCP")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        service = ContrastService(args.config, int(args.cache_mb * 2 ** 20), max_batch=args.max_batch,
+                                  max_wait=args.max_wait_ms / 1000)
+        server = make_server(service, args.host, args.port, args.socket, args.verbose)
+        print(f"Serving on {args.socket or f'http://{args.host}:{args.port}'} (Ctrl-C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    client = ServiceClient(args.host, args.port, args.socket)
+    if args.command == "stats":
+        print(client.metrics(), end="")
+        return
+
+    def send(path):
+        start = time.perf_counter()
+        rows = client.score(**request_from_path(path, args.metrics, args.filters))
+        return path, rows, time.perf_counter() - start
+
+    failed = False
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        futures = [pool.submit(send, path) for path in args.paths for _ in range(args.repeat)]
+        for future in futures:
+            try:
+                path, rows, seconds = future.result()
+            except Exception as e:
+                print(f"Error: {e}", file=sys.stderr)
+                failed = True
+                continue
+            print(f"{path} ({seconds * 1000:.1f} ms)")
+            for row in rows:
+                print(f"  {row['label']:<10}{row['metric']:<20}{row['statistic']:<10}{row['value']:.6g}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+import os
+import sys
+import csv
+import json
+import glob
+import time
+import shutil
+import socket
+import sqlite3
+import hashlib
+import argparse
+import threading
+import traceback
+import subprocess
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaign (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS units (
+    unit_id TEXT PRIMARY KEY,
+    cube TEXT NOT NULL,
+    relative_dir TEXT NOT NULL,
+    filters TEXT NOT NULL,
+    outputs TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS units_state ON units (state, available_at);
+"""
+
+STATES = ("pending", "running", "done", "failed")
+
+def open_queue(db_path, timeout=60.0):
+    """
+    Open (and create if needed) a work queue on shared storage.
+    The rollback journal is used instead of WAL because WAL needs shared memory between the
+    processes and does not work across machines on network filesystems; transactions are short,
+    so the serialised writes are not a bottleneck.
+    """
+    conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.executescript(SCHEMA)
+    return conn
+
+def unit_id(cube, filters, outputs):
+    """Stable identifier of a work unit, so enqueueing the same campaign twice adds nothing."""
+    key = json.dumps([cube, sorted(filters), outputs], sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+def enumerate_units(config, filter_sets=None):
+    """
+    Work units of a campaign: every cube x every filter set, each producing the config's outputs.
+    Args:
+        config: pipeline config; cubes, filters, metrics and persist define the units.
+        filter_sets: Lists of filter labels (default: one set with all configured filters).
+    Returns:
+        List of dictionaries (unit_id, cube, relative_dir, filters, outputs).
+    """
+    from pipeline import find_cubes
+    cubes = [os.path.abspath(path) for path in find_cubes(config["cubes"])]
+    if not cubes:
+        return []
+    root = os.path.commonpath([os.path.dirname(path) for path in cubes])
+    outputs = {"metrics": list(config["metrics"]), "persist": list(config["persist"])}
+    units = []
+    for cube in cubes:
+        for filters in filter_sets or [list(config["filters"])]:
+            unknown = set(filters) - set(config["filters"])
+            if unknown:
+                raise ValueError(f"Unknown filters {sorted(unknown)}; configured: {sorted(config['filters'])}")
+            units.append({"unit_id": unit_id(cube, filters, outputs), "cube": cube,
+                          "relative_dir": os.path.relpath(os.path.dirname(cube), root),
+                          "filters": sorted(filters), "outputs": outputs})
+    return units
+
+def enqueue(conn, config, filter_sets=None):
+    """Store the campaign config and add its units (existing units keep their state). Returns units added."""
+    units = enumerate_units(config, filter_sets)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("INSERT OR REPLACE INTO campaign VALUES ('config', ?)", (json.dumps(config),))
+        before = conn.execute("SELECT COUNT(*) FROM units").fetchone()[0]
+        conn.executemany("INSERT OR IGNORE INTO units (unit_id, cube, relative_dir, filters, outputs) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         [(u["unit_id"], u["cube"], u["relative_dir"], json.dumps(u["filters"]),
+                           json.dumps(u["outputs"])) for u in units])
+        added = conn.execute("SELECT COUNT(*) FROM units").fetchone()[0] - before
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return added
+
+def campaign_config(conn):
+    row = conn.execute("SELECT value FROM campaign WHERE key = 'config'").fetchone()
+    if row is None:
+        raise ValueError("Queue has no campaign; run 'shard.py enqueue' first")
+    return json.loads(row["value"])
+
+def claim(conn, worker, lease=300.0, max_attempts=3):
+    """
+    Claim one unit for worker: a pending unit that is due, or a running one whose lease expired
+    (its worker stopped heartbeating). Units whose attempts are used up are marked failed.
+    Returns:
+        The claimed unit row, or None when nothing is claimable now.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("UPDATE units SET state = 'failed', error = COALESCE(error, 'lease expired') "
+                     "WHERE state = 'running' AND lease_expires < ? AND attempts >= ?", (now, max_attempts))
+        row = conn.execute("SELECT * FROM units WHERE (state = 'pending' AND available_at <= ?) "
+                           "OR (state = 'running' AND lease_expires < ?) ORDER BY attempts, unit_id LIMIT 1",
+                           (now, now)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE units SET state = 'running', worker = ?, lease_expires = ?, started_at = ?, "
+                         "attempts = attempts + 1 WHERE unit_id = ?", (worker, now + lease, now, row["unit_id"]))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return row
+
+def renew(conn, unit_id, worker, lease=300.0):
+    """Extend a lease; False if the unit is no longer held by worker."""
+    cursor = conn.execute("UPDATE units SET lease_expires = ? WHERE unit_id = ? AND worker = ? AND state = 'running'",
+                          (time.time() + lease, unit_id, worker))
+    return cursor.rowcount == 1
+
+def finish(conn, unit_id, worker, error=None, max_attempts=3, backoff=30.0):
+    """
+    Record the outcome of a held unit. Failures go back to pending after an exponential
+    backoff until max_attempts is reached. Returns False if the lease was lost meanwhile.
+    """
+    now = time.time()
+    if error is None:
+        cursor = conn.execute("UPDATE units SET state = 'done', finished_at = ?, error = NULL "
+                              "WHERE unit_id = ? AND worker = ? AND state = 'running'", (now, unit_id, worker))
+    else:
+        cursor = conn.execute("UPDATE units SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                              "available_at = ? + ? * (1 << (attempts - 1)), finished_at = ?, error = ? "
+                              "WHERE unit_id = ? AND worker = ? AND state = 'running'",
+                              (max_attempts, now, backoff, now, error, unit_id, worker))
+    return cursor.rowcount == 1
+
+def outstanding(conn):
+    """Units that are pending or running (done and failed units are settled)."""
+    return conn.execute("SELECT COUNT(*) FROM units WHERE state IN ('pending', 'running')").fetchone()[0]
+
+class Heartbeat:
+    """Renews a lease from a background thread (with its own connection) while a unit runs."""
+
+    def __init__(self, db_path, unit_id, worker, lease):
+        self.db_path, self.unit_id, self.worker, self.lease = db_path, unit_id, worker, lease
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        conn = open_queue(self.db_path)
+        try:
+            while not self._stop.wait(self.lease / 3):
+                try:
+                    if not renew(conn, self.unit_id, self.worker, self.lease):
+                        self.lost.set()
+                        return
+                except sqlite3.OperationalError:
+                    continue  # the queue is busy; the lease has slack for the next beat
+        finally:
+            conn.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def commit_outputs(staging, output, relative_dir):
+    """
+    Move a unit's staged files into output/<label>/<relative_dir>/ with atomic renames.
+    ENVI headers are moved after their data files, so a visible header always has its data.
+    """
+    moved = []
+    files = [os.path.join(folder, name) for folder, _, names in os.walk(staging) for name in names]
+    for path in sorted(files, key=lambda p: (p.endswith(".hdr"), p)):
+        label_path = os.path.relpath(path, staging)
+        label, name = label_path.split(os.sep, 1)
+        target = os.path.join(output, label, relative_dir, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+        moved.append(target)
+    shutil.rmtree(staging, ignore_errors=True)
+    return moved
+
+def write_rows_atomic(path, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["cube"])
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(temp_path, path)
+
+def run_unit(config, resources, unit, worker):
+    """
+    Process one unit into staging space and publish its outputs atomically:
+    output/results/<unit_id>.csv for the metric rows and output/<label>/<relative_dir>/ for
+    persisted products.
+    """
+    from pipeline import Persister, process_cube
+    filters = json.loads(unit["filters"])
+    outputs = json.loads(unit["outputs"])
+    unit_config = dict(config, filters={label: config["filters"][label] for label in filters},
+                       metrics=outputs["metrics"], persist=outputs["persist"])
+    staging = os.path.join(config["output"], ".staging", f"{unit['unit_id']}-{worker}")
+    shutil.rmtree(staging, ignore_errors=True)
+    unit_resources = resources._replace(
+        filter_curves={label: resources.filter_curves[label] for label in filters},
+        persister=Persister(staging, outputs["persist"], resources.policy.storage, config["reference"]))
+    rows = process_cube(unit_config, unit_resources, unit["cube"])
+    rows = [dict(row, unit=unit["unit_id"], worker=worker) for row in rows]
+    commit_outputs(staging, config["output"], unit["relative_dir"])
+    write_rows_atomic(os.path.join(config["output"], "results", f"{unit['unit_id']}.csv"), rows)
+    return rows
+
+def work(db_path, worker=None, lease=300.0, max_attempts=3, backoff=30.0, poll=5.0, max_units=None):
+    """
+    Claim and process units until none are outstanding (or max_units were processed).
+    Returns:
+        (units done, units failed) by this worker.
+    """
+    from pipeline import load_resources
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    conn = open_queue(db_path)
+    config = campaign_config(conn)
+    resources = load_resources(config)
+    done = failed = 0
+    while max_units is None or done + failed < max_units:
+        unit = claim(conn, worker, lease, max_attempts)
+        if unit is None:
+            if outstanding(conn) == 0:
+                break
+            time.sleep(poll)  # other workers hold the rest; their leases may still expire
+            continue
+        start = time.time()
+        error = None
+        with Heartbeat(db_path, unit["unit_id"], worker, lease) as heartbeat:
+            try:
+                run_unit(config, resources, unit, worker)
+            except Exception:
+                traceback.print_exc()
+                error = traceback.format_exc(limit=1).strip().splitlines()[-1]
+        if heartbeat.lost.is_set() or not finish(conn, unit["unit_id"], worker, error, max_attempts, backoff):
+            print(f"[{worker}] Lease lost on {unit['unit_id']}; another worker owns it now")
+            continue
+        done, failed = (done + 1, failed) if error is None else (done, failed + 1)
+        status = "done" if error is None else f"failed ({error})"
+        print(f"[{worker}] {unit['cube']} {json.loads(unit['filters'])}: {status} in {time.time() - start:.2f} s")
+    conn.close()
+    return done, failed
+
+def status(conn):
+    """Unit counts per state, per-worker totals and the throughput of finished units."""
+    counts = dict.fromkeys(STATES, 0)
+    counts.update(dict(conn.execute("SELECT state, COUNT(*) FROM units GROUP BY state").fetchall()))
+    workers = dict(conn.execute("SELECT worker, COUNT(*) FROM units WHERE state = 'done' GROUP BY worker").fetchall())
+    span = conn.execute("SELECT MIN(started_at), MAX(finished_at) FROM units WHERE state = 'done'").fetchone()
+    elapsed = (span[1] - span[0]) if span[0] is not None else 0.0
+    errors = conn.execute("SELECT cube, filters, attempts, error FROM units WHERE state = 'failed'").fetchall()
+    return {"counts": counts, "workers": workers, "elapsed_seconds": elapsed,
+            "units_per_minute": counts["done"] / elapsed * 60 if elapsed > 0 else 0.0,
+            "failed": [dict(row) for row in errors]}
+
+def collect(config, results_path):
+    """Concatenate the per-unit result files into one CSV. Returns the number of rows."""
+    rows = []
+    for path in sorted(glob.glob(os.path.join(config["output"], "results", "*.csv"))):
+        with open(path, newline="") as f:
+            rows.extend(csv.DictReader(f))
+    if rows:
+        write_rows_atomic(results_path, rows)
+    return len(rows)
+
+def run_local(db_path, workers, extra_args=()):
+    """Start workers local processes standing in for nodes and wait for them. Returns their exit codes."""
+    processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "work", db_path,
+                                   "--worker", f"{socket.gethostname()}-local{i}", *extra_args])
+                 for i in range(workers)]
+    return [process.wait() for process in processes]
+
+def main():
+    parser = argparse.ArgumentParser(description="Shard a campaign over workers through a shared SQLite queue.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add = subparsers.add_parser("enqueue", help="Enumerate a campaign's work units into the queue")
+    add.add_argument("queue", help="Queue database on shared storage")
+    add.add_argument("config", help="pipeline JSON config (cubes, filters, metrics, persist, output)")
+    add.add_argument("--filter-sets", nargs="+", help="Comma-separated filter labels per unit, e.g. DBAMP DBN "
+                                                      "(default: all filters in one unit)")
+    for name, help_text in (("work", "Claim and process units"), ("local", "Run local worker processes")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("queue")
+        sub.add_argument("--lease", type=float, default=300.0, help="Seconds a claim lasts without heartbeats")
+        sub.add_argument("--max-attempts", type=int, default=3)
+        sub.add_argument("--backoff", type=float, default=30.0, help="Seconds before the first retry (doubles)")
+        sub.add_argument("--poll", type=float, default=5.0)
+    subparsers.choices["work"].add_argument("--worker", help="Worker name (default: host-pid)")
+    subparsers.choices["work"].add_argument("--max-units", type=int)
+    subparsers.choices["local"].add_argument("--workers", type=int, default=os.cpu_count())
+    show = subparsers.add_parser("status", help="Show queue progress")
+    show.add_argument("queue")
+    gather = subparsers.add_parser("collect", help="Merge per-unit results into one CSV")
+    gather.add_argument("queue")
+    gather.add_argument("--results", help="Output CSV (default: the campaign's results file)")
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        from pipeline import load_config
+        config = load_config(args.config)
+        # Workers may run elsewhere; paths must resolve the same on every node (shared mount)
+        config["output"] = os.path.abspath(config["output"])
+        config["cmf"] = os.path.abspath(config["cmf"])
+        config["filters"] = {label: os.path.abspath(path) for label, path in config["filters"].items()}
+        if config["illuminants"]:
+            from calibration import DEFAULT_CALIBRATION, SOURCES_FOLDER
+            config["illuminants"] = [os.path.abspath(name if os.path.exists(name) else
+                                                     os.path.join(SOURCES_FOLDER, f"{name}.txt"))
+                                     for name in config["illuminants"]]
+            calibration = dict(DEFAULT_CALIBRATION, **config["calibration"])
+            config["calibration"] = dict(calibration, cache=os.path.abspath(calibration["cache"]),
+                                         spectrum=calibration["spectrum"] and os.path.abspath(calibration["spectrum"]))
+        filter_sets = [s.split(",") for s in args.filter_sets] if args.filter_sets else None
+        added = enqueue(open_queue(args.queue), config, filter_sets)
+        print(f"Enqueued {added} new units.")
+    elif args.command in ("work", "local"):
+        options = ["--lease", str(args.lease), "--max-attempts", str(args.max_attempts),
+                   "--backoff", str(args.backoff), "--poll", str(args.poll)]
+        if args.command == "local":
+            codes = run_local(args.queue, args.workers, options)
+            failed = any(codes)
+        else:
+            _, failures = work(args.queue, args.worker, args.lease, args.max_attempts, args.backoff, args.poll,
+                               args.max_units)
+            failed = failures > 0
+        report = status(open_queue(args.queue))
+        print(f"Queue: {report['counts']}, {report['units_per_minute']:.1f} units/min")
+        if failed or report["counts"]["failed"]:
+            sys.exit(1)
+    elif args.command == "status":
+        report = status(open_queue(args.queue))
+        print(" ".join(f"{state}={count}" for state, count in report["counts"].items()))
+        for worker, count in sorted(report["workers"].items()):
+            print(f"  {worker}: {count} units")
+        print(f"Throughput: {report['units_per_minute']:.1f} units/min over {report['elapsed_seconds']:.0f} s")
+        for row in report["failed"]:
+            print(f"FAILED {row['cube']} {row['filters']} after {row['attempts']} attempts: {row['error']}")
+    elif args.command == "collect":
+        conn = open_queue(args.queue)
+        config = campaign_config(conn)
+        results = args.results or config["results"]
+        print(f"Collected {collect(config, results)} rows into {results}")
+
+if __name__ == "__main__":
+    main()
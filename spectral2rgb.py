@@ -1,8 +1,10 @@
 import os
+import sys
+import traceback
 import numpy as np
 import spectral.io.envi as envi
-from tkinter import Tk, filedialog
-import matplotlib.pyplot as plt
+
+import instrument
 
 # Function to convert XYZ to sRGB
 def xyz_to_srgb(XYZ):
@@ -13,33 +15,45 @@ def xyz_to_srgb(XYZ):
     RGB = np.dot(XYZ, matrix.T)
     return np.clip(RGB, 0, 1)
 
-def process_hdr_file(hdr_file, cmf_file, output_path):
-    """Process an HDR file and convert it to an RGB image."""
+def process_hdr_file(hdr_file, cmf_file, output_path, profile_path=None):
+    """
+    Process an HDR file and convert it to an RGB image.
+    Each step is recorded as an instrument stage; errors propagate to the caller.
+    With profile_path, the file is also run under the sampling profiler (folded stacks).
+    """
+    import matplotlib.pyplot as plt
+    if profile_path:
+        with instrument.SamplingProfiler(profile_path):
+            return process_hdr_file(hdr_file, cmf_file, output_path)
+
     print(f"Processing: {hdr_file}")
-    try:
-        # Load the hyperspectral cube
-        cube = envi.open(hdr_file).load()
+    # Load the hyperspectral cube
+    with instrument.stage("load", hdr_file) as record:
+        image = envi.open(hdr_file)
+        cube = image.load()
+        record.add_bytes(read=os.path.getsize(image.filename))
 
-        # Get the wavelengths from the header
-        wavelengths = np.array([float(w) for w in cube.metadata['wavelength']])
+    # Get the wavelengths from the header
+    wavelengths = np.array([float(w) for w in cube.metadata['wavelength']])
 
-        # Load color matching function (CMF)
+    # Load color matching function (CMF) and interpolate it to match the cube wavelengths
+    with instrument.stage("resample", hdr_file):
         cmf_data = np.loadtxt(cmf_file, delimiter=",")  # Assuming CMF is in CSV format
         cmf_wavelengths = cmf_data[:, 0]
         cmf_values = cmf_data[:, 1:4]  # X, Y, Z values
-
-        # Interpolate CMF to match the cube wavelengths
         cmf_interp = np.zeros((len(wavelengths), 3))
         for i in range(3):  # For X, Y, Z
             cmf_interp[:, i] = np.interp(wavelengths, cmf_wavelengths, cmf_values[:, i])
 
-        # Convert radiance to XYZ
+    # Convert radiance to XYZ
+    with instrument.stage("project", hdr_file):
         r, c, w = cube.shape
         radiances_flat = cube.reshape((r * c, w))
         XYZ_flat = np.dot(radiances_flat, cmf_interp)
         XYZ = XYZ_flat.reshape((r, c, 3))
         XYZ = np.clip(XYZ / np.max(XYZ), 0, 1)
 
+    with instrument.stage("encode", hdr_file) as record:
         # Convert XYZ to sRGB
         RGB = xyz_to_srgb(XYZ)
 
@@ -50,16 +64,15 @@ def process_hdr_file(hdr_file, cmf_file, output_path):
         # Save the RGB image
         output_filename = os.path.join(output_path, os.path.basename(hdr_file).replace(".hdr", ".png"))
         plt.imsave(output_filename, RGB_corrected)
-        print(f"Saved: {output_filename}")
-
-    except Exception as e:
-        print(f"Error processing {hdr_file}: {e}")
+        record.add_bytes(written=os.path.getsize(output_filename))
+    print(f"Saved: {output_filename}")
 
 def process_folder_structure(input_folder, cmf_file, output_folder):
-    """Process all HDR files in the folder structure."""
+    """Process all HDR files in the folder structure and return the files that failed."""
     print(f"Starting processing for folder: {input_folder}")
     total_files = 0
     processed_files = 0
+    failed_files = []
 
     for root, _, files in os.walk(input_folder):
         relative_path = os.path.relpath(root, input_folder)
@@ -70,14 +83,24 @@ def process_folder_structure(input_folder, cmf_file, output_folder):
             if file_name.endswith(".hdr"):
                 total_files += 1
                 hdr_path = os.path.join(root, file_name)
-                process_hdr_file(hdr_path, cmf_file, output_subfolder)
-                processed_files += 1
+                try:
+                    process_hdr_file(hdr_path, cmf_file, output_subfolder)
+                    processed_files += 1
+                except Exception:
+                    # Keep going with the other files, but report the failure in full
+                    print(f"Error processing {hdr_path}:", file=sys.stderr)
+                    traceback.print_exc()
+                    failed_files.append(hdr_path)
 
     print(f"Processed {processed_files}/{total_files} HDR files.")
+    if failed_files:
+        print(f"Failed ({len(failed_files)}): " + ", ".join(failed_files))
     print(f"All processed images saved in: {output_folder}")
+    return failed_files
 
 def main():
     """Main function to process all HDR files."""
+    from tkinter import Tk, filedialog
     Tk().withdraw()  # Hide the root Tkinter window
 
     # Ask user to select the input folder
@@ -96,10 +119,17 @@ def main():
     output_folder = os.path.join(os.path.dirname(input_folder), "Scott_rgb")
     os.makedirs(output_folder, exist_ok=True)
 
+    # Record per-stage timings next to the renders
+    tracer = instrument.configure(trace_path=os.path.join(output_folder, "trace.jsonl"),
+                                  prometheus_path=os.path.join(output_folder, "metrics.prom"))
+
     # Process the folder structure
-    process_folder_structure(input_folder, cmf_file, output_folder)
+    failed_files = process_folder_structure(input_folder, cmf_file, output_folder)
+    tracer.write_prometheus()
 
-    print("Processing completed.")
+    print("Processing completed." if not failed_files else "Processing completed with errors.")
+    if failed_files:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
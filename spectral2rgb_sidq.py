@@ -1,8 +1,6 @@
 import os
 import numpy as np
 import spectral.io.envi as envi
-from tkinter import Tk, filedialog
-import matplotlib.pyplot as plt
 
 # Function to convert XYZ to sRGB
 def xyz_to_srgb(XYZ):
@@ -15,6 +13,7 @@ def xyz_to_srgb(XYZ):
 
 def process_hdr_file(hdr_file, cmf_file, output_path):
     """Process an HDR file and convert it to an RGB image."""
+    import matplotlib.pyplot as plt
     print(f"Processing: {hdr_file}")
     try:
         # Load the hyperspectral cube
@@ -78,6 +77,7 @@ def process_folder_structure(input_folder, cmf_file, output_folder):
 
 def main():
     """Main function to process all HDR files."""
+    from tkinter import Tk, filedialog
     Tk().withdraw()  # Hide the root Tkinter window
 
     # Ask user to select the input folder
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from approximate import BlockSampler, approximate_global, stratified_estimate
+
+
+def test_full_sample_is_exact():
+    values = np.random.default_rng(0).random(60)
+    strata = np.repeat([0, 1, 2], [10, 20, 30])
+    estimate, half_width = stratified_estimate(values, strata, np.array([10, 20, 30]))
+    assert estimate == pytest.approx(values.mean())
+    assert half_width == pytest.approx(0.0)
+
+
+def test_strata_are_weighted_by_population_size():
+    # One block sampled from a stratum of 1, two from a stratum of 9
+    estimate, _ = stratified_estimate([10.0, 1.0, 3.0], [0, 1, 1], np.array([1, 9]))
+    assert estimate == pytest.approx(0.1 * 10 + 0.9 * 2)
+
+
+def test_single_stratum_interval_matches_the_textbook_formula():
+    rng = np.random.default_rng(1)
+    values = rng.normal(5, 2, 25)
+    estimate, half_width = stratified_estimate(values, np.zeros(25, dtype=int), np.array([100]),
+                                               confidence=0.95)
+    expected = 1.959964 * np.sqrt((1 - 25 / 100) * values.var(ddof=1) / 25)
+    assert estimate == pytest.approx(values.mean())
+    assert half_width == pytest.approx(expected, rel=1e-5)
+
+
+def test_intervals_cover_the_population_mean():
+    rng = np.random.default_rng(2)
+    counts = np.array([200, 300, 500])
+    population = [rng.normal(mu, 1 + mu, n) for mu, n in zip((0, 3, 6), counts)]
+    truth = np.concatenate(population).mean()
+    covered = 0
+    for _ in range(400):
+        samples = [rng.choice(p, 15, replace=False) for p in population]
+        estimate, half_width = stratified_estimate(np.concatenate(samples), np.repeat([0, 1, 2], 15), counts)
+        covered += abs(estimate - truth) <= half_width
+    assert 0.9 <= covered / 400 <= 0.99
+
+
+def test_refinement_never_exceeds_max_fraction():
+    sampler = BlockSampler((256, 256), block=8, strata=4)
+    per_stratum = sampler.capped(4, 0.25)
+    while per_stratum is not None:
+        sampler.take(per_stratum)
+        assert sampler.fraction <= 0.25
+        per_stratum = sampler.refine(per_stratum, 0.25)
+    assert sampler.fraction > 0.2
+
+
+def test_global_falls_back_to_exact_past_the_cap():
+    noise = np.random.default_rng(3).random((128, 128))
+    rows = approximate_global(noise, tolerance=1e-6, max_fraction=0.1)
+    assert {r["kind"] for r in rows} == {"exact"}
+    rms = next(r for r in rows if r["metric"] == "rms_contrast")
+    assert rms["value"] == pytest.approx(noise.std(), rel=1e-6)
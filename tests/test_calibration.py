@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pytest
+import spectral
+
+from benchmark import synthetic_wavelengths, write_envi_cube
+from cube_index import open_index, update_index
+from calibration import (IlluminationCache, band_peaks, convert_envi_cube, estimate_illumination, load_illuminant,
+                         match_illuminant, reflectance_gains, relit_label, split_label)
+from hsi2rgb import load_cmf_data, match_values_to_cube
+from precision import load_cube
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+SHAPE = (20, 16, 12)
+REGION = [4, 3, 10, 9]
+
+
+@pytest.fixture
+def hdr_path(tmp_path):
+    return write_envi_cube(str(tmp_path / "cube.hdr"), SHAPE)
+
+
+def test_white_reference_region_calibrates_to_unit_reflectance(hdr_path, tmp_path):
+    illumination = estimate_illumination(hdr_path, synthetic_wavelengths(SHAPE[2]), region=REGION)
+    paths = convert_envi_cube(hdr_path, str(tmp_path / "out"), illumination, tile_rows=7)
+    reflectance = spectral.open_image(paths["reflectance"]).open_memmap(interleave='bip')
+    row0, col0, row1, col1 = REGION
+    lit = reflectance_gains(illumination) > 0
+    assert lit.any()
+    np.testing.assert_allclose(reflectance[row0:row1, col0:col1].mean(axis=(0, 1))[lit], 1.0, rtol=1e-5)
+
+
+def test_uint16_reflectance_keeps_unit_white(hdr_path, tmp_path):
+    illumination = estimate_illumination(hdr_path, synthetic_wavelengths(SHAPE[2]), region=REGION, reflectance=0.5)
+    path = convert_envi_cube(hdr_path, str(tmp_path / "out"), illumination, policy="uint16")["reflectance"]
+    assert spectral.open_image(path).open_memmap().dtype == np.uint16
+    row0, col0, row1, col1 = REGION
+    np.testing.assert_allclose(load_cube(path, np.float64)[row0:row1, col0:col1].mean(axis=(0, 1)), 0.5, rtol=1e-3)
+
+
+def test_band_peaks_read_a_fresh_index_entry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("scene/original")
+    hdr_path = write_envi_cube(os.path.abspath("scene/original/cube.hdr"), SHAPE)
+    memmap = spectral.open_image(hdr_path).open_memmap(interleave='bip')
+    conn = open_index()
+    update_index(conn, "scene", os.path.join(REPO, "cmfs", "cmf_2.csv"))
+    conn.close()
+    # An all-zero stand-in shows the peaks come from the index rather than from reading the cube
+    np.testing.assert_allclose(band_peaks(np.zeros_like(memmap), hdr_path=hdr_path), memmap.max(axis=(0, 1)))
+    np.testing.assert_array_equal(band_peaks(np.zeros_like(memmap)), 0)
+
+
+def test_matched_illuminant_has_unit_white():
+    wavelengths = synthetic_wavelengths(SHAPE[2])
+    cmf = load_cmf_data(os.path.join(REPO, "cmfs", "cmf_2.csv"))
+    matched = match_illuminant(wavelengths, load_illuminant(os.path.join(REPO, "tools", "sources", "CIE_D65.txt")),
+                               cmf)
+    assert matched @ match_values_to_cube(wavelengths, *cmf)[:, 1] == pytest.approx(1.0)
+
+
+def test_relit_labels_split_back():
+    assert split_label(relit_label("DBAMP", "CIE_A")) == ("DBAMP", "CIE_A")
+    assert split_label("DBAMP") == ("DBAMP", None)
+
+
+def test_cache_estimates_once_and_goes_stale_with_the_cube(hdr_path, tmp_path):
+    cache = IlluminationCache(str(tmp_path / "cache.sqlite"))
+    wavelengths = synthetic_wavelengths(SHAPE[2])
+    first = cache.estimate(hdr_path, wavelengths, {"region": REGION})
+    assert cache.lookup(hdr_path, {"region": REGION, "spectrum": None, "reflectance": 1.0}) is not None
+    assert cache.lookup(hdr_path, {"region": [0, 0, 2, 2], "spectrum": None, "reflectance": 1.0}) is None
+    write_envi_cube(hdr_path, SHAPE, seed=1)
+    assert cache.lookup(hdr_path) is None
+    assert not np.array_equal(cache.estimate(hdr_path, wavelengths, {"region": REGION}), first)
+    with pytest.raises(ValueError):
+        IlluminationCache(str(tmp_path / "empty.sqlite")).estimate(hdr_path, wavelengths)
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pytest
+import spectral
+
+from benchmark import write_envi_cube
+from cube_index import get_cube_stats, indexed_band_max, is_fresh, open_index, update_index
+
+CMF = os.path.join(os.path.dirname(__file__), os.pardir, "cmfs", "cmf_2.csv")
+
+
+def band_max(hdr_path):
+    return spectral.open_image(hdr_path).open_memmap(interleave='bip').max(axis=(0, 1))
+
+
+def touch_later(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture
+def indexed(tmp_path):
+    os.makedirs(tmp_path / "scene_a" / "original")
+    hdr_path = write_envi_cube(str(tmp_path / "scene_a" / "original" / "cube.hdr"), (12, 10, 6), seed=0)
+    db_path = str(tmp_path / "index.sqlite")
+    conn = open_index(db_path)
+    update_index(conn, str(tmp_path / "scene_a"), CMF)
+    yield conn, hdr_path, db_path
+    conn.close()
+
+
+def test_entry_matches_cube(indexed):
+    conn, hdr_path, db_path = indexed
+    stats = get_cube_stats(conn, hdr_path)
+    assert (stats["rows"], stats["cols"], stats["bands"], stats["variant"]) == (12, 10, 6, "original")
+    np.testing.assert_allclose(stats["band_max"], band_max(hdr_path))
+    np.testing.assert_allclose(indexed_band_max(hdr_path, db_path), band_max(hdr_path))
+
+
+def test_rewritten_data_file_is_stale_until_reindexed(indexed):
+    conn, hdr_path, db_path = indexed
+    before = get_cube_stats(conn, hdr_path)["band_max"]
+    write_envi_cube(hdr_path, (12, 10, 6), seed=3)
+    touch_later(spectral.open_image(hdr_path).filename)
+    assert not is_fresh(conn, hdr_path)
+    assert get_cube_stats(conn, hdr_path) is None
+    assert indexed_band_max(hdr_path, db_path) is None
+
+    update_index(conn, os.path.dirname(os.path.dirname(hdr_path)), CMF)
+    after = get_cube_stats(conn, hdr_path)["band_max"]
+    np.testing.assert_allclose(after, band_max(hdr_path))
+    assert not np.allclose(after, before)
+
+
+def test_header_edit_makes_entry_stale(indexed):
+    conn, hdr_path, _ = indexed
+    with open(hdr_path, "a") as f:
+        f.write("description = {edited}\n")
+    touch_later(hdr_path)
+    assert not is_fresh(conn, hdr_path)
+
+
+def test_pruning_keeps_sibling_folders_with_wildcard_characters(indexed, tmp_path):
+    conn, hdr_path, _ = indexed
+    os.makedirs(tmp_path / "scene-a" / "original")
+    sibling = write_envi_cube(str(tmp_path / "scene-a" / "original" / "cube.hdr"), (4, 4, 6))
+    update_index(conn, str(tmp_path / "scene-a"), CMF)
+    # As a LIKE pattern 'scene_a/%' also matches scene-a; rebuilding scene_a must not drop it
+    update_index(conn, str(tmp_path / "scene_a"), CMF)
+    assert is_fresh(conn, sibling) and is_fresh(conn, hdr_path)
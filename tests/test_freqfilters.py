@@ -0,0 +1,37 @@
+import numpy as np
+
+from freqfilters import bank_cache
+
+
+def test_bank_cache_is_bounded_by_bytes():
+    calls = []
+
+    @bank_cache(500)
+    def bank(n):
+        calls.append(n)
+        return np.zeros(100 * n, dtype=np.uint8)
+
+    first = bank(1)
+    assert bank(1) is first
+    bank(2)
+    # 1 and 2 fill 300 bytes; 3 overflows and evicts the least recently used entry, 2
+    bank(1)
+    bank(3)
+    bank(1)
+    bank(2)
+    assert calls == [1, 2, 3, 2]
+
+
+def test_bank_cache_does_not_keep_oversized_results():
+    calls = []
+
+    @bank_cache(1000)
+    def bank(n):
+        calls.append(n)
+        return np.zeros(n), np.zeros(n)
+
+    bank(100)
+    bank(100)
+    bank(10)
+    bank(10)
+    assert calls == [100, 100, 10]
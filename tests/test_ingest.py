@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+import instrument
+from benchmark import write_envi_cube
+from ingest import IngestDaemon
+from pipeline import load_config
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+@pytest.fixture
+def tracer_reset():
+    yield
+    instrument.configure()
+
+
+def test_daemon_writes_stage_metrics_from_its_config(tmp_path, tracer_reset):
+    os.makedirs(tmp_path / "scene" / "original")
+    hdr_path = write_envi_cube(str(tmp_path / "scene" / "original" / "cube.hdr"), (24, 20, 16))
+    config = load_config(None, cmf=os.path.join(REPO, "cmfs", "cmf_2.csv"),
+                         filters={"DBAMP": os.path.join(REPO, "tools", "filters", "amp.txt")},
+                         metrics=["global"], output=str(tmp_path / "output"),
+                         trace=str(tmp_path / "trace.jsonl"), prometheus=str(tmp_path / "stages.prom"))
+    daemon = IngestDaemon(config, [str(tmp_path / "scene")], results=str(tmp_path / "metrics.csv"),
+                          latency_path=str(tmp_path / "latency.jsonl"), settle=0.0)
+    records = daemon.run(once=True)
+
+    assert [(r["cube"], r["error"]) for r in records] == [(hdr_path, None)]
+    lines = open(tmp_path / "stages.prom").read().splitlines()
+    assert 'contrast_stage_calls_total{stage="ingest"} 1' in lines
+    assert os.path.getsize(tmp_path / "trace.jsonl") > 0
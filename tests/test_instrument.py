@@ -0,0 +1,27 @@
+import json
+
+from instrument import Tracer
+
+
+def test_nested_stages_are_exported_as_substages(tmp_path):
+    trace, metrics = str(tmp_path / "trace.jsonl"), str(tmp_path / "stages.prom")
+    tracer = Tracer(trace_path=trace, prometheus_path=metrics)
+    with tracer.stage("xyz", "cube.hdr"):
+        for _ in range(2):
+            with tracer.stage("load", "cube.hdr"):
+                tracer.add_bytes(read=100)
+            with tracer.stage("filter", "cube.hdr"):
+                pass
+    tracer.write_prometheus()
+
+    records = [json.loads(line) for line in open(trace)]
+    assert [(r["stage"], r["parent"]) for r in records][-1] == ("xyz", None)
+    assert {r["parent"] for r in records[:-1]} == {"xyz"}
+    assert all(r["process_peak_rss_bytes"] > 0 for r in records)
+    assert records[-1]["bytes_read"] == 200
+
+    lines = open(metrics).read().splitlines()
+    top_level = [line for line in lines if line.startswith("contrast_stage_calls_total")]
+    assert top_level == ['contrast_stage_calls_total{stage="xyz"} 1']
+    assert 'contrast_substage_calls_total{stage="load",parent="xyz"} 2' in lines
+    assert 'contrast_substage_bytes_read_total{stage="load",parent="xyz"} 200' in lines
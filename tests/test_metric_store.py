@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+from skimage.io import imsave
+
+from metric_store import cached_metrics, load_metrics, open_store, scene_name
+
+
+@pytest.fixture
+def store(tmp_path):
+    conn = open_store(str(tmp_path / "metrics.sqlite"))
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def scott_folder(tmp_path):
+    rng = np.random.default_rng(0)
+    root = tmp_path / "Scott_rgb" / "Old-Snow-Scenarios"
+    for variant in ("original", "DBAMP"):
+        os.makedirs(root / variant)
+        imsave(str(root / variant / "a.png"), (rng.random((32, 40, 3)) * 255).astype(np.uint8))
+    return root
+
+
+def test_cached_metrics_compute_once_per_content(store, tmp_path):
+    path = str(tmp_path / "image.bin")
+    with open(path, "wb") as f:
+        f.write(b"first")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return [1.0, 2.0]
+
+    assert cached_metrics(store, path, ["a", "b"], compute) == [1.0, 2.0]
+    assert cached_metrics(store, path, ["a", "b"], compute) == [1.0, 2.0]
+    assert len(calls) == 1
+    with open(path, "wb") as f:
+        f.write(b"second")
+    cached_metrics(store, path, ["a", "b"], compute)
+    assert len(calls) == 2
+
+
+def test_scene_name_maps_known_folders():
+    assert scene_name("/data/Scott_rgb/Old-Snow-Scenarios") == "Snow"
+    assert scene_name("/data/Scott_rgb/Trails/") == "Trails"
+    assert scene_name("/data/other") == "other"
+
+
+def test_measurement_and_paired_eval_store_one_scene_label(store, scott_folder):
+    from measurement import process_scene
+    from paired_eval import evaluate_folder
+    for variant in ("original", "DBAMP"):
+        process_scene(str(scott_folder / variant), store=store, scene=scene_name(str(scott_folder)),
+                      filter_name=variant)
+    evaluate_folder(str(scott_folder), store=store, prefetch=0)
+    assert set(load_metrics(store)["scene"]) == {"Snow"}
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from apply_filter import load_transmission_curve, save_transmission_curve
+from optimize_filter import load_checkpoint, optimise_filter
+
+
+@pytest.fixture
+def problem():
+    rng = np.random.default_rng(1)
+    wavelengths = np.arange(400.0, 701.0, 10.0)
+    surrogate = [(6, 5, rng.random((30, wavelengths.size)).astype(np.float32)) for _ in range(2)]
+    v_lambda = np.exp(-0.5 * ((wavelengths - 555.0) / 50.0) ** 2)
+    return surrogate, wavelengths, v_lambda, np.ones_like(wavelengths)
+
+
+def run(problem, generations, checkpoint_path=None, **kwargs):
+    options = dict(n_basis=4, population=6, workers=1, checkpoint_path=checkpoint_path)
+    options.update(kwargs)
+    return optimise_filter(*problem, generations=generations, **options)
+
+
+def test_resumed_search_matches_uninterrupted_run(problem, tmp_path):
+    checkpoint = str(tmp_path / "search.json")
+    run(problem, 2, checkpoint)
+    assert load_checkpoint(checkpoint)["generation"] == 2
+    resumed_curve, resumed = run(problem, 4, checkpoint)
+    curve, state = run(problem, 4)
+    assert resumed["generation"] == 4
+    assert resumed["history"] == state["history"]
+    np.testing.assert_array_equal(resumed_curve, curve)
+
+
+def test_checkpoint_from_another_run_is_refused(problem, tmp_path):
+    checkpoint = str(tmp_path / "search.json")
+    run(problem, 1, checkpoint)
+    with pytest.raises(ValueError, match="metric"):
+        run(problem, 2, checkpoint, metric="rms")
+
+
+def test_curve_exports_in_filter_format(problem, tmp_path):
+    curve, _ = run(problem, 1, bounds=(0.1, 0.9))
+    assert np.all((curve >= 0.1) & (curve <= 0.9))
+    path = str(tmp_path / "optimised.txt")
+    save_transmission_curve(path, problem[1], curve)
+    wavelengths, values = load_transmission_curve(path)
+    np.testing.assert_array_equal(wavelengths, problem[1])
+    np.testing.assert_allclose(values, curve, atol=1e-6)
@@ -0,0 +1,59 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import instrument
+from benchmark import write_envi_cube
+from pipeline import Stage, load_config, run_pipeline, run_stages
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+@pytest.fixture
+def config(tmp_path):
+    write_envi_cube(str(tmp_path / "cube.hdr"), (24, 20, 16))
+    yield load_config(None, cubes=[str(tmp_path / "cube.hdr")], cmf=os.path.join(REPO, "cmfs", "cmf_2.csv"),
+                      filters={"DBAMP": os.path.join(REPO, "tools", "filters", "amp.txt")}, metrics=["global"],
+                      tile_rows=7, prefetch=0, output=str(tmp_path / "output"))
+    instrument.configure()
+
+
+def test_stages_run_in_dependency_order_and_drop_unkept_values():
+    seen = []
+    stages = [Stage("c", ("b",), lambda b: seen.append("c") or b + 1),
+              Stage("b", ("a",), lambda a: seen.append("b") or a * 2)]
+    values = {"a": 3}
+    assert run_stages(stages, values, keep=("c",)) == {"c": 7}
+    assert seen == ["b", "c"] and "b" not in values
+    with pytest.raises(ValueError, match="missing"):
+        run_stages([Stage("d", ("missing",), lambda m: m)], {})
+
+
+def test_prefetched_tiles_give_the_same_metrics(config):
+    rows = run_pipeline(config)
+    assert {row["label"] for row in rows} == {"original", "DBAMP"}
+    prefetched = run_pipeline(dict(config, prefetch=2))
+    assert [row["value"] for row in prefetched] == pytest.approx([row["value"] for row in rows])
+
+
+def test_only_filtered_renders_are_persisted(config):
+    run_pipeline(dict(config, persist=["filtered", "luminance"]))
+    output = config["output"]
+    assert os.path.exists(os.path.join(output, "DBAMP", "cube.hdr"))
+    assert not os.path.exists(os.path.join(output, "original", "cube.hdr"))
+    luminance = np.load(os.path.join(output, "original", "cube_luminance.npy"))
+    assert luminance.shape == (24, 20)
+
+
+def test_trace_nests_tile_spans_under_the_render(config, tmp_path):
+    trace = str(tmp_path / "trace.jsonl")
+    run_pipeline(dict(config, trace=trace))
+    with open(trace) as f:
+        records = [json.loads(line) for line in f]
+    parents = {(r["stage"], r["parent"]) for r in records}
+    assert {("load", "xyz"), ("filter", "xyz"), ("xyz", None), ("metrics", None)} <= parents
+    xyz = next(r for r in records if r["stage"] == "xyz")
+    assert xyz["bytes_read"] == 24 * 20 * 16 * 4
+    assert sum(r["bytes_read"] for r in records if r["stage"] == "load") == xyz["bytes_read"]
@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+import spectral
+
+from apply_filter import process_scene
+from benchmark import write_envi_cube
+from cube_index import open_index, update_index
+from precision import (ENVI_POLICIES, POLICIES, data_gain, encode, get_policy, load_cube, save_cube,
+                       storage_metadata, stream_peak)
+
+CMF = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "cmfs", "cmf_2.csv"))
+
+
+@pytest.fixture
+def cube():
+    return np.random.default_rng(0).random((8, 6, 5)) * 300.0
+
+
+@pytest.mark.parametrize("storage, tolerance", [("uint16", 300.0 / 65535), ("float16", 0.25), ("float32", 1e-4)])
+def test_encoding_round_trips_through_the_data_gain(cube, storage, tolerance):
+    stored, gain = encode(cube, storage)
+    assert stored.dtype == np.dtype(storage)
+    metadata = storage_metadata({}, cube.shape[2], gain)
+    gains, offsets = data_gain(metadata) or (np.ones(5), np.zeros(5))
+    np.testing.assert_allclose(stored * gains + offsets, cube, atol=tolerance)
+
+
+def test_envi_cubes_round_trip_as_uint16(cube, tmp_path):
+    hdr_path = save_cube(str(tmp_path / "cube.hdr"), cube, {"wavelength": [str(w) for w in range(5)]}, "uint16")
+    assert spectral.open_image(hdr_path).open_memmap().dtype == np.uint16
+    np.testing.assert_allclose(load_cube(hdr_path, np.float64), cube, atol=300.0 / 65535)
+
+
+def test_policies_are_validated():
+    assert get_policy("reference").compute == "float64"
+    with pytest.raises(ValueError):
+        get_policy("double")
+    with pytest.raises(ValueError):
+        get_policy({"storage": "float32", "compute": "float16"})
+    assert all(POLICIES[name].storage != "float16" for name in ENVI_POLICIES)
+
+
+def test_envi_filtering_refuses_float16_before_reading(tmp_path):
+    with pytest.raises(ValueError, match="ENVI"):
+        process_scene(str(tmp_path / "missing-scene"), np.ones(3), np.ones(3), np.array([400.0, 550.0, 700.0]),
+                      policy="half")
+    assert not os.path.exists(tmp_path / "missing-scene")
+
+
+def test_stream_peak_reads_a_fresh_index_entry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("scene/original")
+    hdr_path = write_envi_cube(os.path.abspath("scene/original/cube.hdr"), (10, 8, 6))
+    memmap = spectral.open_image(hdr_path).open_memmap(interleave='bip')
+    peak = float(memmap.max())
+    conn = open_index()
+    update_index(conn, "scene", CMF)
+    conn.close()
+    # An all-zero stand-in shows the peak comes from the index rather than from reading the cube
+    assert stream_peak(np.zeros_like(memmap), hdr_path=hdr_path) == pytest.approx(peak)
+    assert stream_peak(np.zeros_like(memmap)) == 0
@@ -0,0 +1,70 @@
+import time
+
+import h5py
+import numpy as np
+import pytest
+import spectral
+
+from benchmark import write_envi_cube, write_sidq_cube
+from prefetch import BufferPool, Prefetcher, envi_tile_items, envi_tile_reader, sidq_reader
+
+
+def slow_reader(item, allocate):
+    # Later items finish first, so ordering cannot come from completion order
+    time.sleep(0.01 * (5 - item))
+    out = allocate((3, 4), np.float64)
+    out[:] = item
+    return out
+
+
+def test_items_come_back_in_order_with_their_data():
+    reader = Prefetcher(range(6), slow_reader, depth=3)
+    seen = [(entry.item, float(entry.data.mean())) for entry in reader]
+    assert seen == [(i, float(i)) for i in range(6)]
+    assert reader.summary()["files"] == 6 and reader.summary()["megabytes"] == pytest.approx(6 * 96 / 1e6)
+
+
+def test_reads_run_at_most_depth_ahead():
+    reader = Prefetcher(range(10), lambda item, allocate: item, depth=2)
+    for entry in reader:
+        assert reader.pending <= 2
+
+
+def test_read_errors_reach_the_consumer():
+    def read(item, allocate):
+        if item == 2:
+            raise OSError("unreadable")
+        return item
+
+    seen = []
+    with pytest.raises(OSError, match="unreadable"):
+        for entry in Prefetcher(range(4), read, depth=2):
+            seen.append(entry.item)
+    assert seen == [0, 1]
+
+
+def test_pool_reuses_buffers_and_grows_them():
+    pool = BufferPool(1)
+    _, raw = pool.acquire((2, 2), np.float32)
+    pool.release(raw)
+    _, same = pool.acquire((1, 4), np.float32)
+    assert same is raw
+    pool.release(same)
+    large, grown = pool.acquire((4, 4), np.float64)
+    assert grown.size == 128 and large.shape == (4, 4)
+
+
+def test_envi_tiles_reassemble_the_cube(tmp_path):
+    hdr_path = write_envi_cube(str(tmp_path / "cube.hdr"), (23, 6, 5))
+    expected = np.asarray(spectral.open_image(hdr_path).open_memmap(interleave='bip'))
+    # Copy each tile out: its buffer is reused once the next tile is requested
+    tiles = [entry.data.copy() for entry in Prefetcher(envi_tile_items(hdr_path, 5), envi_tile_reader(), depth=2)]
+    assert [len(t) for t in tiles] == [5, 5, 5, 5, 3]
+    np.testing.assert_array_equal(np.concatenate(tiles), expected)
+
+
+def test_sidq_cubes_are_read_whole(tmp_path):
+    paths = [write_sidq_cube(str(tmp_path / f"cube{seed}.mat"), (8, 6, 5), seed=seed) for seed in range(3)]
+    for path, entry in zip(paths, Prefetcher(paths, sidq_reader(), depth=2)):
+        with h5py.File(path, "r") as f:
+            np.testing.assert_array_equal(entry.data, f["hsi"][:])
@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+import pytest
+from skimage.io import imsave
+
+from measurement import GLOBAL_METRICS, process_scene
+from metric_store import open_store
+from report import load_frame, summary_table
+
+
+@pytest.fixture
+def store(tmp_path):
+    conn = open_store(str(tmp_path / "metrics.sqlite"))
+    yield conn
+    conn.close()
+
+
+def render(folder, seed):
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    imsave(os.path.join(folder, "a.png"), (rng.random((16, 20, 3)) * 255).astype(np.uint8), check_contrast=False)
+
+
+def test_rerendered_image_reports_its_newest_values(store, tmp_path):
+    folder = str(tmp_path / "Trails" / "original")
+    render(folder, 0)
+    process_scene(folder, store=store, scene="Trails")
+    render(folder, 1)
+    newest = process_scene(folder, store=store, scene="Trails")
+
+    frame = load_frame(store, metrics=GLOBAL_METRICS)
+    assert len(frame) == len(GLOBAL_METRICS)
+    table = summary_table(frame, n_resamples=10).set_index("metric")
+    for metric, value in zip(GLOBAL_METRICS, newest):
+        assert table.loc[metric, "n"] == 1
+        assert table.loc[metric, "mean"] == pytest.approx(value)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from roi_contrast import ROIContrast, roi_table
+
+
+@pytest.fixture
+def luminance():
+    return 1000.0 + np.random.default_rng(0).random((120, 160))
+
+
+def test_rectangles_match_direct_moments(luminance):
+    rects = [[0, 0, 160, 120], [5, 7, 13, 9], [150, 110, 10, 10], [40, 30, 1, 1]]
+    result = ROIContrast(luminance).rectangles(rects)
+    for k, (x, y, w, h) in enumerate(rects):
+        region = luminance[y:y + h, x:x + w]
+        assert result["mean"][k] == pytest.approx(region.mean(), rel=1e-12)
+        assert result["rms_contrast"][k] == pytest.approx(region.std(), rel=1e-6, abs=1e-9)
+        assert result["michelson_contrast"][k] == pytest.approx(
+            (region.max() - region.min()) / (region.max() + region.min() + 1e-6))
+
+
+def test_single_pixel_has_no_rms_contrast(luminance):
+    result = ROIContrast(luminance).rectangles([[x, x // 2, 1, 1] for x in range(100)])
+    assert np.all(result["rms_contrast"] == 0)
+
+
+def test_windows_match_rectangles(luminance):
+    engine = ROIContrast(luminance)
+    maps = engine.windows(8, 6, step=5)
+    assert maps["mean"].shape == (len(range(0, 113, 5)), len(range(0, 155, 5)))
+    assert maps["mean"][2, 3] == pytest.approx(luminance[10:18, 15:21].mean())
+
+
+def test_rectangles_are_clipped_to_the_image(luminance):
+    result = ROIContrast(luminance).rectangles([[-5, -5, 10, 10], [155, 115, 20, 20]])
+    assert result["mean"][0] == pytest.approx(luminance[:5, :5].mean())
+    assert result["mean"][1] == pytest.approx(luminance[115:, 155:].mean())
+
+
+def test_rectangles_outside_the_image_are_rejected(luminance):
+    with pytest.raises(ValueError):
+        ROIContrast(luminance).rectangles([[200, 0, 10, 10]])
+
+
+def test_roi_without_a_region_names_the_roi(luminance):
+    with pytest.raises(ValueError, match="road"):
+        roi_table(luminance, [{"label": "road"}])
+
+
+def test_direct_and_running_extrema_agree_and_stay_bounded(luminance):
+    rng = np.random.default_rng(1)
+    rects = np.column_stack([rng.integers(0, 140, 400), rng.integers(0, 100, 400),
+                             np.full(400, 12), np.full(400, 9)])
+    engine = ROIContrast(luminance, max_extrema=2)
+    # 400 rectangles of 12 x 9 cover more than the image, so they use the running planes
+    planes = engine.rectangles(rects)
+    assert list(engine._extrema) == [(9, 12)]
+    direct = ROIContrast(luminance).rectangles(rects[:10])
+    for name in ("michelson_contrast", "weber_contrast"):
+        np.testing.assert_allclose(planes[name][:10], direct[name])
+
+    for size in range(3, 7):
+        engine.windows(size, size)
+    assert len(engine._extrema) == 2
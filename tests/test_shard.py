@@ -0,0 +1,96 @@
+import json
+import os
+import time
+
+import pytest
+
+from shard import claim, finish, open_queue, outstanding, renew
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = open_queue(str(tmp_path / "queue.db"))
+    conn.executemany("INSERT INTO units (unit_id, cube, relative_dir, filters, outputs) VALUES (?, ?, ?, ?, ?)",
+                     [(name, f"/data/{name}.hdr", ".", json.dumps(["f1"]), json.dumps({})) for name in ("a", "b")])
+    yield conn
+    conn.close()
+
+
+def unit(conn, unit_id):
+    return conn.execute("SELECT * FROM units WHERE unit_id = ?", (unit_id,)).fetchone()
+
+
+def test_claim_takes_each_pending_unit_once(conn):
+    first, second = claim(conn, "w1"), claim(conn, "w2")
+    assert {first["unit_id"], second["unit_id"]} == {"a", "b"}
+    assert claim(conn, "w3") is None
+    row = unit(conn, first["unit_id"])
+    assert (row["state"], row["worker"], row["attempts"]) == ("running", "w1", 1)
+    assert outstanding(conn) == 2
+
+
+def test_expired_lease_is_reclaimed_and_renew_refuses_the_old_worker(conn):
+    claim(conn, "w1", lease=-1.0)
+    claim(conn, "w1", lease=-1.0)
+    taken = claim(conn, "w2")
+    assert taken["unit_id"] == "a"
+    assert unit(conn, "a")["attempts"] == 2
+    assert not renew(conn, "a", "w1")
+    assert renew(conn, "a", "w2")
+    assert not finish(conn, "a", "w1")
+    assert finish(conn, "a", "w2")
+    assert unit(conn, "a")["state"] == "done"
+    assert outstanding(conn) == 1
+
+
+def test_expired_lease_fails_when_attempts_are_used_up(conn):
+    claim(conn, "w1", lease=-1.0, max_attempts=1)
+    claim(conn, "w1", max_attempts=1)
+    assert claim(conn, "w2", max_attempts=1) is None
+    row = unit(conn, "a")
+    assert (row["state"], row["error"]) == ("failed", "lease expired")
+
+
+def test_errors_back_off_then_fail(conn):
+    claim(conn, "w1")
+    before = time.time()
+    assert finish(conn, "a", "w1", error="boom", max_attempts=2, backoff=30.0)
+    row = unit(conn, "a")
+    assert row["state"] == "pending" and row["available_at"] >= before + 30.0
+    # Only b is due while a backs off
+    assert claim(conn, "w1")["unit_id"] == "b"
+    assert claim(conn, "w1") is None
+
+    conn.execute("UPDATE units SET available_at = 0 WHERE unit_id = 'a'")
+    assert claim(conn, "w1")["unit_id"] == "a"
+    assert finish(conn, "a", "w1", error="boom again", max_attempts=2, backoff=30.0)
+    row = unit(conn, "a")
+    assert (row["state"], row["attempts"], row["error"]) == ("failed", 2, "boom again")
+
+
+def test_local_workers_process_a_campaign(tmp_path):
+    from benchmark import write_envi_cube
+    from pipeline import load_config
+    from shard import collect, enqueue, run_local, status
+
+    repo = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+    for scene in ("snow", "trails"):
+        os.makedirs(tmp_path / "cubes" / scene)
+        write_envi_cube(str(tmp_path / "cubes" / scene / "cube.hdr"), (24, 20, 16), seed=len(scene))
+    config = load_config(None, cubes=[str(tmp_path / "cubes")], cmf=os.path.join(repo, "cmfs", "cmf_2.csv"),
+                         filters={"DBAMP": os.path.join(repo, "tools", "filters", "amp.txt"),
+                                  "DBN": os.path.join(repo, "tools", "filters", "neural.txt")},
+                         metrics=["global"], persist=["filtered"], prefetch=0, output=str(tmp_path / "output"))
+    db_path = str(tmp_path / "queue.db")
+    conn = open_queue(db_path)
+    assert enqueue(conn, config, [["DBAMP"], ["DBN"]]) == 4
+
+    assert run_local(db_path, 2, ["--poll", "0.1"]) == [0, 0]
+    report = status(conn)
+    assert report["counts"]["done"] == 4 and sum(report["workers"].values()) == 4
+    assert collect(config, str(tmp_path / "results.csv")) > 0
+    for label in ("DBAMP", "DBN"):
+        for scene in ("snow", "trails"):
+            assert os.path.exists(tmp_path / "output" / label / scene / "cube.hdr")
+    assert not os.listdir(tmp_path / "output" / ".staging")
+    conn.close()
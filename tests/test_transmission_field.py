@@ -0,0 +1,70 @@
+import json
+
+import h5py
+import numpy as np
+import pytest
+import spectral
+
+from benchmark import synthetic_wavelengths, write_envi_cube, write_sidq_cube
+from transmission_field import TransmissionField, filter_envi_cube, filter_sidq_cube, load_fields, ramp
+
+SHAPE = (30, 22, 12)
+
+
+@pytest.fixture
+def field():
+    wavelengths = np.arange(380.0, 1001.0, 10.0)
+    curves = {"tint": (wavelengths, 0.2 + 0.6 * (wavelengths - 380) / 620), "clear": (wavelengths, np.full(63, 0.9)),
+              "edge": (wavelengths, np.full(63, 0.5))}
+    return TransmissionField(curves, [
+        ("tint", {"type": "gradient", "angle": 90, "start": 0.1, "end": 0.6}),
+        ("edge", {"type": "radial", "inner": 0.7, "outer": 0.7}),
+        ("clear", {"type": "rest"}),
+    ])
+
+
+def dense_filter(cube, matched):
+    """The untiled result: the cube times weights @ basis over the whole image."""
+    return cube * (matched.weights(cube.shape).astype(np.float64) @ matched.basis)
+
+
+def test_weights_with_rest_sum_to_one_where_possible(field):
+    weights = field.match(synthetic_wavelengths(SHAPE[2])).weights(SHAPE)
+    assert weights.shape == SHAPE[:2] + (3,)
+    covered = weights[..., :2].sum(axis=-1) <= 1
+    np.testing.assert_allclose(weights.sum(axis=-1)[covered], 1.0, atol=1e-6)
+
+
+def test_equal_ramp_bounds_give_a_hard_edge():
+    np.testing.assert_array_equal(ramp(np.array([0.2, 0.5, 0.8]), 0.5, 0.5), [0.0, 1.0, 1.0])
+
+
+def test_tiled_envi_filtering_matches_dense_field(field, tmp_path):
+    hdr_path = write_envi_cube(str(tmp_path / "cube.hdr"), SHAPE)
+    output = filter_envi_cube(hdr_path, str(tmp_path / "filtered.hdr"), field, tile_rows=7)
+    image = spectral.open_image(hdr_path)
+    cube = np.asarray(image.open_memmap(interleave='bip'), dtype=np.float64)
+    matched = field.match(np.array([float(w) for w in image.metadata['wavelength']]))
+    filtered = spectral.open_image(output).open_memmap(interleave='bip')
+    np.testing.assert_allclose(filtered, dense_filter(cube, matched), rtol=1e-5)
+
+
+def test_tiled_sidq_filtering_matches_dense_field(field, tmp_path):
+    mat_path = write_sidq_cube(str(tmp_path / "cube.mat"), SHAPE)
+    wavelengths = synthetic_wavelengths(SHAPE[2], 410.0, 1000.0)
+    output = filter_sidq_cube(mat_path, str(tmp_path / "filtered.mat"), field, wavelengths, tile_rows=7)
+    with h5py.File(mat_path, "r") as f:
+        cube = np.asarray(f["hsi"][:], dtype=np.float64)
+    with h5py.File(output, "r") as f:
+        filtered = f["hsi"][:]
+    np.testing.assert_allclose(filtered, dense_filter(cube, field.match(wavelengths)), rtol=1e-5)
+
+
+def test_command_line_fields_are_labelled(tmp_path):
+    spec = {"curves": {"clear": "clear.txt"}, "layers": [{"curve": "clear"}]}
+    np.savetxt(tmp_path / "clear.txt", np.column_stack([[400, 700], [0.5, 0.5]]))
+    for name in ("visor.json", "other.json"):
+        with open(tmp_path / name, "w") as f:
+            json.dump(spec, f)
+    fields = load_fields([str(tmp_path / "visor.json"), "tinted=" + str(tmp_path / "other.json")])
+    assert sorted(fields) == ["tinted", "visor"]
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from waveletcontrast import tiled_wavelet_energy, wavelet_energy
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).random((1008, 1296)).astype(np.float32)
+
+
+def test_haar_tiling_is_exact_on_multiples_of_the_level_step(image):
+    untiled = wavelet_energy(image, 'db1', level=4)
+    tiled = tiled_wavelet_energy(image, tile=256, wavelet='db1', level=4)
+    for expected, actual in zip(untiled, tiled):
+        assert actual.shape == expected.shape
+        np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("shape", [(1000, 1300), (999, 1001)])
+def test_level_shapes_round_up(shape):
+    image = np.zeros(shape, dtype=np.float32)
+    tiled = tiled_wavelet_energy(image, tile=256, wavelet='db2', level=4)
+    assert [m.shape for m in tiled] == [(-(-shape[0] // s), -(-shape[1] // s)) for s in (16, 8, 4, 2)]
+
+
+def test_longer_wavelets_match_periodization_away_from_the_border(image):
+    untiled = wavelet_energy(image, 'db2', level=3, mode='periodization')
+    tiled = tiled_wavelet_energy(image, tile=144, wavelet='db2', level=3)
+    for expected, actual in zip(untiled, tiled):
+        np.testing.assert_allclose(actual[8:-8, 8:-8], expected[8:-8, 8:-8], atol=1e-5)
+
+
+def test_tile_must_be_a_multiple_of_the_level_step(image):
+    with pytest.raises(ValueError):
+        tiled_wavelet_energy(image, tile=100, level=4)
@@ -0,0 +1,281 @@
+import os
+import json
+import argparse
+import numpy as np
+
+WEIGHT_TYPES = ("constant", "gradient", "zone", "radial", "incidence", "rest")
+
+def smoothstep(t):
+    """0 below 0, 1 above 1, and a smooth cubic in between."""
+    t = np.clip(t, 0.0, 1.0)
+    return t * t * (3.0 - 2.0 * t)
+
+def ramp(value, start, end):
+    """smoothstep from 0 at start to 1 at end; a hard step at start when the two coincide."""
+    if end == start:
+        return (value >= start).astype(np.float64)
+    return smoothstep((value - start) / (end - start))
+
+def pixel_coordinates(shape, row0=0, rows=None):
+    """Normalised centre coordinates (y, x in [0, 1]) of rows [row0, row0 + rows) of a plane of shape."""
+    height, width = shape[:2]
+    rows = height - row0 if rows is None else rows
+    y = ((np.arange(row0, row0 + rows) + 0.5) / height)[:, None]
+    x = ((np.arange(width) + 0.5) / width)[None, :]
+    return y, x
+
+def weight_map(spec, shape, row0=0, rows=None):
+    """
+    Weights in [0, 1] (constant: any value) of one layer on rows [row0, row0 + rows).
+    Coordinates are normalised to the image (0 = top/left, 1 = bottom/right); distances of
+    radial, ellipse and incidence weights are in units of the half diagonal.
+    Spec types:
+        constant:  {"value"}
+        gradient:  {"angle" (degrees, 90 = top to bottom), "start", "end"}: 0 before start, 1 after end
+                   (a hard edge when start == end)
+        zone:      {"rect": [x0, y0, x1, y1]} or {"ellipse": [cx, cy, rx, ry]}, "feather": edge width
+        radial:    {"center": [cx, cy], "inner", "outer"}: 0 inside inner, 1 outside outer (a hard edge when equal)
+        incidence: {"center": [cx, cy], "fov" (horizontal, degrees)}: (1 - cos a) / (1 - cos a_max) of the
+                   viewing angle a, to blend a normal-incidence curve with an oblique one
+    """
+    height, width = shape[:2]
+    y, x = pixel_coordinates(shape, row0, rows)
+    kind = spec.get("type", "constant")
+    half_diagonal = np.hypot(width, height) / 2
+
+    def distance(cx, cy):
+        return np.hypot((x - cx) * width, (y - cy) * height) / half_diagonal
+
+    if kind == "constant":
+        weights = np.full((y.size, x.size), float(spec.get("value", 1.0)))
+    elif kind == "gradient":
+        angle = np.radians(spec.get("angle", 90.0))
+        # Position along the direction, rescaled so that it runs from 0 to 1 across the image
+        t = x * np.cos(angle) + y * np.sin(angle)
+        corners = [cx * np.cos(angle) + cy * np.sin(angle) for cx in (0, 1) for cy in (0, 1)]
+        t = (t - min(corners)) / (max(corners) - min(corners))
+        start, end = spec.get("start", 0.0), spec.get("end", 1.0)
+        weights = ramp(t, start, end)
+    elif kind == "zone":
+        feather = max(spec.get("feather", 0.02), 1e-6)
+        if "rect" in spec:
+            x0, y0, x1, y1 = spec["rect"]
+            inside = np.minimum(np.minimum(x - x0, x1 - x), np.minimum(y - y0, y1 - y))
+            weights = smoothstep(inside / feather + 0.5)
+        else:
+            cx, cy, rx, ry = spec["ellipse"]
+            radius = np.hypot((x - cx) / rx, (y - cy) / ry)
+            weights = smoothstep((1 - radius) / feather + 0.5)
+    elif kind == "radial":
+        cx, cy = spec.get("center", (0.5, 0.5))
+        inner, outer = spec.get("inner", 0.0), spec.get("outer", 1.0)
+        weights = ramp(distance(cx, cy), inner, outer)
+    elif kind == "incidence":
+        cx, cy = spec.get("center", (0.5, 0.5))
+        focal = (width / 2) / np.tan(np.radians(spec.get("fov", 60.0)) / 2)
+        angle = np.arctan(distance(cx, cy) * half_diagonal / focal)
+        corner = np.arctan(max(np.hypot(px - cx * width, py - cy * height)
+                               for px in (0, width) for py in (0, height)) / focal)
+        weights = (1 - np.cos(angle)) / (1 - np.cos(corner))
+    else:
+        raise ValueError(f"Unknown weight type {kind!r}; available: {WEIGHT_TYPES}")
+    return np.broadcast_to(weights, (y.size, x.size)).astype(np.float32)
+
+def load_fields(entries):
+    """
+    Fields given on a command line as [LABEL=]SPEC.json (default label: the spec's file name).
+    Returns:
+        {label: TransmissionField}
+    """
+    fields = {}
+    for entry in entries:
+        label, _, spec_path = entry.rpartition("=")
+        fields[label or os.path.splitext(os.path.basename(spec_path))[0]] = TransmissionField.load(spec_path)
+    return fields
+
+def load_filter(path):
+    """A filter from the filters config: a two-column curve, or a transmission field spec (.json)."""
+    if path.lower().endswith(".json"):
+        return TransmissionField.load(path)
+    from apply_filter import load_transmission_curve
+    return load_transmission_curve(path)
+
+class TransmissionField:
+    """
+    Spatially varying transmission T(y, x, band) = sum_k w_k(y, x) * curve_k(band).
+    The field is kept in this low-rank form: only the K weight maps of a tile are ever
+    evaluated, never the full rows x cols x bands transmission.
+    Args:
+        curves: {name: (wavelengths, transmission)}.
+        layers: List of (curve name, weight spec as in weight_map). A layer of type "rest"
+                takes 1 minus the sum of the other layers (clipped at 0), so the weights
+                form a partition of unity.
+    """
+
+    def __init__(self, curves, layers):
+        unknown = {name for name, _ in layers} - set(curves)
+        if unknown:
+            raise ValueError(f"Layers use undefined curves: {sorted(unknown)}")
+        if sum(spec.get("type") == "rest" for _, spec in layers) > 1:
+            raise ValueError("At most one layer can take the rest of the weight")
+        self.curves = curves
+        self.layers = layers
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a JSON spec:
+            {"curves": {"clear": "tools/filters/neural.txt", "tint": "tools/filters/amp.txt"},
+             "layers": [{"curve": "tint", "weight": {"type": "gradient", "angle": 90, "start": 0, "end": 0.4}},
+                        {"curve": "clear", "weight": {"type": "rest"}}]}
+        Curve paths are relative to the spec's folder (or the working directory).
+        """
+        from apply_filter import load_transmission_curve
+        with open(path) as f:
+            spec = json.load(f)
+        folder = os.path.dirname(os.path.abspath(path))
+        curves = {}
+        for name, curve_path in spec["curves"].items():
+            local_path = os.path.join(folder, curve_path)
+            curves[name] = load_transmission_curve(local_path if os.path.exists(local_path) else curve_path)
+        return cls(curves, [(layer["curve"], layer.get("weight", {})) for layer in spec["layers"]])
+
+    def match(self, wavelengths):
+        """The field with its curves resampled to a cube's band centres."""
+        from apply_filter import match_transmission_to_cube
+        basis = np.stack([match_transmission_to_cube(wavelengths, *self.curves[name]) for name, _ in self.layers])
+        return MatchedField(basis, [spec for _, spec in self.layers])
+
+class MatchedField:
+    """A TransmissionField matched to one wavelength grid; evaluated tile by tile."""
+
+    def __init__(self, basis, specs):
+        self.basis = np.asarray(basis, dtype=np.float64)
+        self.specs = specs
+
+    def weights(self, shape, row0=0, rows=None):
+        """(rows x cols x K) weights of every layer on a tile."""
+        maps = [None if spec.get("type") == "rest" else weight_map(spec, shape, row0, rows) for spec in self.specs]
+        rest = next((i for i, m in enumerate(maps) if m is None), None)
+        if rest is not None:
+            others = [m for m in maps if m is not None]
+            total = np.sum(others, axis=0) if others else 0.0
+            tile_shape = (shape[0] - row0 if rows is None else rows, shape[1])
+            maps[rest] = np.broadcast_to(np.clip(1.0 - total, 0.0, None), tile_shape).astype(np.float32)
+        return np.stack(maps, axis=-1)
+
+    def transmission(self, shape, row0=0, rows=None, dtype=np.float32):
+        """(rows x cols x bands) transmission of one tile (weights x basis)."""
+        return self.weights(shape, row0, rows).astype(dtype) @ self.basis.astype(dtype)
+
+    def apply(self, tile, shape, row0=0):
+        """Filter a (rows x cols x bands) tile that starts at row0 of a cube of shape."""
+        return tile * self.transmission(shape, row0, len(tile), tile.dtype)
+
+    def peak(self):
+        """Upper bound of the transmission (for choosing storage gains)."""
+        bounds = [float(spec.get("value", 1.0)) if spec.get("type", "constant") == "constant" else 1.0
+                  for spec in self.specs]
+        return float(np.sum(np.maximum(self.basis.max(axis=1), 0) * bounds))
+
+def matched_peak(matched):
+    """Upper bound of a matched uniform curve or MatchedField."""
+    if isinstance(matched, MatchedField):
+        return matched.peak()
+    return float(np.max(matched))
+
+def apply_matched(matched, tile, shape, row0=0):
+    """Filter a tile with a matched uniform curve (one value per band) or a MatchedField."""
+    if isinstance(matched, MatchedField):
+        return matched.apply(tile, shape, row0)
+    return tile * np.asarray(matched).astype(tile.dtype)
+
+def filter_envi_cube(hdr_path, output_hdr, field, tile_rows=256, policy=None):
+    """
+    Write a field-filtered copy of an ENVI cube tile by tile (the source is memory-mapped).
+    uint16 outputs get a data gain from an upper bound of source x transmission (the source
+    peak comes from a fresh cube_index entry when there is one).
+    """
+    import spectral
+    from precision import (get_policy, check_envi_storage, data_gain, decode, encode_with_gain, storage_gain,
+                           storage_metadata, stream_peak)
+    policy = get_policy(policy)
+    check_envi_storage(policy.storage)
+    image = spectral.open_image(hdr_path)
+    source = image.open_memmap(interleave='bip')
+    gain_offset = data_gain(image.metadata)
+    wavelengths = np.array([float(w) for w in image.metadata['wavelength']])
+    matched = field.match(wavelengths)
+    gain = 1.0
+    if policy.storage != "float32":
+        gain = storage_gain(stream_peak(source, gain_offset, tile_rows, hdr_path) * max(matched.peak(), 1.0), policy.storage)
+    metadata = storage_metadata(image.metadata, source.shape[2], gain)
+    output = spectral.envi.create_image(output_hdr, metadata, dtype=policy.storage, interleave='bip',
+                                        force=True).open_memmap(writable=True)
+    for row in range(0, source.shape[0], tile_rows):
+        tile = decode(source[row:row + tile_rows], gain_offset, policy.compute)
+        output[row:row + len(tile)] = encode_with_gain(matched.apply(tile, source.shape, row), policy.storage, gain)
+    output.flush()
+    return output_hdr
+
+def filter_sidq_cube(mat_path, output_mat, field, wavelengths=None, tile_rows=256, policy=None, dataset='hsi'):
+    """
+    Write a field-filtered copy of a SIDQ HDF5 cube tile by tile, in the policy's storage dtype
+    (scaled outputs carry the gain in the 'data_gain' attribute, as precision.save_hdf5_cube).
+    """
+    import h5py
+    from precision import get_policy, encode_with_gain, storage_gain, stream_peak
+    policy = get_policy(policy)
+    wavelengths = np.linspace(410, 1000, 160) if wavelengths is None else wavelengths
+    matched = field.match(wavelengths)
+    with h5py.File(mat_path, 'r') as source_file, h5py.File(output_mat, 'w') as output_file:
+        source = source_file[dataset]
+        source_gain = source.attrs.get('data_gain')
+        scale = np.float32(1.0 if source_gain is None else source_gain)
+        gain = 1.0
+        if policy.storage != "float32":
+            peak = stream_peak(source, (np.full(source.shape[2], scale), np.zeros(source.shape[2])), tile_rows)
+            gain = storage_gain(peak * max(matched.peak(), 1.0), policy.storage)
+        output = output_file.create_dataset(dataset, shape=source.shape, dtype=policy.storage)
+        for row in range(0, source.shape[0], tile_rows):
+            tile = np.asarray(source[row:row + tile_rows], dtype=policy.compute) * scale.astype(policy.compute)
+            output[row:row + len(tile)] = encode_with_gain(matched.apply(tile, source.shape, row), policy.storage, gain)
+        if gain != 1.0:
+            output.attrs['data_gain'] = gain
+    return output_mat
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply a spatially varying transmission field to cubes.")
+    parser.add_argument("field", help="Field spec (JSON)")
+    parser.add_argument("cubes", nargs="*", help="ENVI headers or SIDQ .mat files")
+    parser.add_argument("--output", default="field_output", help="Folder for the filtered cubes")
+    parser.add_argument("--tile-rows", type=int, default=256)
+    parser.add_argument("--precision", default="default", help="precision.POLICIES name")
+    parser.add_argument("--preview", help="Save the layer weights on a ROWSxCOLS grid as a PNG here")
+    parser.add_argument("--preview-size", default="270x480")
+    args = parser.parse_args()
+
+    field = TransmissionField.load(args.field)
+    if args.preview:
+        import matplotlib.pyplot as plt
+        shape = tuple(int(n) for n in args.preview_size.lower().split("x"))
+        weights = MatchedField(np.ones((len(field.layers), 1)), [spec for _, spec in field.layers]).weights(shape)
+        figure, axes = plt.subplots(1, weights.shape[2], figsize=(4 * weights.shape[2], 3), squeeze=False)
+        for k, (name, spec) in enumerate(field.layers):
+            axes[0, k].imshow(weights[..., k], vmin=0, vmax=1, cmap="gray")
+            axes[0, k].set_title(f"{name} ({spec.get('type', 'constant')})")
+            axes[0, k].axis("off")
+        figure.savefig(args.preview, bbox_inches="tight")
+        print(f"Saved: {args.preview}")
+
+    os.makedirs(args.output, exist_ok=True)
+    for path in args.cubes:
+        output_path = os.path.join(args.output, os.path.basename(path))
+        if path.lower().endswith(".mat"):
+            filter_sidq_cube(path, output_path, field, tile_rows=args.tile_rows, policy=args.precision)
+        else:
+            filter_envi_cube(path, output_path, field, args.tile_rows, args.precision)
+        print(f"Saved: {output_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import numpy as np
+import pywt
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+def allocate_energy_buffers(batch_shape, wavelet='db1', level=4, mode='symmetric'):
+    """
+    Allocate float32 output buffers for wavelet_energy, one (buffer, scratch) pair per level.
+    Pass the result as out= to reuse the same memory for every batch of that shape.
+    """
+    *batch, rows, cols = batch_shape
+    sizes = pywt.wavedecn_shapes((rows, cols), wavelet, mode=mode, level=level)[1:]
+    return [(np.empty(tuple(batch) + size['ad'], dtype=np.float32),
+             np.empty(tuple(batch) + size['ad'], dtype=np.float32)) for size in sizes]
+
+def wavelet_energy(images, wavelet='db1', level=4, mode='symmetric', out=None):
+    """
+    Per-level wavelet contrast sqrt(cH^2 + cV^2 + cD^2) for a batch of images in one decomposition.
+    Args:
+        images: (H x W) image or (N x H x W) batch of images.
+        wavelet: PyWavelets wavelet name.
+        level: Number of decomposition levels.
+        mode: Signal extension mode.
+        out: Buffers from allocate_energy_buffers to write into (allocated when None).
+    Returns:
+        List of float32 energy maps ordered from the coarsest level to the finest,
+        each with the batch dimensions of images.
+    """
+    images = np.asarray(images)
+    if not np.issubdtype(images.dtype, np.floating) or images.dtype == np.float64:
+        images = images.astype(np.float32)
+    coeffs = pywt.wavedec2(images, wavelet, mode=mode, level=level, axes=(-2, -1))
+    if out is None:
+        out = allocate_energy_buffers(images.shape, wavelet, level, mode)
+
+    energies = []
+    for (cH, cV, cD), (energy, scratch) in zip(coeffs[1:], out):
+        np.square(cH, out=energy)
+        np.square(cV, out=scratch)
+        energy += scratch
+        np.square(cD, out=scratch)
+        energy += scratch
+        np.sqrt(energy, out=energy)
+        energies.append(energy)
+    return energies
+
+def level_statistics(energies, percentiles=PERCENTILES):
+    """
+    Summary statistics of every level for every image of a batch.
+    Args:
+        energies: Output of wavelet_energy (coarsest level first).
+        percentiles: Percentiles to report.
+    Returns:
+        Dictionary of (N x levels) arrays: mean, energy (mean squared coefficient magnitude)
+        and one array per percentile (key 'p<q>').
+    """
+    means, powers, quantiles = [], [], []
+    for energy in energies:
+        flat = energy.reshape(energy.shape[:-2] + (-1,))
+        means.append(flat.mean(axis=-1))
+        powers.append(np.mean(np.square(flat, dtype=np.float64), axis=-1))
+        quantiles.append(np.percentile(flat, percentiles, axis=-1))
+    stats = {"mean": np.stack(means, axis=-1), "energy": np.stack(powers, axis=-1)}
+    quantiles = np.stack(quantiles, axis=-1)
+    for i, q in enumerate(percentiles):
+        stats[f"p{q}"] = quantiles[i]
+    return stats
+
+def energy_ratios(filtered_stats, original_stats):
+    """Per-level energy ratio of filtered to original renders (values above one mean more contrast)."""
+    return filtered_stats["energy"] / (original_stats["energy"] + 1e-12)
+
+def tiled_wavelet_energy(image, tile=512, wavelet='db1', level=4, halo=None, batch=8):
+    """
+    Wavelet energy maps of a large image computed tile by tile.
+    Tiles are multiples of 2**level so every level's coefficients line up with tile boundaries.
+    The image is extended symmetrically to whole tiles and each tile is decomposed with
+    'periodization', so level j always has ceil(H / 2**j) x ceil(W / 2**j) coefficients
+    (pywt's 'symmetric' mode gives slightly larger levels for wavelets longer than Haar).
+    Longer wavelets get a halo of extra context around each tile that is cropped from the
+    coefficients afterwards. The result is exact only in these cases:
+        - Haar ('db1') with both sides multiples of 2**level: equals wavelet_energy(image).
+        - Any wavelet: equals wavelet_energy(image, mode='periodization') away from the image
+          border, where the symmetric extension replaces periodization's wrap-around.
+    Otherwise it approximates the untiled maps; coefficients whose support crosses an edge that
+    is not a multiple of 2**level differ (e.g. the last row or column of the coarser levels).
+    Args:
+        image: (H x W) image.
+        tile: Tile size in pixels (multiple of 2**level).
+        halo: Context around each tile in pixels (multiple of 2**level; chosen from the wavelet if None).
+        batch: Number of tiles decomposed together.
+    Returns:
+        List of energy maps from the coarsest level to the finest.
+    """
+    step = 2 ** level
+    if tile % step:
+        raise ValueError(f"Tile size must be a multiple of {step} for {level} levels")
+    if halo is None:
+        dec_len = pywt.Wavelet(wavelet).dec_len
+        halo = 0 if dec_len == 2 else dec_len * step
+    if halo % step:
+        raise ValueError(f"Halo must be a multiple of {step} for {level} levels")
+
+    rows, cols = image.shape
+    padded_rows, padded_cols = -(-rows // tile) * tile, -(-cols // tile) * tile
+    padded = np.pad(np.asarray(image, dtype=np.float32),
+                    ((halo, padded_rows - rows + halo), (halo, padded_cols - cols + halo)), mode='symmetric')
+
+    # Levels are stored coarsest first, matching wavelet_energy
+    scales = [2 ** j for j in range(level, 0, -1)]
+    maps = [np.empty((padded_rows // s, padded_cols // s), dtype=np.float32) for s in scales]
+    origins = [(y, x) for y in range(0, padded_rows, tile) for x in range(0, padded_cols, tile)]
+    size = tile + 2 * halo
+    buffers = None
+    for start in range(0, len(origins), batch):
+        chunk = origins[start:start + batch]
+        stack = np.stack([padded[y:y + size, x:x + size] for y, x in chunk])
+        if buffers is None or buffers[0][0].shape[0] != len(chunk):
+            buffers = allocate_energy_buffers(stack.shape, wavelet, level, mode='periodization')
+        energies = wavelet_energy(stack, wavelet, level, mode='periodization', out=buffers)
+        for energy, level_map, s in zip(energies, maps, scales):
+            crop, n = halo // s, tile // s
+            for k, (y, x) in enumerate(chunk):
+                level_map[y // s:y // s + n, x // s:x // s + n] = energy[k, crop:crop + n, crop:crop + n]
+
+    return [level_map[:-(-rows // s), :-(-cols // s)] for level_map, s in zip(maps, scales)]